@@ -0,0 +1,70 @@
+"""Comparar la puntuación por lotes con la de un elemento cada vez.
+
+Uso: python benchmarks/bench_batch.py [--copies 40] [--repeat 5]
+
+Mide µs por elemento de score_messages_batch frente a analyze_message_content y
+de score_members_batch frente a is_suspicious_user con las mismas entradas que
+bench_detectors. Falla (código 1) si algún lote no es más rápido.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+from bench_detectors import (SEED, long_spam_messages, make_members,  # noqa: E402
+                             short_chat_messages, url_heavy_messages,
+                             zalgo_messages)
+
+
+def per_item_us(function, items, repeat):
+    """Mediana de µs por elemento"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(items)
+        timings.append((time.perf_counter() - start) / len(items) * 1e6)
+    return statistics.median(timings)
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--copies', type=int, default=40,
+                        help='veces que se repite cada conjunto de entradas')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(SEED)
+    messages = (short_chat_messages(rng) + url_heavy_messages(rng) +
+                zalgo_messages(rng) + long_spam_messages(rng)) * args.copies
+    members = make_members(rng) * args.copies
+
+    cases = [
+        ('mensajes', messages, main.score_messages_batch,
+         lambda items: [main.analyze_message_content(item) for item in items]),
+        ('miembros', members, main.score_members_batch,
+         lambda items: [main.is_suspicious_user(item) for item in items]),
+    ]
+
+    slower = []
+    print(f"{'caso':<10} {'elementos':>10} {'lote µs':>9} {'uno a uno µs':>13} {'mejora':>7}")
+    for name, items, batch, single in cases:
+        batch_us = per_item_us(batch, items, args.repeat)
+        single_us = per_item_us(single, items, args.repeat)
+        print(f'{name:<10} {len(items):>10,} {batch_us:>9.1f} {single_us:>13.1f} '
+              f'{single_us / batch_us:>6.1f}x')
+        if batch_us >= single_us:
+            slower.append(name)
+
+    if slower:
+        print(f"\nEl lote no es más rápido en: {', '.join(slower)}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main_cli())
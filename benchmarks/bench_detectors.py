@@ -0,0 +1,265 @@
+"""Microbenchmarks de los detectores con presupuestos de rendimiento.
+
+Uso:
+    python benchmarks/bench_detectors.py            # comparar con los presupuestos
+    python benchmarks/bench_detectors.py --record   # grabar nuevos presupuestos
+
+Cada caso usa entradas sintéticas con semilla fija y se mide como la mediana de
+varias pasadas. El runner falla (código 1) si un caso supera su presupuesto de
+ns por llamada o de bytes asignados en más del margen indicado, más un mínimo
+absoluto de ruido para los casos pequeños. Un caso que supera su presupuesto se
+vuelve a medir y solo falla si la mediana de CONFIRM_RUNS mediciones también lo
+supera. Los presupuestos dependen de la máquina: grábalos en la misma máquina
+donde se van a comprobar.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import string
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+
+BUDGETS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            'detector_budgets.json')
+GUILD_ID = 1
+SEED = 1234
+ACTIVITY_USERS = 10_000
+NOISE_FLOOR_NS = 2_000  # Ruido de medida tolerado en casos de microsegundos
+CONFIRM_RUNS = 3  # Mediciones antes de dar por superado un presupuesto
+NOISE_FLOOR_BYTES = 16_384  # Asignaciones que varían según qué caduque en la caché
+
+# Configuración en memoria: los benchmarks no deben escribir archivos
+main.server_configs[str(GUILD_ID)] = {}
+GUILD = SimpleNamespace(id=GUILD_ID)
+
+
+def make_message(content, mentions=0, reply=False):
+    return SimpleNamespace(content=content,
+                           mentions=[object()] * mentions,
+                           role_mentions=[],
+                           reference=object() if reply else None,
+                           attachments=[],
+                           guild=GUILD)
+
+
+def short_chat_messages(rng):
+    words = ['hola', 'que', 'tal', 'jaja', 'vale', 'nos', 'vemos', 'luego',
+             'gracias', 'bien', 'partida', 'hoy', 'alguien', 'juega']
+    return [
+        make_message(' '.join(rng.choice(words)
+                              for _ in range(rng.randint(3, 12))),
+                     reply=rng.random() < 0.3) for _ in range(200)
+    ]
+
+
+def long_spam_messages(rng):
+    spam = ['FREE NITRO', 'claim your gift', 'discord.gg/abc123', '@everyone',
+            'give away', 'aaaaaaaaaaaaaa', 'bitcoin wallet']
+    return [
+        make_message(' '.join(rng.choice(spam) for _ in range(200)),
+                     mentions=rng.randint(0, 10)) for _ in range(50)
+    ]
+
+
+def url_heavy_messages(rng):
+    domains = ['youtube.com', 'github.com', 'bit.ly', 'grabify.link',
+               'example.org', 'tinyurl.com', 'steamcommunity.ru']
+    return [
+        make_message(' '.join(
+            f"https://{rng.choice(domains)}/{''.join(rng.choices(string.ascii_letters, k=8))}"
+            for _ in range(rng.randint(2, 8)))) for _ in range(100)
+    ]
+
+
+def zalgo_messages(rng):
+    marks = [chr(code) for code in range(0x0300, 0x036F)]
+    base = 'hola a todos que tal estais'
+    return [
+        make_message(''.join(char + ''.join(rng.choices(marks, k=rng.randint(1, 6)))
+                             for char in base)) for _ in range(100)
+    ]
+
+
+def populate_activity(rng, now):
+    """Tabla de actividad con 10k usuarios y su historial reciente"""
+    main.user_activity.clear()
+    main.guild_risk_boards.clear()
+    for user_id in range(1, ACTIVITY_USERS + 1):
+        activity = main.user_activity[user_id]
+        timestamps = sorted(now - timedelta(seconds=rng.randint(0, 3600))
+                            for _ in range(rng.randint(0, 12)))
+        for timestamp in timestamps:
+            main.record_message_activity(user_id, {
+                'content': rng.choice(['hola', 'free nitro', 'jaja que bueno',
+                                       'discord.gg/x']),
+                'timestamp': timestamp,
+                'channel': 1,
+                'guild': GUILD_ID,
+                'suspicious': rng.random() < 0.05
+            })
+        if rng.random() < 0.2:
+            activity['joins'].append(now - timedelta(seconds=rng.randint(0, 900)))
+        activity['account_age'] = now - timedelta(days=rng.randint(0, 400))
+    return list(range(1, ACTIVITY_USERS + 1))
+
+
+def make_members(rng, bots=False):
+    now = datetime.now(timezone.utc)
+    names = ['raidking', 'juan', 'maria_22', 'xX_raider_013', '1234567890',
+             'aaaaaaa', 'SpamBot', 'helper', 'nukebot', 'music']
+    return [
+        SimpleNamespace(id=rng.randrange(1 << 50, 1 << 60),
+                        name=rng.choice(names),
+                        display_name=rng.choice(names),
+                        avatar=None if rng.random() < 0.5 else object(),
+                        created_at=now - timedelta(hours=rng.randint(0, 2000)),
+                        bot=bots,
+                        public_flags=SimpleNamespace(
+                            verified_bot=rng.random() < 0.3))
+        for _ in range(200)
+    ]
+
+
+def build_cases():
+    """Casos de benchmark: nombre -> (función de una llamada, entradas)"""
+    rng = random.Random(SEED)
+    now = datetime.utcnow()
+    user_ids = populate_activity(rng, now)
+
+    cases = {}
+    for name, messages in [('analyze_short_chat', short_chat_messages(rng)),
+                           ('analyze_long_spam', long_spam_messages(rng)),
+                           ('analyze_url_heavy', url_heavy_messages(rng)),
+                           ('analyze_zalgo', zalgo_messages(rng))]:
+        cases[name] = (main.analyze_message_content, messages)
+
+    # Etapa 0 del pipeline sobre el mismo chat que analyze_short_chat
+    cases['prefilter_short_chat'] = (main.is_low_risk_message,
+                                     cases['analyze_short_chat'][1])
+
+    cases['compute_risk_score_10k'] = (
+        lambda user_id: main.compute_risk_score(user_id, GUILD_ID, now),
+        user_ids[:2000])
+    # Con la caché de riesgo llena, como en monitor_activity
+    cases['detect_raid_pattern_10k'] = (
+        lambda _: main.detect_raid_pattern(GUILD_ID), [None])
+    # Tras vaciar la caché (cambios de configuración)
+    cases['detect_raid_pattern_10k_cold'] = (
+        lambda _: (main.risk_score_cache.clear(),
+                   main.detect_raid_pattern(GUILD_ID)), [None])
+    cases['is_suspicious_user'] = (main.is_suspicious_user, make_members(rng))
+    cases['is_suspicious_bot'] = (main.is_suspicious_bot,
+                                  make_members(rng, bots=True))
+    return cases
+
+
+def measure(function, inputs, min_time=1.0, repeat=7):
+    """Mediana del tiempo medio por llamada (ns) y pico de memoria de una pasada"""
+    calls = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < min_time / repeat or calls == 0:
+        for item in inputs:
+            function(item)
+        calls += len(inputs)
+    rounds = max(1, calls // len(inputs))
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter_ns()
+        for _ in range(rounds):
+            for item in inputs:
+                function(item)
+        timings.append(
+            (time.perf_counter_ns() - start) / (rounds * len(inputs)))
+
+    tracemalloc.start()
+    peak = 0
+    for item in inputs:
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        function(item)
+        peak = max(peak, tracemalloc.get_traced_memory()[1] - baseline)
+    tracemalloc.stop()
+    return statistics.median(timings), peak
+
+
+def time_limit(budget, margin):
+    """Tiempo máximo permitido: presupuesto grabado con margen y ruido"""
+    if budget:
+        return budget['ns_per_call'] * (1 + margin) + NOISE_FLOOR_NS
+    return None
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--record', action='store_true',
+                        help='grabar los resultados como nuevos presupuestos')
+    parser.add_argument('--margin', type=float, default=0.5,
+                        help='exceso permitido sobre el presupuesto (0.5 = 50%%)')
+    parser.add_argument('--only', help='ejecutar solo los casos que contengan este texto')
+    args = parser.parse_args()
+
+    budgets = {}
+    if os.path.exists(BUDGETS_FILE):
+        with open(BUDGETS_FILE) as f:
+            budgets = json.load(f)
+
+    results = {}
+    failures = []
+    print(f"{'caso':<29} {'ns/llamada':>13} {'límite':>13} {'bytes':>10} {'presupuesto':>12}")
+    for name, (function, inputs) in build_cases().items():
+        if args.only and args.only not in name:
+            continue
+        ns_per_call, peak_bytes = measure(function, inputs)
+        budget = budgets.get(name)
+        limit_ns = time_limit(budget, args.margin)
+
+        # Confirmar los excesos: una pasada lenta suele ser ruido de la máquina
+        if not args.record and limit_ns is not None and ns_per_call > limit_ns:
+            timings = [ns_per_call]
+            while len(timings) < CONFIRM_RUNS:
+                timings.append(measure(function, inputs)[0])
+            ns_per_call = statistics.median(timings)
+        results[name] = {'ns_per_call': round(ns_per_call), 'peak_bytes': peak_bytes}
+        status = ''
+        if not args.record:
+            if limit_ns is not None and ns_per_call > limit_ns:
+                failures.append(f'{name}: {ns_per_call:.0f} ns > {limit_ns:.0f} ns')
+                status = ' ❌ tiempo'
+            if budget and peak_bytes > (budget['peak_bytes'] *
+                                        (1 + args.margin) + NOISE_FLOOR_BYTES):
+                failures.append(f'{name}: {peak_bytes} B > {budget["peak_bytes"]} B')
+                status += ' ❌ memoria'
+        budget_ns = f"{limit_ns:,.0f}" if limit_ns is not None else '-'
+        budget_bytes = f"{budget['peak_bytes']:,}" if budget else '-'
+        print(f"{name:<29} {ns_per_call:>13,.0f} {budget_ns:>13} "
+              f"{peak_bytes:>10,} {budget_bytes:>12}{status}")
+
+    if args.record:
+        budgets.update(results)
+        with open(BUDGETS_FILE, 'w') as f:
+            json.dump(budgets, f, indent=2, sort_keys=True)
+        print(f'Presupuestos grabados en {BUDGETS_FILE}')
+        return 0
+
+    if failures:
+        print('\nPresupuestos superados:')
+        for failure in failures:
+            print(f'  {failure}')
+        return 1
+
+    print('\nTodos los casos dentro del presupuesto')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main_cli())
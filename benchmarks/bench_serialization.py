@@ -0,0 +1,67 @@
+"""Comparar JSON y el formato binario con una lista de bans global grande.
+
+Uso: python benchmarks/bench_serialization.py [--bans 1000000]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import (JSON_SERIALIZER, STORED_BINARY_SERIALIZER, load_data,  # noqa: E402
+                  save_data)
+
+
+def make_bans(count, seed=42):
+    """Snowflakes realistas: marca de tiempo de 2016-2025 desplazada 22 bits"""
+    rng = random.Random(seed)
+    return {(rng.randrange(1 << 40, 1 << 41) << 22) | rng.randrange(1 << 22)
+            for _ in range(count)}
+
+
+def measure(serializer, bans, directory, repeat):
+    path = os.path.join(directory, f'bans.{serializer.name}')
+    save_times, load_times = [], []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        size = save_data(path, bans, serializer)
+        save_times.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        loaded = set(load_data(path, serializer))
+        load_times.append(time.perf_counter() - start)
+
+    assert loaded == bans, 'Los bans cargados no coinciden'
+    return min(save_times), min(load_times), size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--bans', type=int, default=1_000_000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    bans = make_bans(args.bans)
+    print(f'Bans globales: {len(bans):,}')
+    print(f"{'formato':<8} {'guardar (s)':>12} {'cargar (s)':>11} {'tamaño (MB)':>12}")
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for serializer in (JSON_SERIALIZER, STORED_BINARY_SERIALIZER):
+            save_time, load_time, size = measure(serializer, bans, directory,
+                                                 args.repeat)
+            results[serializer.name] = (save_time, load_time, size)
+            print(f'{serializer.name:<8} {save_time:>12.3f} {load_time:>11.3f} '
+                  f'{size / 1e6:>12.1f}')
+
+    json_result, binary_result = results['json'], results['binary']
+    print(f'Binario vs JSON: guardar x{json_result[0] / binary_result[0]:.1f}, '
+          f'cargar x{json_result[1] / binary_result[1]:.1f}, '
+          f'tamaño x{json_result[2] / binary_result[2]:.1f} menor')
+
+
+if __name__ == '__main__':
+    main()
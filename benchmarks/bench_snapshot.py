@@ -0,0 +1,101 @@
+"""Medir la instantánea de actividad: bloqueo del bucle al guardar y tiempo de restauración.
+
+Uso: python benchmarks/bench_snapshot.py [--users 120000] [--messages 419000]
+"""
+import argparse
+import asyncio
+import gc
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+
+
+def populate(users, messages, seed=42):
+    """Actividad sintética con mensajes ordenados por usuario"""
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+    per_user = [0] * users
+    for _ in range(messages):
+        per_user[rng.randrange(users)] += 1
+
+    main.user_activity.clear()
+    words = ['hola que tal', 'free nitro aquí', 'jaja', 'discord.gg/x',
+             'buenas noches a todos']
+    for index, count in enumerate(per_user):
+        activity = main.user_activity[(1 << 56) + index]
+        for timestamp in sorted(now - timedelta(seconds=rng.randint(0, 80000))
+                                for _ in range(min(count, 50))):
+            activity['messages'].append({
+                'content': rng.choice(words),
+                'timestamp': timestamp,
+                'channel': rng.randrange(1, 50),
+                'guild': rng.randrange(1, 20),
+                'suspicious': rng.random() < 0.05
+            })
+        if rng.random() < 0.3:
+            activity['joins'].append(now - timedelta(seconds=rng.randint(0, 80000)))
+        activity['last_activity'] = now
+        activity['risk_score'] = rng.randint(0, 100)
+    return sum(len(activity['messages']) for activity in main.user_activity.values())
+
+
+async def measure_save(path):
+    """Tiempo total de guardado y mayor bloqueo observado del bucle"""
+    loop = asyncio.get_running_loop()
+    worst = 0.0
+
+    async def probe():
+        nonlocal worst
+        while True:
+            start = loop.time()
+            await asyncio.sleep(0)
+            worst = max(worst, loop.time() - start)
+
+    task = asyncio.create_task(probe())
+    start = time.perf_counter()
+    await main.save_activity_snapshot(path)
+    elapsed = time.perf_counter() - start
+    task.cancel()
+    return elapsed, worst
+
+
+def measure_restore(path):
+    main.user_activity.clear()
+    main.guild_risk_boards.clear()
+    main.activity_expiry.__init__()
+    gc.collect()
+
+    start = time.perf_counter()
+    snapshot = main.read_activity_snapshot(path)
+    read_time = time.perf_counter() - start
+    restored = main.apply_activity_snapshot(snapshot)
+    return read_time, time.perf_counter() - start, restored
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=120_000)
+    parser.add_argument('--messages', type=int, default=419_000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f'Mensajes: {populate(args.users, args.messages):,} de {args.users:,} usuarios')
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'activity_snapshot.bin')
+        save_time, worst_block = asyncio.run(measure_save(path))
+        print(f'Guardar: {save_time:.2f} s en total, bloqueo máximo del bucle {worst_block * 1000:.0f} ms')
+
+        results = [measure_restore(path) for _ in range(args.repeat)]
+        read_time, total, restored = min(results, key=lambda result: result[1])
+        print(f'Restaurar: {total:.2f} s ({read_time:.2f} s de lectura), {restored:,} usuarios')
+
+
+if __name__ == '__main__':
+    main_cli()
@@ -1,14 +1,34 @@
 
 import discord
 from discord.ext import commands, tasks
+import aiohttp
 import asyncio
+from abc import ABC, abstractmethod
+import bisect
+import gc
 import json
+import math
 import os
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 import re
+import sys
 import hashlib
-from collections import defaultdict, deque
+import heapq
+import io
+import itertools
+import time
+import zlib
+from collections import Counter, OrderedDict, defaultdict, deque
 import statistics
+from dataclasses import dataclass, field
+import numpy as np
+import regex
+from re import _parser as re_parser  # Árbol de las regex para validar reglas
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow es opcional: sin él solo se usa la huella exacta
+    Image = None
 
 # Configuración del bot
 intents = discord.Intents.default()
@@ -17,7 +37,12 @@ intents.members = True
 intents.guilds = True
 intents.moderation = True
 
-bot = commands.Bot(command_prefix='!sec ', intents=intents)
+# Trazas HTTP para seguir los límites de tasa de cada ruta REST
+rest_trace = aiohttp.TraceConfig()
+
+bot = commands.Bot(command_prefix='!sec ',
+                   intents=intents,
+                   http_trace=rest_trace)
 
 # Configuración de seguridad por servidor
 server_configs = {}
@@ -26,16 +51,26 @@ server_configs = {}
 global_bans = set()
 
 # Sistemas de monitoreo avanzado
-user_activity = defaultdict(
-    lambda: {
-        'messages': deque(maxlen=50),
-        'joins': deque(maxlen=10),
-        'risk_score': 0,
-        'warnings': 0,
-        'last_activity': None,
-        'message_patterns': defaultdict(int),
-        'suspicious_actions': []
-    })
+def new_user_activity(messages=(),
+                      joins=(),
+                      suspicious_actions=(),
+                      risk_score=0,
+                      warnings=0,
+                      last_activity=None,
+                      message_patterns=()):
+    """Estado de actividad de un usuario"""
+    return {
+        'messages': deque(messages, maxlen=50),
+        'joins': deque(joins, maxlen=10),
+        'risk_score': risk_score,
+        'warnings': warnings,
+        'last_activity': last_activity,
+        'message_patterns': defaultdict(int, message_patterns),
+        'suspicious_actions': list(suspicious_actions)
+    }
+
+
+user_activity = defaultdict(new_user_activity)
 
 # Patrones sospechosos mejorados
 SUSPICIOUS_PATTERNS = {
@@ -68,29 +103,224 @@ MALICIOUS_DOMAINS = [
 ]
 
 
+# Capa de serialización: JSON legible para configuración, binario para datos grandes
+BINARY_MAGIC = b'EXBIN2'
+BINARY_COMPRESSED = b'Z'
+BINARY_STORED = b'N'
+LEGACY_BINARY_INT_ARRAY = b'EXBIN1I'  # Bans de la versión anterior (enteros crudos)
+BINARY_LAYOUT = '__layout__'  # Estructura del documento, en JSON dentro del .npz
+TEXT_SEPARATOR = '\x00'  # Separa los textos del blob si ninguno lo contiene
+CONFIG_FILE = 'security_config.json'
+GLOBAL_BANS_FILE = 'global_bans.bin'
+LEGACY_GLOBAL_BANS_FILE = 'global_bans.json'
+BAD_AVATARS_FILE = 'bad_avatars.json'
+BAD_ATTACHMENTS_FILE = 'bad_attachments.json'
+
+
+class Serializer(ABC):
+    """Interfaz común de los formatos de persistencia"""
+    name = None
+
+    @abstractmethod
+    def dumps(self, data):
+        """Convertir los datos a bytes"""
+
+    @abstractmethod
+    def loads(self, raw):
+        """Reconstruir los datos desde bytes"""
+
+
+class JsonSerializer(Serializer):
+    """JSON legible, para la configuración y archivos pequeños"""
+    name = 'json'
+
+    def __init__(self, indent=2):
+        self.indent = indent
+
+    def dumps(self, data):
+        return json.dumps(data, indent=self.indent, default=list).encode()
+
+    def loads(self, raw):
+        return json.loads(raw)
+
+
+class BinarySerializer(Serializer):
+    """Archivo .npz comprimido sin pickle: arrays tal cual, textos como blob utf-8"""
+    name = 'binary'
+
+    def __init__(self, compress_level=1):
+        self.compress_level = compress_level
+
+    def dumps(self, data):
+        arrays = {}
+        layout = self.encode(data, arrays)
+        arrays[BINARY_LAYOUT] = np.frombuffer(json.dumps(layout).encode(),
+                                              dtype=np.uint8)
+        buffer = io.BytesIO()
+        np.savez(buffer, **arrays)
+        if not self.compress_level:
+            return BINARY_MAGIC + BINARY_STORED + buffer.getvalue()
+        return BINARY_MAGIC + BINARY_COMPRESSED + zlib.compress(
+            buffer.getvalue(), self.compress_level)
+
+    def loads(self, raw):
+        """Las colecciones de enteros se devuelven como listas de int"""
+        if raw.startswith(LEGACY_BINARY_INT_ARRAY):
+            values = np.frombuffer(raw[len(LEGACY_BINARY_INT_ARRAY):],
+                                   dtype='<i8')
+            return values.tolist()
+        header = len(BINARY_MAGIC) + 1
+        if raw[:header] == BINARY_MAGIC + BINARY_COMPRESSED:
+            body = zlib.decompress(raw[header:])
+        elif raw[:header] == BINARY_MAGIC + BINARY_STORED:
+            body = raw[header:]
+        else:
+            raise ValueError('Formato binario no reconocido')
+
+        buffer = io.BytesIO(body)
+        with np.load(buffer, allow_pickle=False) as archive:
+            arrays = {name: archive[name] for name in archive.files}
+        layout = json.loads(arrays.pop(BINARY_LAYOUT).tobytes())
+        return self.decode(layout, arrays)
+
+    def add_array(self, arrays, values):
+        name = f'a{len(arrays)}'
+        arrays[name] = values
+        return name
+
+    def encode(self, value, arrays):
+        """Estructura JSON del valor; los datos voluminosos van a arrays aparte"""
+        if isinstance(value, np.ndarray):
+            if value.dtype.hasobject:
+                raise TypeError('Los arrays de objetos no se pueden guardar')
+            return {'$array': self.add_array(arrays, value)}
+        if isinstance(value, datetime):
+            return {'$datetime': value.isoformat()}
+        if isinstance(value, dict):
+            return {
+                '$dict': [[key, self.encode(item, arrays)]
+                          for key, item in value.items()]
+            }
+        if isinstance(value, (set, frozenset)):
+            return {
+                '$ints': self.add_array(arrays, np.fromiter(value,
+                                                            dtype=np.int64,
+                                                            count=len(value)))
+            }
+        if (isinstance(value, (list, tuple)) and value
+                and all(isinstance(item, str) for item in value)):
+            # Un solo blob utf-8: separado si se puede, si no con los finales
+            # de cada texto en caracteres
+            text = ''.join(value)
+            if TEXT_SEPARATOR not in text:
+                blob = TEXT_SEPARATOR.join(value).encode('utf-8', 'surrogatepass')
+                return {
+                    '$text': [
+                        self.add_array(arrays,
+                                       np.frombuffer(blob, dtype=np.uint8))
+                    ]
+                }
+            ends = np.fromiter(itertools.accumulate(map(len, value)),
+                               dtype=np.int64,
+                               count=len(value))
+            blob = text.encode('utf-8', 'surrogatepass')
+            return {
+                '$text': [
+                    self.add_array(arrays, np.frombuffer(blob,
+                                                         dtype=np.uint8)),
+                    self.add_array(arrays, ends)
+                ]
+            }
+        return {'$json': value}
+
+    def decode(self, layout, arrays):
+        if '$array' in layout:
+            return arrays[layout['$array']]
+        if '$dict' in layout:
+            return {
+                key: self.decode(item, arrays)
+                for key, item in layout['$dict']
+            }
+        if '$text' in layout:
+            columns = [arrays[name] for name in layout['$text']]
+            text = columns[0].tobytes().decode('utf-8', 'surrogatepass')
+            if len(columns) == 1:
+                return text.split(TEXT_SEPARATOR)
+            ends = columns[1].tolist()
+            return [text[start:end] for start, end in zip([0] + ends, ends)]
+        if '$ints' in layout:
+            return arrays[layout['$ints']].tolist()
+        if '$datetime' in layout:
+            return datetime.fromisoformat(layout['$datetime'])
+        return layout['$json']
+
+
+JSON_SERIALIZER = JsonSerializer()
+BINARY_SERIALIZER = BinarySerializer()
+# Los snowflakes apenas se comprimen: guardarlos sin zlib es el doble de rápido
+STORED_BINARY_SERIALIZER = BinarySerializer(compress_level=0)
+
+
+def save_data(path, data, serializer=JSON_SERIALIZER):
+    """Serializar y reemplazar el archivo de forma atómica"""
+    raw = serializer.dumps(data)
+    temp_path = f'{path}.tmp'
+    with open(temp_path, 'wb') as f:
+        f.write(raw)
+    os.replace(temp_path, path)
+    return len(raw)
+
+
+def load_data(path, serializer=JSON_SERIALIZER):
+    """Cargar un archivo en el formato que indique quien lo lee, nunca adivinado"""
+    with open(path, 'rb') as f:
+        raw = f.read()
+    return serializer.loads(raw)
+
+
+def load_global_bans():
+    """Cargar los bans globales del archivo binario o, si no existe, del JSON antiguo"""
+    for path, serializer in ((GLOBAL_BANS_FILE, STORED_BINARY_SERIALIZER),
+                             (LEGACY_GLOBAL_BANS_FILE, JSON_SERIALIZER)):
+        try:
+            return set(load_data(path, serializer))
+        except FileNotFoundError:
+            continue
+    return set()
+
+
 def load_config():
     """Cargar configuración desde archivo"""
     global server_configs, global_bans
     try:
-        with open('security_config.json', 'r') as f:
-            server_configs = json.load(f)
+        server_configs = load_data(CONFIG_FILE)
     except FileNotFoundError:
         server_configs = {}
 
+    global_bans = load_global_bans()
+
     try:
-        with open('global_bans.json', 'r') as f:
-            global_bans = set(json.load(f))
+        bad_avatars.load(load_data(BAD_AVATARS_FILE))
     except FileNotFoundError:
-        global_bans = set()
+        bad_avatars.load({})
+
+    try:
+        attachment_index.load(load_data(BAD_ATTACHMENTS_FILE))
+    except FileNotFoundError:
+        pass
+
+    compiled_configs.clear()
+    guild_rule_sets.clear()
+    risk_score_cache.clear()
 
 
 def save_config():
     """Guardar configuración a archivo"""
-    with open('security_config.json', 'w') as f:
-        json.dump(server_configs, f, indent=2)
-
-    with open('global_bans.json', 'w') as f:
-        json.dump(list(global_bans), f, indent=2)
+    save_data(CONFIG_FILE, server_configs, JSON_SERIALIZER)
+    save_data(GLOBAL_BANS_FILE, global_bans, STORED_BINARY_SERIALIZER)
+    save_data(BAD_AVATARS_FILE, bad_avatars.to_data(), JSON_SERIALIZER)
+    save_data(BAD_ATTACHMENTS_FILE, attachment_index.to_data(),
+              JSON_SERIALIZER)
 
 
 def get_server_config(guild_id):
@@ -110,12 +340,103 @@ def get_server_config(guild_id):
             'quarantine_role': None,
             'lockdown_mode': False,
             'whitelist_channels': [],
-            'trusted_users': []
+            'trusted_users': [],
+            'event_concurrency': 4,
+            'custom_phrases': [],
+            'allowed_domains': [],
+            'custom_regexes': [],
+            'rules_version': 0
         }
         save_config()
     return server_configs[guild_id]
 
 
+@dataclass(frozen=True)
+class GuildConfig:
+    """Configuración compilada e inmutable de un servidor"""
+    guild_id: int
+    auto_ban: bool
+    alert_channel: int | None
+    admin_role: int | None
+    quarantine_role: int | None
+    max_messages_per_minute: int
+    raid_detection: bool
+    link_filter: bool
+    mention_limit: int
+    risk_threshold: int
+    advanced_detection: bool
+    lockdown_mode: bool
+    whitelist_channels: frozenset
+    trusted_users: frozenset
+    event_concurrency: int
+    # Reglas personalizadas (se recompilan solo al cambiar rules_version)
+    custom_phrases: tuple
+    allowed_domains: frozenset
+    custom_regexes: tuple
+    rules_version: int
+    # Umbrales precalculados
+    spam_5min_threshold: int
+    spam_15min_threshold: int
+    mass_mention_threshold: int
+
+
+# Configuraciones compiladas por ID de servidor (int)
+compiled_configs = {}
+
+
+def compile_server_config(guild_id):
+    """Compilar la configuración de un servidor en un objeto inmutable"""
+    config = get_server_config(guild_id)
+    max_messages = config.get('max_messages_per_minute', 10)
+    mention_limit = config.get('mention_limit', 3)
+
+    return GuildConfig(
+        guild_id=int(guild_id),
+        auto_ban=config.get('auto_ban', True),
+        alert_channel=config.get('alert_channel'),
+        admin_role=config.get('admin_role'),
+        quarantine_role=config.get('quarantine_role'),
+        max_messages_per_minute=max_messages,
+        raid_detection=config.get('raid_detection', True),
+        link_filter=config.get('link_filter', True),
+        mention_limit=mention_limit,
+        risk_threshold=config.get('risk_threshold', 75),
+        advanced_detection=config.get('advanced_detection', True),
+        lockdown_mode=config.get('lockdown_mode', False),
+        whitelist_channels=frozenset(
+            int(channel_id)
+            for channel_id in config.get('whitelist_channels', [])),
+        trusted_users=frozenset(
+            int(user_id) for user_id in config.get('trusted_users', [])),
+        event_concurrency=config.get('event_concurrency', 4),
+        custom_phrases=tuple(config.get('custom_phrases', [])),
+        allowed_domains=frozenset(config.get('allowed_domains', [])),
+        custom_regexes=tuple(config.get('custom_regexes', [])),
+        rules_version=config.get('rules_version', 0),
+        spam_5min_threshold=max_messages * 2,
+        spam_15min_threshold=max_messages * 3,
+        mass_mention_threshold=mention_limit * 2)
+
+
+def get_compiled_config(guild_id):
+    """Obtener la configuración compilada del servidor (se compila una sola vez)"""
+    config = compiled_configs.get(guild_id)
+    if config is None:
+        config = compiled_configs[guild_id] = compile_server_config(guild_id)
+    return config
+
+
+def update_server_config(guild_id, **changes):
+    """Aplicar cambios a la configuración del servidor, guardarla y recompilarla"""
+    config = get_server_config(guild_id)
+    config.update(changes)
+    save_config()
+
+    compiled_configs[int(guild_id)] = compile_server_config(guild_id)
+    risk_score_cache.clear()
+    return config
+
+
 def has_admin_permissions(user):
     """Verificar si el usuario tiene permisos de administrador"""
     return user.guild_permissions.administrator
@@ -126,13 +447,12 @@ async def is_admin(ctx):
     return has_admin_permissions(ctx.author)
 
 
-def calculate_risk_score(user_id, guild_id):
+def compute_risk_score(user_id, guild_id, current_time):
     """Calcular puntuación de riesgo basada en actividad del usuario con análisis mejorado"""
     activity = user_activity[user_id]
-    config = get_server_config(guild_id)
+    config = get_compiled_config(guild_id)
 
     risk_score = 0
-    current_time = datetime.utcnow()
 
     # Análisis de frecuencia de mensajes mejorado
     if len(activity['messages']) > 5:
@@ -153,12 +473,11 @@ def calculate_risk_score(user_id, guild_id):
         # Detección de spam más inteligente
         if len(recent_1min) > 8:  # Más de 8 mensajes en 1 minuto
             risk_score += 30
-        elif len(recent_5min) > config.get(
-                'max_messages_per_minute',
-                10) * 2:  # Doble del límite en 5 min
+        elif len(recent_5min
+                 ) > config.spam_5min_threshold:  # Doble del límite en 5 min
             risk_score += 20
-        elif len(recent_15min) > config.get('max_messages_per_minute',
-                                            10) * 3:  # Triple en 15 min
+        elif len(recent_15min
+                 ) > config.spam_15min_threshold:  # Triple en 15 min
             risk_score += 10
 
     # Análisis de patrones de mensajes mejorado
@@ -239,7 +558,1067 @@ def calculate_risk_score(user_id, guild_id):
     return min(risk_score, 100)
 
 
-def analyze_message_content(message):
+# Ventanas temporales usadas por compute_risk_score
+RISK_MESSAGE_WINDOWS = (timedelta(minutes=1), timedelta(minutes=5),
+                        timedelta(minutes=15))
+RISK_SUSPICIOUS_WINDOW = timedelta(minutes=10)
+RISK_ACTION_WINDOW = timedelta(minutes=30)
+RISK_ACCOUNT_AGE_LIMITS = (timedelta(hours=6), timedelta(days=1),
+                           timedelta(days=7), timedelta(days=31))
+RISK_CACHE_MAX_USERS = 20000  # Usuarios en caché antes de descartar el menos usado
+RISK_CACHE_TTL = timedelta(minutes=15)  # Vida máxima de cualquier puntuación
+
+
+def risk_score_expiry(user_id, current_time):
+    """Momento en que algún evento del usuario cruza el límite de una ventana temporal"""
+    activity = user_activity[user_id]
+    boundaries = []
+
+    for msg in activity['messages']:
+        boundaries.extend(msg['timestamp'] + window
+                          for window in RISK_MESSAGE_WINDOWS)
+        if msg.get('suspicious', False):
+            boundaries.append(msg['timestamp'] + RISK_SUSPICIOUS_WINDOW)
+
+    boundaries.extend(action['timestamp'] + RISK_ACTION_WINDOW
+                      for action in activity['suspicious_actions'])
+
+    if activity.get('account_age'):
+        boundaries.extend(activity['account_age'] + limit
+                          for limit in RISK_ACCOUNT_AGE_LIMITS)
+
+    return min((b for b in boundaries if b > current_time), default=None)
+
+
+class RiskScoreCache:
+    """Caché LRU acotada de puntuaciones de riesgo por (servidor, usuario)"""
+
+    def __init__(self, max_users=RISK_CACHE_MAX_USERS, ttl=RISK_CACHE_TTL):
+        self.max_users = max_users
+        self.ttl = ttl
+        self.entries = OrderedDict()  # user_id -> {guild_id: (puntuación, expiración)}
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.evictions = 0
+
+    def get(self, user_id, guild_id):
+        """Obtener la puntuación, recalculándola solo si es necesario"""
+        current_time = datetime.utcnow()
+        user_entries = self.entries.get(user_id)
+
+        if user_entries and guild_id in user_entries:
+            risk_score, expires_at = user_entries[guild_id]
+            if current_time < expires_at:
+                self.hits += 1
+                self.entries.move_to_end(user_id)
+                return risk_score
+            self.expirations += 1
+
+        self.misses += 1
+        risk_score = compute_risk_score(user_id, guild_id, current_time)
+        # Toda entrada caduca: como tarde, al cumplirse el TTL
+        expires_at = current_time + self.ttl
+        boundary = risk_score_expiry(user_id, current_time)
+        if boundary is not None and boundary < expires_at:
+            expires_at = boundary
+        self.entries.setdefault(user_id, {})[guild_id] = (risk_score,
+                                                          expires_at)
+        self.entries.move_to_end(user_id)
+        if len(self.entries) > self.max_users:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+        return risk_score
+
+    def invalidate_user(self, user_id):
+        """Descartar las puntuaciones de un usuario tras un nuevo evento"""
+        if self.entries.pop(user_id, None) is not None:
+            self.invalidations += 1
+
+    def clear(self):
+        """Descartar todas las puntuaciones (cambios de configuración o limpieza)"""
+        self.invalidations += len(self.entries)
+        self.entries.clear()
+
+    def stats(self):
+        """Métricas de uso de la caché"""
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'expirations': self.expirations,
+            'invalidations': self.invalidations,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'cached_users': len(self.entries)
+        }
+
+
+risk_score_cache = RiskScoreCache()
+
+
+def calculate_risk_score(user_id, guild_id):
+    """Obtener puntuación de riesgo a través de la caché"""
+    return risk_score_cache.get(user_id, guild_id)
+
+
+# Clasificación incremental de riesgo por servidor
+HIGH_RISK_SCORE = 50
+RISK_BOARD_RETENTION = timedelta(hours=24)
+
+
+class GuildRiskBoard:
+    """Top-K de riesgo y totales de un servidor, actualizados con cada evento"""
+
+    def __init__(self):
+        self.scores = {}
+        self.last_seen = {}
+        self.heap = []
+        self.high_risk_users = 0
+        self.suspicious_messages = 0
+
+    def touch(self, user_id, when=None):
+        self.last_seen[user_id] = when or datetime.utcnow()
+
+    def update_score(self, user_id, score):
+        previous = self.scores.get(user_id, 0)
+        self.scores[user_id] = score
+        self.touch(user_id)
+        self.high_risk_users += (score > HIGH_RISK_SCORE) - (previous >
+                                                            HIGH_RISK_SCORE)
+        if score > HIGH_RISK_SCORE:
+            heapq.heappush(self.heap, (-score, user_id))
+            self.compact()
+
+    def load_entries(self, user_ids, scores, last_seen):
+        """Cargar muchos usuarios de una vez y reconstruir el montículo"""
+        self.scores.update(zip(user_ids, scores))
+        self.last_seen.update(zip(user_ids, last_seen))
+        self.heap = [(-score, user_id)
+                     for user_id, score in self.scores.items()
+                     if score > HIGH_RISK_SCORE]
+        heapq.heapify(self.heap)
+        self.high_risk_users = len(self.heap)
+
+    def forget(self, user_id):
+        self.last_seen.pop(user_id, None)
+        if self.scores.pop(user_id, 0) > HIGH_RISK_SCORE:
+            self.high_risk_users -= 1
+
+    def compact(self):
+        # Las entradas obsoletas se descartan de forma perezosa; si se acumulan, reconstruir
+        if len(self.heap) > 2 * self.high_risk_users + 64:
+            self.heap = [(-score, user_id)
+                         for user_id, score in self.scores.items()
+                         if score > HIGH_RISK_SCORE]
+            heapq.heapify(self.heap)
+
+    def top(self, k=10):
+        """Los k usuarios con mayor riesgo por encima del umbral"""
+        result = []
+        seen = set()
+        while self.heap and len(result) < k:
+            negative_score, user_id = heapq.heappop(self.heap)
+            if user_id in seen or self.scores.get(user_id) != -negative_score:
+                continue  # Entrada obsoleta o duplicada
+            seen.add(user_id)
+            result.append((user_id, -negative_score))
+
+        for user_id, score in result:
+            heapq.heappush(self.heap, (-score, user_id))
+        return result
+
+    def expire(self, cutoff):
+        for user_id, last_seen in list(self.last_seen.items()):
+            if last_seen < cutoff:
+                self.forget(user_id)
+        self.compact()
+
+    def stats(self):
+        return {
+            'monitored_users': len(self.last_seen),
+            'high_risk_users': self.high_risk_users,
+            'suspicious_messages': self.suspicious_messages
+        }
+
+
+guild_risk_boards = defaultdict(GuildRiskBoard)
+
+
+def set_risk_score(user_id, guild_id, risk_score):
+    """Guardar la puntuación de riesgo y reflejarla en la clasificación del servidor"""
+    user_activity[user_id]['risk_score'] = risk_score
+    guild_risk_boards[guild_id].update_score(user_id, risk_score)
+
+
+def release_message_record(record):
+    """Descontar un mensaje que sale del historial"""
+    if record.get('suspicious') and record.get('guild') is not None:
+        guild_risk_boards[record['guild']].suspicious_messages -= 1
+
+
+def record_message_activity(user_id, record):
+    """Añadir un mensaje al historial manteniendo los totales del servidor"""
+    messages = user_activity[user_id]['messages']
+    if len(messages) == messages.maxlen:
+        release_message_record(messages[0])  # El deque descartará el más antiguo
+    messages.append(record)
+    guild_risk_boards[record['guild']].touch(user_id, record['timestamp'])
+    activity_expiry.schedule(user_id, record['timestamp'])
+
+
+def record_join_activity(user_id, join_time):
+    user_activity[user_id]['joins'].append(join_time)
+    activity_expiry.schedule(user_id, join_time)
+
+
+# Caducidad de la actividad con una rueda de tiempo
+ACTIVITY_RETENTION = timedelta(hours=24)
+EXPIRY_SLOT_SECONDS = 60
+EXPIRY_SLOTS = 25 * 60  # Cubre la retención completa más un margen
+EXPIRY_EPOCH = datetime(2015, 1, 1)
+
+
+def expiry_minutes(moments):
+    """minute_of vectorizado para un array datetime64"""
+    return ((moments - np.datetime64(EXPIRY_EPOCH, 'us')) //
+            np.timedelta64(EXPIRY_SLOT_SECONDS, 's')).tolist()
+
+
+class ActivityExpiryWheel:
+    """Rueda de tiempo con cubetas de un minuto; cada usuario está a lo sumo una vez"""
+
+    def __init__(self):
+        self.slots = [set() for _ in range(EXPIRY_SLOTS)]
+        self.scheduled = {}  # user_id -> minuto en el que revisarlo
+        self.current_minute = None
+        self.expired_events = 0
+        self.removed_users = 0
+
+    def minute_of(self, moment):
+        return int((moment - EXPIRY_EPOCH).total_seconds() //
+                   EXPIRY_SLOT_SECONDS)
+
+    def schedule(self, user_id, event_time):
+        """Programar al usuario para cuando caduque su evento más antiguo"""
+        if user_id in self.scheduled:
+            return  # Ya está en la rueda con un evento anterior
+        minute = self.minute_of(event_time + ACTIVITY_RETENTION)
+        if self.current_minute is not None:
+            minute = max(minute, self.current_minute + 1)
+        self.scheduled[user_id] = minute
+        self.slots[minute % EXPIRY_SLOTS].add(user_id)
+
+    def schedule_many(self, user_ids, minutes):
+        """Programar muchos usuarios con sus minutos de caducidad ya calculados"""
+        floor = None if self.current_minute is None else self.current_minute + 1
+        for user_id, minute in zip(user_ids, minutes):
+            if user_id in self.scheduled:
+                continue
+            if floor is not None and minute < floor:
+                minute = floor
+            self.scheduled[user_id] = minute
+            self.slots[minute % EXPIRY_SLOTS].add(user_id)
+
+    def schedule_oldest(self, user_id):
+        activity = user_activity[user_id]
+        event_times = []
+        if activity['messages']:
+            event_times.append(activity['messages'][0]['timestamp'])
+        if activity['joins']:
+            event_times.append(activity['joins'][0])
+        if event_times:
+            self.schedule(user_id, min(event_times))
+
+    def advance(self, current_time=None):
+        """Procesar las cubetas vencidas hasta ahora (trabajo proporcional a lo que caduca)"""
+        current_time = current_time or datetime.utcnow()
+        now_minute = self.minute_of(current_time)
+        if self.current_minute is None:
+            self.current_minute = now_minute - EXPIRY_SLOTS
+
+        first = max(self.current_minute + 1, now_minute - EXPIRY_SLOTS + 1)
+        self.current_minute = now_minute
+        cutoff = current_time - ACTIVITY_RETENTION
+
+        for minute in range(first, now_minute + 1):
+            slot = self.slots[minute % EXPIRY_SLOTS]
+            for user_id in [
+                    user_id for user_id in slot
+                    if self.scheduled.get(user_id) <= now_minute
+            ]:
+                slot.discard(user_id)
+                del self.scheduled[user_id]
+                self.expire_user(user_id, cutoff)
+
+    def expire_user(self, user_id, cutoff):
+        activity = user_activity.get(user_id)
+        if activity is None:
+            return
+
+        messages = activity['messages']
+        joins = activity['joins']
+        expired = 0
+        while messages and messages[0]['timestamp'] <= cutoff:
+            release_message_record(messages.popleft())
+            expired += 1
+        while joins and joins[0] <= cutoff:
+            joins.popleft()
+            expired += 1
+
+        if expired:
+            self.expired_events += expired
+            risk_score_cache.invalidate_user(user_id)
+
+        if messages or joins:
+            self.schedule_oldest(user_id)
+        elif not (activity['suspicious_actions'] or activity['warnings']):
+            # Sin nada pendiente: liberar la memoria del usuario y su caché
+            del user_activity[user_id]
+            risk_score_cache.invalidate_user(user_id)
+            self.removed_users += 1
+
+    def metrics(self):
+        return {
+            'scheduled_users': len(self.scheduled),
+            'expired_events': self.expired_events,
+            'removed_users': self.removed_users
+        }
+
+
+activity_expiry = ActivityExpiryWheel()
+
+
+def mark_message_suspicious(record):
+    record['suspicious'] = True
+    guild_risk_boards[record['guild']].suspicious_messages += 1
+
+
+# Reputación entre servidores para decidir al instante en las uniones
+REPUTATION_HALF_LIFE = timedelta(days=14).total_seconds()
+REPUTATION_WEIGHTS = {'flags': 1, 'quarantines': 3, 'bans': 6}
+REPUTATION_SUSPICIOUS_SCORE = 3  # Equivale a una cuarentena reciente
+REPUTATION_RISK_PER_POINT = 8
+REPUTATION_MAX_RISK = 60
+REPUTATION_MIN_SCORE = 0.05  # Por debajo se olvida al usuario
+
+
+class ReputationIndex:
+    """Conteos con decaimiento exponencial de marcas, cuarentenas y bans por usuario"""
+    KINDS = ('flags', 'quarantines', 'bans')
+
+    def __init__(self, half_life=REPUTATION_HALF_LIFE):
+        self.decay_rate = math.log(2) / half_life
+        self.entries = {}  # user_id -> [marcas, cuarentenas, bans, actualizado]
+
+    def decayed(self, entry, now):
+        factor = math.exp(-self.decay_rate * max(0.0, now - entry[3]))
+        return [count * factor for count in entry[:3]]
+
+    def record(self, user_id, kind, now=None):
+        now = now if now is not None else time.time()
+        entry = self.entries.get(user_id)
+        counts = self.decayed(entry, now) if entry else [0.0, 0.0, 0.0]
+        counts[self.KINDS.index(kind)] += 1
+        self.entries[user_id] = counts + [now]
+
+    def get(self, user_id, now=None):
+        """Conteos actuales y puntuación ponderada en O(1)"""
+        entry = self.entries.get(user_id)
+        if entry is None:
+            return None
+        counts = self.decayed(entry,
+                              now if now is not None else time.time())
+        result = dict(zip(self.KINDS, counts))
+        result['score'] = sum(REPUTATION_WEIGHTS[kind] * result[kind]
+                              for kind in self.KINDS)
+        return result
+
+    def prune(self, now=None):
+        now = now if now is not None else time.time()
+        for user_id in list(self.entries):
+            if self.get(user_id, now)['score'] < REPUTATION_MIN_SCORE:
+                del self.entries[user_id]
+
+    def to_arrays(self):
+        user_ids = list(self.entries)
+        values = np.array(list(self.entries.values()),
+                          dtype=np.float64).reshape(-1, 4)
+        return {'user_ids': np.array(user_ids, dtype=np.int64), 'values': values}
+
+    def load_arrays(self, arrays):
+        self.entries.update(
+            zip(arrays['user_ids'].tolist(), arrays['values'].tolist()))
+
+
+reputation_index = ReputationIndex()
+
+
+def check_reputation_on_join(member):
+    """Motivo y riesgo extra si el usuario ya causó problemas en otros servidores"""
+    reputation = reputation_index.get(member.id)
+    if not reputation or reputation['score'] < REPUTATION_SUSPICIOUS_SCORE:
+        return None, 0
+
+    reason = (f"Historial en otros servidores: {reputation['bans']:.1f} bans, "
+              f"{reputation['quarantines']:.1f} cuarentenas, "
+              f"{reputation['flags']:.1f} marcas")
+    extra_risk = min(REPUTATION_MAX_RISK,
+                     int(reputation['score'] * REPUTATION_RISK_PER_POINT))
+    return reason, extra_risk
+
+
+# Instantáneas de la actividad para reinicios en caliente
+SNAPSHOT_FILE = 'activity_snapshot.bin'
+SNAPSHOT_CHUNK_USERS = 2000  # Usuarios copiados por tramo antes de ceder el bucle
+SNAPSHOT_RETENTION = {
+    'messages': timedelta(hours=24),
+    'joins': timedelta(hours=24),
+    'suspicious_actions': timedelta(days=7)
+}
+NO_GUILD = -1
+activity_snapshot_loaded = False
+
+
+def new_snapshot_columns():
+    return {
+        'saved_at': datetime.utcnow(),
+        'user_ids': [],
+        'risk_scores': [],
+        'warnings': [],
+        'last_activity': [],
+        'account_age': [],
+        'message_counts': [],
+        'message_times': [],
+        'message_channels': [],
+        'message_guilds': [],
+        'message_suspicious': [],
+        'message_contents': [],
+        'join_counts': [],
+        'join_times': [],
+        'action_counts': [],
+        'action_times': [],
+        'action_types': [],
+        'action_details': [],
+        'message_patterns': {}
+    }
+
+
+def append_activity_columns(snapshot, user_ids):
+    """Copiar el estado de los usuarios indicados a las columnas planas"""
+    for user_id in user_ids:
+        activity = user_activity.get(user_id)
+        if activity is None:
+            continue  # Caducó mientras se construía la instantánea
+        messages = activity['messages']
+        if not (messages or activity['joins']
+                or activity['suspicious_actions'] or activity['warnings']):
+            continue
+
+        snapshot['user_ids'].append(user_id)
+        snapshot['risk_scores'].append(activity['risk_score'])
+        snapshot['warnings'].append(activity['warnings'])
+        snapshot['last_activity'].append(activity['last_activity'])
+        snapshot['account_age'].append(activity.get('account_age'))
+
+        snapshot['message_counts'].append(len(messages))
+        for msg in messages:
+            snapshot['message_times'].append(msg['timestamp'])
+            snapshot['message_channels'].append(msg['channel'])
+            guild_id = msg.get('guild')
+            snapshot['message_guilds'].append(
+                NO_GUILD if guild_id is None else guild_id)
+            snapshot['message_suspicious'].append(
+                msg.get('suspicious', False))
+            snapshot['message_contents'].append(msg['content'])
+
+        snapshot['join_counts'].append(len(activity['joins']))
+        snapshot['join_times'].extend(activity['joins'])
+
+        snapshot['action_counts'].append(len(activity['suspicious_actions']))
+        for action in activity['suspicious_actions']:
+            snapshot['action_times'].append(action['timestamp'])
+            snapshot['action_types'].append(action['type'])
+            snapshot['action_details'].append(action.get('details'))
+
+        if activity['message_patterns']:
+            snapshot['message_patterns'][user_id] = dict(
+                activity['message_patterns'])
+
+
+def build_activity_snapshot():
+    """Instantánea completa de una sola vez (bloquea el bucle; para pruebas y benchmarks)"""
+    snapshot = new_snapshot_columns()
+    append_activity_columns(snapshot, list(user_activity))
+    snapshot.update(snapshot_indexes())
+    return snapshot
+
+
+async def collect_activity_snapshot():
+    """Construir las columnas por tramos, cediendo el bucle entre tramo y tramo"""
+    # Las columnas son listas planas de valores sin seguimiento del recolector:
+    # copiar por tramos no genera la ráfaga de contenedores que dispara un gc completo
+    snapshot = new_snapshot_columns()
+    user_ids = list(user_activity)
+    for start in range(0, len(user_ids), SNAPSHOT_CHUNK_USERS):
+        append_activity_columns(
+            snapshot, user_ids[start:start + SNAPSHOT_CHUNK_USERS])
+        await asyncio.sleep(0)
+    snapshot.update(snapshot_indexes())
+    return snapshot
+
+
+def snapshot_indexes():
+    """Índices globales que viajan con la instantánea (copias, se toman en el bucle)"""
+    reputation_index.prune()
+    return {
+        'reputation': reputation_index.to_arrays(),
+        'timeseries': {
+            guild_id: series.to_arrays()
+            for guild_id, series in activity_series.items()
+        }
+    }
+
+
+UNIX_EPOCH = datetime(1970, 1, 1)
+ONE_MICROSECOND = timedelta(microseconds=1)
+NAT_VALUE = np.iinfo(np.int64).min
+
+
+def datetime_column(values):
+    """Columna datetime64[us] desde datetimes sin zona horaria (None pasa a NaT)"""
+    # np.array con objetos datetime es ~5 veces más lento y retiene el GIL entero
+    return np.fromiter(
+        (NAT_VALUE if value is None else (value - UNIX_EPOCH) // ONE_MICROSECOND
+         for value in values),
+        dtype=np.int64,
+        count=len(values)).view('datetime64[us]')
+
+
+def write_activity_snapshot(snapshot, path=SNAPSHOT_FILE):
+    """Convertir columnas a arrays, serializar y escribir de forma atómica (fuera del bucle)"""
+    for key in ('user_ids', 'risk_scores', 'warnings', 'message_counts',
+                'message_channels', 'message_guilds', 'join_counts',
+                'action_counts'):
+        snapshot[key] = np.array(snapshot[key], dtype=np.int64)
+    for key in ('last_activity', 'account_age', 'message_times', 'join_times',
+                'action_times'):
+        snapshot[key] = datetime_column(snapshot[key])
+    snapshot['message_suspicious'] = np.array(snapshot['message_suspicious'],
+                                              dtype=bool)
+
+    return save_data(path, snapshot, BINARY_SERIALIZER)
+
+
+async def save_activity_snapshot(path=SNAPSHOT_FILE):
+    snapshot = await collect_activity_snapshot()
+    return await asyncio.to_thread(write_activity_snapshot, snapshot, path)
+
+
+def kept_per_user(counts, keep):
+    """Cuántas entradas conserva cada usuario tras aplicar la máscara de retención"""
+    owners = np.repeat(np.arange(len(counts)), counts)
+    return np.bincount(owners[keep], minlength=len(counts))
+
+
+def read_activity_snapshot(path=SNAPSHOT_FILE):
+    """Leer y descomprimir la instantánea (se puede ejecutar fuera del bucle)"""
+    try:
+        snapshot = load_data(path, BINARY_SERIALIZER)
+    except FileNotFoundError:
+        return None
+    except (ValueError, KeyError, OSError, zlib.error) as e:
+        print(f'Error leyendo instantánea de actividad: {e}')
+        return None
+
+    if not isinstance(snapshot, dict) or 'user_ids' not in snapshot:
+        print(f'Instantánea de actividad no reconocida: {path}')
+        return None
+    return snapshot
+
+
+def apply_activity_snapshot(snapshot, current_time=None):
+    """Restaurar una instantánea ya leída con el recolector en pausa"""
+    # Se crean cientos de miles de objetos: pausar el recolector mientras tanto
+    gc.disable()
+    try:
+        return restore_activity_snapshot(snapshot, current_time)
+    finally:
+        gc.enable()
+
+
+def load_activity_snapshot(path=SNAPSHOT_FILE, current_time=None):
+    """Restaurar la actividad guardada descartando lo que ya salió de las ventanas"""
+    snapshot = read_activity_snapshot(path)
+    if snapshot is None:
+        return 0
+    return apply_activity_snapshot(snapshot, current_time)
+
+
+def first_per_user(times, counts):
+    """Primera marca de tiempo de cada usuario (NaT si no tiene ninguna)"""
+    first = np.full(len(counts), np.datetime64('NaT'), dtype='datetime64[us]')
+    has_any = counts > 0
+    first[has_any] = times[(np.cumsum(counts) - counts)[has_any]]
+    return first
+
+
+def restore_activity_snapshot(snapshot, current_time=None):
+    if 'reputation' in snapshot:
+        reputation_index.load_arrays(snapshot['reputation'])
+    for guild_id, arrays in snapshot.get('timeseries', {}).items():
+        activity_series[guild_id].load_arrays(arrays)
+
+    current_time = np.datetime64(current_time or datetime.utcnow(), 'us')
+    keep_messages = snapshot['message_times'] > current_time - np.timedelta64(
+        SNAPSHOT_RETENTION['messages'])
+    keep_joins = snapshot['join_times'] > current_time - np.timedelta64(
+        SNAPSHOT_RETENTION['joins'])
+    keep_actions = snapshot['action_times'] > current_time - np.timedelta64(
+        SNAPSHOT_RETENTION['suspicious_actions'])
+
+    message_counts = kept_per_user(snapshot['message_counts'], keep_messages)
+    join_counts = kept_per_user(snapshot['join_counts'], keep_joins)
+    action_counts = kept_per_user(snapshot['action_counts'], keep_actions)
+
+    kept_message_times = snapshot['message_times'][keep_messages]
+    kept_message_guilds = snapshot['message_guilds'][keep_messages]
+    kept_message_suspicious = snapshot['message_suspicious'][keep_messages]
+    kept_join_times = snapshot['join_times'][keep_joins]
+
+    # Solo se convierten a objetos Python las entradas que sobreviven
+    message_times = kept_message_times.tolist()
+    message_channels = snapshot['message_channels'][keep_messages].tolist()
+    message_guilds = kept_message_guilds.tolist()
+    message_suspicious = kept_message_suspicious.tolist()
+    message_contents = list(
+        itertools.compress(snapshot['message_contents'], keep_messages))
+    join_times = kept_join_times.tolist()
+    action_times = snapshot['action_times'][keep_actions].tolist()
+    action_types = list(
+        itertools.compress(snapshot['action_types'], keep_actions))
+    action_details = list(
+        itertools.compress(snapshot['action_details'], keep_actions))
+
+    # Crear todos los registros de una vez y repartirlos por usuario
+    records = [{
+        'content': content,
+        'timestamp': timestamp,
+        'channel': channel,
+        'guild': None if guild_id == NO_GUILD else guild_id,
+        'suspicious': suspicious
+    } for content, timestamp, channel, guild_id, suspicious in zip(
+        message_contents, message_times, message_channels, message_guilds,
+        message_suspicious)]
+    actions = [{
+        'type': action_type,
+        'timestamp': timestamp,
+        'details': details
+    } for action_type, timestamp, details in zip(action_types, action_times,
+                                                  action_details)]
+
+    message_ends = np.cumsum(message_counts).tolist()
+    join_ends = np.cumsum(join_counts).tolist()
+    action_ends = np.cumsum(action_counts).tolist()
+
+    user_ids = snapshot['user_ids']
+    risk_scores = snapshot['risk_scores']
+    warnings_column = snapshot['warnings']
+    restored_mask = ((message_counts > 0) | (join_counts > 0) |
+                     (action_counts > 0) | (warnings_column > 0))
+
+    message_patterns = snapshot['message_patterns']
+    message_start = join_start = action_start = 0
+    for (user_id, risk_score, warnings, last_activity, account_age,
+         message_end, join_end, action_end,
+         restore) in zip(user_ids.tolist(), risk_scores.tolist(),
+                         warnings_column.tolist(),
+                         snapshot['last_activity'].tolist(),
+                         snapshot['account_age'].tolist(), message_ends,
+                         join_ends, action_ends, restored_mask.tolist()):
+        if restore:
+            activity = user_activity.get(user_id)
+            if activity is None:
+                # Arranque normal: el usuario se crea ya con todo su estado
+                activity = user_activity[user_id] = new_user_activity(
+                    records[message_start:message_end],
+                    join_times[join_start:join_end]
+                    if join_end > join_start else (),
+                    actions[action_start:action_end]
+                    if action_end > action_start else (), risk_score,
+                    warnings, last_activity,
+                    message_patterns.get(user_id, ()))
+            else:
+                activity['messages'].extend(records[message_start:message_end])
+                activity['joins'].extend(join_times[join_start:join_end])
+                activity['suspicious_actions'].extend(
+                    actions[action_start:action_end])
+                activity['warnings'] = warnings
+                activity['last_activity'] = last_activity
+                activity['risk_score'] = risk_score
+                activity['message_patterns'].update(
+                    message_patterns.get(user_id, ()))
+            if account_age:
+                activity['account_age'] = account_age
+
+        message_start, join_start, action_start = message_end, join_end, action_end
+
+    # Rueda de caducidad: evento más antiguo de cada usuario, calculado de una vez
+    oldest = np.fmin(first_per_user(kept_message_times, message_counts),
+                     first_per_user(kept_join_times, join_counts))
+    scheduled = restored_mask & ~np.isnat(oldest)
+    activity_expiry.schedule_many(
+        user_ids[scheduled].tolist(),
+        expiry_minutes(oldest[scheduled] + np.timedelta64(ACTIVITY_RETENTION)))
+
+    # Última actividad de cada usuario en cada servidor (los mensajes están en orden)
+    owners = np.repeat(np.arange(len(user_ids)), message_counts)
+    order = np.lexsort((kept_message_guilds, owners))
+    owners, guilds = owners[order], kept_message_guilds[order]
+    last = np.ones(len(order), dtype=bool)
+    last[:-1] = (owners[1:] != owners[:-1]) | (guilds[1:] != guilds[:-1])
+    last &= guilds != NO_GUILD
+    owners, guilds, times = owners[last], guilds[last], kept_message_times[
+        order][last]
+
+    by_guild = np.argsort(guilds, kind='stable')
+    owners, guilds, times = owners[by_guild], guilds[by_guild], times[by_guild]
+    boundaries = np.flatnonzero(np.diff(guilds)) + 1
+    for start, stop in zip(np.r_[0, boundaries], np.r_[boundaries,
+                                                        len(guilds)]):
+        if start == stop:
+            continue
+        guild_owners = owners[start:stop]
+        guild_risk_boards[int(guilds[start])].load_entries(
+            user_ids[guild_owners].tolist(),
+            risk_scores[guild_owners].tolist(),
+            times[start:stop].tolist())
+
+    # Mensajes sospechosos por servidor, contados de una vez
+    suspicious_guilds = kept_message_guilds[kept_message_suspicious]
+    for guild_id, count in zip(*np.unique(suspicious_guilds,
+                                          return_counts=True)):
+        if guild_id != NO_GUILD:
+            guild_risk_boards[int(guild_id)].suspicious_messages += int(count)
+
+    risk_score_cache.clear()
+    return int(restored_mask.sum())
+
+
+# Pesos de los patrones sospechosos
+PATTERN_WEIGHTS = {
+    'discord_invites': 20,
+    'suspicious_urls': 15,
+    'mass_mentions': 25,
+    'spam_chars': 12,
+    'suspicious_domains': 30,
+    'cryptocurrency': 8,  # Reducido, no siempre es malicioso
+    'scam_words': 25,
+    'zalgo_text': 18,
+    'invisible_chars': 10
+}
+
+# Patrones que se resuelven con las características extraídas y no con regex
+FEATURE_PATTERNS = {
+    'spam_chars': lambda features: features['longest_run'] >= 9,
+    'zalgo_text': lambda features: features['combining_marks'] > 0,
+    'invisible_chars': lambda features: features['invisible_chars'] > 0
+}
+
+COMPILED_PATTERNS = {
+    name: re.compile(pattern, re.IGNORECASE)
+    for name, pattern in SUSPICIOUS_PATTERNS.items()
+    if name not in FEATURE_PATTERNS
+}
+
+MALICIOUS_DOMAIN_PATTERNS = [(domain,
+                              re.compile(r'\b' + re.escape(domain) + r'\b',
+                                         re.IGNORECASE))
+                             for domain in MALICIOUS_DOMAINS]
+
+COMMON_SAFE_DOMAINS = [
+    'youtube.com', 'twitter.com', 'github.com', 'google.com', 'wikipedia.org'
+]
+NORMAL_CRYPTO_CONTEXT = [
+    'precio', 'mercado', 'noticias', 'análisis', 'trading'
+]
+
+# Tablas precalculadas para la extracción de características de texto
+COMBINING_RANGES = [(0x0300, 0x036F), (0x1AB0, 0x1AFF), (0x1DC0, 0x1DFF),
+                    (0x20D0, 0x20FF), (0xFE20, 0xFE2F)]
+INVISIBLE_CHARS = '\u200b\u200c\u200d\u2060\ufeff'
+
+# Caracteres que imitan letras latinas (cirílico, griego y otros)
+CONFUSABLE_CHARS = {
+    'а': 'a', 'в': 'b', 'е': 'e', 'ё': 'e', 'к': 'k', 'м': 'm', 'н': 'h',
+    'о': 'o', 'р': 'p', 'с': 'c', 'т': 't', 'у': 'y', 'х': 'x', 'ѕ': 's',
+    'і': 'i', 'ї': 'i', 'ј': 'j', 'һ': 'h', 'ԁ': 'd', 'ԛ': 'q', 'ԝ': 'w',
+    'ӏ': 'l', 'ɡ': 'g', 'ı': 'i', 'ℓ': 'l', 'α': 'a', 'β': 'b', 'ε': 'e',
+    'ι': 'i', 'κ': 'k', 'ν': 'v', 'ο': 'o', 'ρ': 'p', 'τ': 't', 'υ': 'u',
+    'χ': 'x', 'ω': 'w'
+}
+# Formas de ancho completo (！ a ～) equivalen a su ASCII
+CONFUSABLE_CHARS.update(
+    {chr(code): chr(code - 0xFEE0)
+     for code in range(0xFF01, 0xFF5F)})
+
+# Tablas de traducción: eliminar ASCII, marcas combinantes o invisibles
+ASCII_DELETE_TABLE = dict.fromkeys(range(128))
+COMBINING_DELETE_TABLE = dict.fromkeys(
+    code for start, end in COMBINING_RANGES for code in range(start, end + 1))
+INVISIBLE_DELETE_TABLE = dict.fromkeys(ord(char) for char in INVISIBLE_CHARS)
+
+# Esqueleto: sin marcas combinantes ni invisibles y con confusables normalizados
+SKELETON_TABLE = {**COMBINING_DELETE_TABLE, **INVISIBLE_DELETE_TABLE}
+SKELETON_TABLE.update(
+    {ord(char): ascii_char
+     for char, ascii_char in CONFUSABLE_CHARS.items()})
+
+REPEATED_RUN_RE = re.compile(r'(.)\1+')  # Sin DOTALL: los saltos de línea no cuentan
+ASCII_ALNUM_RE = re.compile(r'[a-zA-Z0-9]')
+
+
+def extract_text_features(content):
+    """Extraer las características Unicode y de repetición con tablas precalculadas"""
+    if content.isascii():
+        # Camino rápido: sin caracteres Unicode no hay nada que normalizar
+        non_ascii_text = ''
+        ascii_content = content
+        skeleton = content
+    else:
+        non_ascii_text = content.translate(ASCII_DELETE_TABLE)
+        ascii_content = content.encode('ascii',
+                                       errors='ignore').decode('ascii')
+        skeleton = content.translate(SKELETON_TABLE)
+
+    combining_marks = 0
+    invisible_chars = 0
+    if non_ascii_text:
+        without_combining = non_ascii_text.translate(COMBINING_DELETE_TABLE)
+        combining_marks = len(non_ascii_text) - len(without_combining)
+        invisible_chars = len(without_combining) - len(
+            without_combining.translate(INVISIBLE_DELETE_TABLE))
+
+    longest_run = max(
+        (match.end() - match.start()
+         for match in REPEATED_RUN_RE.finditer(content)),
+        default=1 if content else 0)
+
+    words = skeleton.split()
+    word_count = Counter([word for word in words
+                          if len(word) > 3])  # Solo palabras significativas
+
+    return {
+        'combining_marks': combining_marks,
+        'invisible_chars': invisible_chars,
+        'non_ascii': len(non_ascii_text),
+        'non_ascii_ratio':
+        len(non_ascii_text) / len(content) if content else 0.0,
+        'ascii_stripped_length': len(ascii_content.strip()),
+        'ascii_alnum': ASCII_ALNUM_RE.search(ascii_content) is not None,
+        'longest_run': longest_run,
+        'word_total': len(words),
+        'max_word_repetition': max(word_count.values(), default=0),
+        'skeleton': skeleton
+    }
+
+
+# Reglas personalizadas por servidor
+CUSTOM_RULE_WEIGHT = 30  # Riesgo por cada regla personalizada que coincide
+CUSTOM_RULES_MAX = 500  # Frases o dominios máximos por servidor
+CUSTOM_REGEX_MAX = 100  # La regex combinada crece con cada alternativa
+CUSTOM_RULE_MAX_LENGTH = 200
+CUSTOM_REGEX_MAX_LENGTH = 100
+CUSTOM_REGEX_TIMEOUT = 0.02  # Segundos máximos de la regex combinada por mensaje
+REGEX_REPEAT_OPS = (re_parser.MAX_REPEAT, re_parser.MIN_REPEAT,
+                    re_parser.POSSESSIVE_REPEAT)
+URL_HOST_RE = re.compile(r'https?://([^/\s:?#]+)', re.IGNORECASE)
+
+
+def normalize_rule_text(text):
+    """Normalizar una frase igual que el contenido analizado (minúsculas y esqueleto)"""
+    return ' '.join(text.lower().translate(SKELETON_TABLE).split())
+
+
+def normalize_rule_domain(domain):
+    """Dominio sin esquema, ruta ni www"""
+    domain = domain.strip().lower()
+    domain = re.sub(r'^[a-z]+://', '', domain).split('/')[0].split(':')[0]
+    return domain[4:] if domain.startswith('www.') else domain
+
+
+class PhraseAutomaton:
+    """Autómata Aho-Corasick: todas las frases en una sola pasada por el texto"""
+
+    def __init__(self, phrases):
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [()]
+
+        for phrase in phrases:
+            state = 0
+            for char in phrase:
+                next_state = self.goto[state].get(char)
+                if next_state is None:
+                    next_state = self.goto[state][char] = len(self.goto)
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append(())
+                state = next_state
+            self.output[state] += (phrase, )
+
+        # Enlaces de fallo en anchura: cada estado hereda las salidas de su fallo
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[next_state] = self.goto[fallback].get(char, 0)
+                self.output[next_state] += self.output[self.fail[next_state]]
+
+    def search(self, text):
+        """Frases presentes en el texto, cada una una sola vez"""
+        goto, fail, output = self.goto, self.fail, self.output
+        found = set()
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                found.update(output[state])
+        return found
+
+
+def regex_tree_error(items, in_repeat=False):
+    """Buscar en el árbol de una regex construcciones no admitidas en las reglas"""
+    for op, av in items:
+        if op in (re_parser.GROUPREF, re_parser.GROUPREF_EXISTS):
+            return "no se admiten referencias a grupos (\\1)"
+        if op == re_parser.SUBPATTERN:
+            if av[0] is not None:
+                return "usa grupos sin captura `(?:...)`"
+            error = regex_tree_error(av[-1], in_repeat)
+        elif op in REGEX_REPEAT_OPS:
+            repeats = av[1] > 1
+            if in_repeat and repeats:
+                return "no se admiten cuantificadores anidados como `(a+)+`"
+            error = regex_tree_error(av[2], in_repeat or repeats)
+        elif op == re_parser.BRANCH:
+            error = next((error for branch in av[1]
+                          if (error := regex_tree_error(branch, in_repeat))),
+                         None)
+        elif op in (re_parser.ASSERT, re_parser.ASSERT_NOT):
+            error = regex_tree_error(av[1], in_repeat)
+        elif op == re_parser.ATOMIC_GROUP:
+            error = regex_tree_error(av, in_repeat)
+        else:
+            error = None
+        if error:
+            return error
+    return None
+
+
+def regex_rule_error(pattern):
+    """Motivo por el que una regex no es segura para la regex combinada, o None"""
+    if len(pattern) > CUSTOM_REGEX_MAX_LENGTH:
+        return f"no puede superar {CUSTOM_REGEX_MAX_LENGTH} caracteres"
+    try:
+        tree = re_parser.parse(pattern)
+        regex.compile(pattern)
+    except (re.error, regex.error) as e:
+        return f"no es válida: {e}"
+    return regex_tree_error(tree)
+
+
+def compile_merged_regex(patterns):
+    """Unir todas las regex en una sola alternancia sin grupos de captura"""
+    if not patterns:
+        return None
+    # Sin IGNORECASE: el texto ya está en minúsculas y así se conserva el
+    # prefiltro por primer carácter de cada alternativa
+    return regex.compile('|'.join(f'(?:{pattern})' for pattern in patterns))
+
+
+class GuildRuleSet:
+    """Reglas personalizadas de un servidor compiladas en un autómata y una regex"""
+
+    def __init__(self, guild_id, version, phrases=(), allowed_domains=(),
+                 regexes=()):
+        self.guild_id = guild_id
+        self.version = version
+        self.phrases = PhraseAutomaton(phrases) if phrases else None
+        # Las reglas guardadas antes de validarse también deben ser seguras
+        self.regexes = tuple(pattern for pattern in regexes
+                             if regex_rule_error(pattern) is None)
+        self.regex = compile_merged_regex(self.regexes)
+        self.rule_regexes = [
+            regex.compile(pattern) for pattern in self.regexes
+        ]
+        self.regex_timeouts = 0
+        self.allowed_domains = frozenset(allowed_domains)
+        self.active = bool(phrases or self.regexes or self.allowed_domains)
+        # Los veredictos en caché solo se comparten entre servidores sin reglas
+        self.cache_scope = (guild_id, version) if self.active else None
+
+    def search(self, text):
+        """Razones de las reglas que coinciden con el texto normalizado"""
+        reasons = []
+        if self.phrases is not None:
+            reasons.extend(f"Regla personalizada: frase «{phrase}»"
+                           for phrase in sorted(self.phrases.search(text)))
+        # Una sola búsqueda combinada; las regex individuales solo si hay coincidencia
+        if self.regex is not None:
+            try:
+                if self.regex.search(text, timeout=CUSTOM_REGEX_TIMEOUT):
+                    reasons.extend(
+                        f"Regla personalizada: regex «{pattern}»"
+                        for pattern, rule_regex in zip(
+                            self.regexes, self.rule_regexes)
+                        if rule_regex.search(text,
+                                             timeout=CUSTOM_REGEX_TIMEOUT))
+            except TimeoutError:
+                # Una regex lenta no puede bloquear el bucle de todos los servidores
+                self.regex_timeouts += 1
+        return reasons
+
+    def domain_allowed(self, host):
+        """El dominio o alguno de sus dominios padre está permitido"""
+        labels = host.lower().split('.')
+        return any('.'.join(labels[i:]) in self.allowed_domains
+                   for i in range(len(labels) - 1))
+
+    def urls_allowed(self, text):
+        """Todas las URLs del texto apuntan a dominios permitidos"""
+        if not self.allowed_domains:
+            return False
+        hosts = URL_HOST_RE.findall(text)
+        return bool(hosts) and all(self.domain_allowed(host) for host in hosts)
+
+
+# Reglas compiladas por ID de servidor (int)
+guild_rule_sets = {}
+rule_set_compilations = 0
+
+
+def get_rule_set(guild_id):
+    """Reglas compiladas del servidor; solo se recompilan si cambia su versión"""
+    global rule_set_compilations
+    config = get_compiled_config(guild_id)
+    rules = guild_rule_sets.get(guild_id)
+    if rules is None or rules.version != config.rules_version:
+        rules = guild_rule_sets[guild_id] = GuildRuleSet(
+            guild_id, config.rules_version, config.custom_phrases,
+            config.allowed_domains, config.custom_regexes)
+        rule_set_compilations += 1
+    return rules
+
+
+def analyze_message_content(message, extended_checks=True):
     """Análisis avanzado del contenido del mensaje con reducción de falsos positivos"""
     content = message.content.lower()
     original_content = message.content
@@ -258,48 +1637,43 @@ def analyze_message_content(message):
     is_reply = message.reference is not None
     has_attachments = len(message.attachments) > 0
 
+    # Una sola pasada: los patrones se buscan sobre el esqueleto normalizado
+    features = extract_text_features(content)
+    skeleton = features['skeleton']
+    rules = get_rule_set(message.guild.id)
+
     # Verificar patrones sospechosos con contexto
-    pattern_weights = {
-        'discord_invites': 20,
-        'suspicious_urls': 15,
-        'mass_mentions': 25,
-        'spam_chars': 12,
-        'suspicious_domains': 30,
-        'cryptocurrency': 8,  # Reducido, no siempre es malicioso
-        'scam_words': 25,
-        'zalgo_text': 18,
-        'invisible_chars': 10
-    }
+    for pattern_name in SUSPICIOUS_PATTERNS:
+        if pattern_name in FEATURE_PATTERNS:
+            matched = FEATURE_PATTERNS[pattern_name](features)
+        else:
+            matched = COMPILED_PATTERNS[pattern_name].search(skeleton)
+
+        if matched:
+            weight = PATTERN_WEIGHTS.get(pattern_name, 10)
 
-    for pattern_name, pattern in SUSPICIOUS_PATTERNS.items():
-        matches = re.findall(pattern, content, re.IGNORECASE)
-        if matches:
-            weight = pattern_weights.get(pattern_name, 10)
+            # Los enlaces a dominios permitidos por el servidor no cuentan
+            if pattern_name in ('suspicious_urls', 'suspicious_domains'
+                                ) and rules.urls_allowed(skeleton):
+                continue
 
             # Reducir peso para contextos legítimos
             if pattern_name == 'suspicious_urls':
                 # Permitir URLs comunes y verificar contexto
-                common_safe_domains = [
-                    'youtube.com', 'twitter.com', 'github.com', 'google.com',
-                    'wikipedia.org'
-                ]
-                if any(domain in content for domain in common_safe_domains):
+                if any(domain in skeleton for domain in COMMON_SAFE_DOMAINS):
                     weight = max(3, weight // 3)
                 elif is_reply or len(original_content) > 50:  # URL en contexto
                     weight = max(5, weight // 2)
 
             elif pattern_name == 'cryptocurrency':
                 # Reducir si es conversación normal sobre crypto
-                normal_crypto_context = [
-                    'precio', 'mercado', 'noticias', 'análisis', 'trading'
-                ]
-                if any(word in content for word in normal_crypto_context):
+                if any(word in skeleton for word in NORMAL_CRYPTO_CONTEXT):
                     weight = max(3, weight // 2)
 
             elif pattern_name == 'spam_chars':
                 # Reducir para reacciones normales o énfasis
-                if len(matches[0]) < 12 and (is_reply or '?' in content
-                                             or '!' in content):
+                if features['longest_run'] < 12 and (is_reply or '?' in content
+                                                     or '!' in content):
                     weight = max(3, weight // 2)
 
             analysis['patterns'].append(pattern_name)
@@ -308,11 +1682,10 @@ def analyze_message_content(message):
 
     # Verificar dominios maliciosos con verificación estricta
     malicious_found = False
-    for domain in MALICIOUS_DOMAINS:
-        if domain in content:
+    for domain, domain_pattern in MALICIOUS_DOMAIN_PATTERNS:
+        if domain in skeleton:
             # Verificar que realmente es el dominio y no parte de otra palabra
-            domain_pattern = r'\b' + re.escape(domain) + r'\b'
-            if re.search(domain_pattern, content, re.IGNORECASE):
+            if domain_pattern.search(skeleton):
                 malicious_found = True
                 analysis['risk_level'] += 35
                 analysis['reason'].append(
@@ -321,10 +1694,17 @@ def analyze_message_content(message):
     if malicious_found:
         analysis['suspicious'] = True
 
+    # Reglas personalizadas del servidor: una pasada del autómata y una regex
+    if rules.active:
+        for reason in rules.search(skeleton):
+            analysis['suspicious'] = True
+            analysis['risk_level'] += CUSTOM_RULE_WEIGHT
+            analysis['reason'].append(reason)
+
     # Análisis de menciones mejorado
     mentions = len(message.mentions) + len(message.role_mentions)
-    config = get_server_config(message.guild.id)
-    mention_limit = config.get('mention_limit', 3)
+    config = get_compiled_config(message.guild.id)
+    mention_limit = config.mention_limit
 
     if mentions > mention_limit:
         # Considerar contexto: longitud del mensaje y si es respuesta
@@ -336,7 +1716,7 @@ def analyze_message_content(message):
         analysis['risk_level'] += mention_penalty
         analysis['reason'].append(f"Menciones excesivas: {mentions}")
 
-        if mentions > mention_limit * 2:  # Solo marcar como sospechoso si es muy excesivo
+        if mentions > config.mass_mention_threshold:  # Solo marcar como sospechoso si es muy excesivo
             analysis['suspicious'] = True
 
     # Análisis de longitud mejorado
@@ -348,35 +1728,30 @@ def analyze_message_content(message):
     elif len(content) > 800 and not is_reply:
         analysis['risk_level'] += 5
 
+    # Con el bucle sobrecargado se omiten las comprobaciones extendidas
+    if not extended_checks:
+        if analysis['risk_level'] > 20:
+            analysis['suspicious'] = True
+        return analysis
+
     # Verificar caracteres Unicode sospechosos con más precisión
-    if len(content) > 10:  # Solo verificar en mensajes no muy cortos
-        ascii_content = content.encode('ascii',
-                                       errors='ignore').decode('ascii')
-        if len(content) != len(ascii_content):
-            unicode_ratio = (len(content) - len(ascii_content)) / len(content)
+    if len(content) > 10 and features['non_ascii']:
+        unicode_ratio = features['non_ascii_ratio']
 
-            # Solo penalizar si hay muchos caracteres Unicode sin contexto normal
-            if unicode_ratio > 0.5 and len(ascii_content.strip()) < 5:
-                analysis['suspicious'] = True
-                analysis['risk_level'] += 20
-                analysis['reason'].append(
-                    "Exceso de caracteres Unicode sospechosos")
-            elif unicode_ratio > 0.3 and not any(char.isalnum()
-                                                 for char in ascii_content):
-                analysis['risk_level'] += 12
-                analysis['reason'].append("Caracteres Unicode sospechosos")
+        # Solo penalizar si hay muchos caracteres Unicode sin contexto normal
+        if unicode_ratio > 0.5 and features['ascii_stripped_length'] < 5:
+            analysis['suspicious'] = True
+            analysis['risk_level'] += 20
+            analysis['reason'].append(
+                "Exceso de caracteres Unicode sospechosos")
+        elif unicode_ratio > 0.3 and not features['ascii_alnum']:
+            analysis['risk_level'] += 12
+            analysis['reason'].append("Caracteres Unicode sospechosos")
 
     # Análisis de repetición de palabras
-    words = content.split()
-    if len(words) > 5:
-        word_count = {}
-        for word in words:
-            if len(word) > 3:  # Solo palabras significativas
-                word_count[word] = word_count.get(word, 0) + 1
-
-        max_repetition = max(word_count.values()) if word_count else 0
-        if max_repetition > len(
-                words) * 0.4:  # Más del 40% es la misma palabra
+    if features['word_total'] > 5:
+        if features['max_word_repetition'] > features[
+                'word_total'] * 0.4:  # Más del 40% es la misma palabra
             analysis['risk_level'] += 15
             analysis['reason'].append("Repetición excesiva de palabras")
 
@@ -387,6 +1762,1116 @@ def analyze_message_content(message):
     return analysis
 
 
+# Puntuación por lotes sobre matrices de características
+PATTERN_NAMES = list(SUSPICIOUS_PATTERNS)
+MESSAGE_FEATURE_COLUMNS = [
+    'ignored', 'is_reply', 'has_attachments', 'length', 'original_length',
+    'mentions', 'mention_limit', 'mass_mention_threshold', 'safe_domain',
+    'crypto_context', 'emphasis', 'longest_run', 'malicious_domains',
+    'non_ascii', 'non_ascii_ratio', 'ascii_stripped_length', 'ascii_alnum',
+    'word_total', 'max_word_repetition', 'custom_rule_hits', 'urls_allowed'
+] + [f'pattern_{name}' for name in PATTERN_NAMES]
+MESSAGE_COLUMN = {name: i for i, name in enumerate(MESSAGE_FEATURE_COLUMNS)}
+PATTERN_WEIGHT_VECTOR = np.array(
+    [PATTERN_WEIGHTS.get(name, 10) for name in PATTERN_NAMES],
+    dtype=np.int64)
+
+
+# Texto ASCII ya en minúsculas: sin IGNORECASE los patrones van mucho más
+# rápido y encuentran lo mismo; las filas con Unicode usan los originales
+BATCH_PATTERNS = {
+    name: re.compile(SUSPICIOUS_PATTERNS[name])
+    for name in COMPILED_PATTERNS
+}
+SPAM_RUN_RE = re.compile(r'(.)\1{8,}')  # Solo las repeticiones de spam_chars
+
+
+def joined_rows(texts):
+    """Texto unido del lote y posición donde empieza cada fila"""
+    starts = list(itertools.accumulate((len(text) + 1 for text in texts[:-1]),
+                                       initial=0))
+    return '\n'.join(texts), starts
+
+
+def matching_rows(pattern, text, starts):
+    """Filas del lote con alguna coincidencia del patrón en el texto unido"""
+    # Ningún patrón de análisis acepta saltos de línea: no cruzan entre filas.
+    # Tras la primera coincidencia de una fila se salta a la siguiente
+    rows = []
+    search = pattern.search
+    match = search(text)
+    while match:
+        row = bisect.bisect_right(starts, match.start()) - 1
+        rows.append(row)
+        if row + 1 == len(starts):
+            break
+        match = search(text, starts[row + 1])
+    return rows
+
+
+def literal_rows(literals, text, starts):
+    """Filas del lote que contienen alguno de los textos fijos"""
+    rows = set()
+    for literal in literals:
+        position = text.find(literal)
+        while position != -1:
+            row = bisect.bisect_right(starts, position) - 1
+            rows.add(row)
+            if row + 1 == len(starts):
+                break
+            position = text.find(literal, starts[row + 1])
+    return sorted(rows)
+
+
+def build_message_feature_matrix(messages):
+    """Convertir muchos mensajes en una matriz de características (n x columnas)"""
+    count = len(messages)
+    matrix = np.zeros((count, len(MESSAGE_FEATURE_COLUMNS)), dtype=np.float64)
+    if not count:
+        return matrix
+    column = lambda name: matrix[:, MESSAGE_COLUMN[name]]
+
+    originals = [message.content for message in messages]
+    contents = [content.lower() for content in originals]
+    column('ignored')[:] = np.fromiter(
+        (len(content.strip()) < 3 or content.startswith(('/', '!', '?', '.'))
+         for content in contents),
+        dtype=bool,
+        count=count)
+    column('is_reply')[:] = np.fromiter(
+        (message.reference is not None for message in messages),
+        dtype=bool,
+        count=count)
+    column('has_attachments')[:] = np.fromiter(
+        (len(message.attachments) > 0 for message in messages),
+        dtype=bool,
+        count=count)
+    column('original_length')[:] = np.fromiter(map(len, originals),
+                                               dtype=np.int64,
+                                               count=count)
+    column('length')[:] = np.fromiter(map(len, contents),
+                                      dtype=np.int64,
+                                      count=count)
+    column('ascii_stripped_length')[:] = np.fromiter(
+        (len(content.strip()) for content in contents),
+        dtype=np.int64,
+        count=count)
+    column('mentions')[:] = np.fromiter(
+        (len(message.mentions) + len(message.role_mentions)
+         for message in messages),
+        dtype=np.int64,
+        count=count)
+
+    # Configuración y reglas: una consulta por servidor, no por mensaje
+    guild_ids = np.fromiter((message.guild.id for message in messages),
+                            dtype=np.int64,
+                            count=count)
+    guilds, guild_rows = np.unique(guild_ids, return_inverse=True)
+    configs = [get_compiled_config(int(guild_id)) for guild_id in guilds]
+    column('mention_limit')[:] = np.array(
+        [config.mention_limit for config in configs])[guild_rows]
+    column('mass_mention_threshold')[:] = np.array(
+        [config.mass_mention_threshold for config in configs])[guild_rows]
+
+    # Repeticiones de spam_chars sobre el texto sin normalizar
+    text, starts = joined_rows(contents)
+    longest_run = column('longest_run')
+    longest_run[:] = column('length') > 0
+    for row in matching_rows(SPAM_RUN_RE, text, starts):
+        longest_run[row] = extract_text_features(contents[row])['longest_run']
+        column('emphasis')[row] = '?' in contents[row] or '!' in contents[row]
+    column('pattern_spam_chars')[:] = longest_run >= 9
+
+    # Solo los mensajes con Unicode necesitan normalizarse
+    skeletons = contents
+    unicode_features = {}
+    if not text.isascii():
+        skeletons = list(contents)
+        for row, content in enumerate(contents):
+            if not content.isascii():
+                unicode_features[row] = extract_text_features(content)
+                skeletons[row] = unicode_features[row]['skeleton']
+        text, starts = joined_rows(skeletons)
+
+    # Patrones y contexto: una pasada por patrón sobre todo el lote
+    for name, pattern in BATCH_PATTERNS.items():
+        column(f'pattern_{name}')[matching_rows(pattern, text, starts)] = 1
+    column('safe_domain')[literal_rows(COMMON_SAFE_DOMAINS, text, starts)] = 1
+    column('crypto_context')[literal_rows(NORMAL_CRYPTO_CONTEXT, text,
+                                          starts)] = 1
+    malicious = column('malicious_domains')
+    for domain, domain_pattern in MALICIOUS_DOMAIN_PATTERNS:
+        for row in literal_rows([domain], text, starts):
+            if domain_pattern.search(skeletons[row]):
+                malicious[row] += 1
+
+    # Filas con Unicode: patrones con IGNORECASE y características propias
+    for row, features in unicode_features.items():
+        for name in ('non_ascii', 'non_ascii_ratio', 'ascii_stripped_length',
+                     'ascii_alnum'):
+            matrix[row, MESSAGE_COLUMN[name]] = features[name]
+        for name in PATTERN_NAMES:
+            if name in FEATURE_PATTERNS:
+                matched = FEATURE_PATTERNS[name](features)
+            else:
+                matched = COMPILED_PATTERNS[name].search(features['skeleton'])
+            matrix[row, MESSAGE_COLUMN[f'pattern_{name}']] = bool(matched)
+
+    # Palabras: un solo Counter con (fila, palabra) para todo el lote
+    words = [skeleton.split() for skeleton in skeletons]
+    column('word_total')[:] = np.fromiter(map(len, words),
+                                          dtype=np.int64,
+                                          count=count)
+    repeated = Counter((row, word) for row, row_words in enumerate(words)
+                       for word in row_words if len(word) > 3)
+    if repeated:
+        rows = np.fromiter((row for row, _ in repeated), dtype=np.int64)
+        np.maximum.at(column('max_word_repetition'), rows,
+                      np.fromiter(repeated.values(), dtype=np.int64))
+
+    # Reglas personalizadas de los servidores que las tienen
+    for guild_index, guild_id in enumerate(guilds):
+        rules = get_rule_set(int(guild_id))
+        if not rules.active:
+            continue
+        for row in np.flatnonzero(guild_rows == guild_index):
+            matrix[row, MESSAGE_COLUMN['custom_rule_hits']] = len(
+                rules.search(skeletons[row]))
+            matrix[row, MESSAGE_COLUMN['urls_allowed']] = rules.urls_allowed(
+                skeletons[row])
+
+    return matrix
+
+
+def score_message_matrix(matrix):
+    """Aplicar los pesos de analyze_message_content de forma vectorizada"""
+    column = lambda name: matrix[:, MESSAGE_COLUMN[name]]
+    ignored = column('ignored') > 0
+    is_reply = column('is_reply') > 0
+    has_attachments = column('has_attachments') > 0
+    length = column('length')
+    original_length = column('original_length')
+
+    # Pesos de patrones con las reducciones por contexto
+    hits = matrix[:, [MESSAGE_COLUMN[f'pattern_{name}']
+                      for name in PATTERN_NAMES]] > 0
+    weights = np.broadcast_to(PATTERN_WEIGHT_VECTOR, hits.shape).copy()
+
+    urls = PATTERN_NAMES.index('suspicious_urls')
+    url_weight = PATTERN_WEIGHTS['suspicious_urls']
+    weights[:, urls] = np.where(
+        column('safe_domain') > 0, max(3, url_weight // 3),
+        np.where(is_reply | (original_length > 50), max(5, url_weight // 2),
+                 url_weight))
+
+    crypto = PATTERN_NAMES.index('cryptocurrency')
+    crypto_weight = PATTERN_WEIGHTS['cryptocurrency']
+    weights[:, crypto] = np.where(
+        column('crypto_context') > 0, max(3, crypto_weight // 2),
+        crypto_weight)
+
+    spam = PATTERN_NAMES.index('spam_chars')
+    spam_weight = PATTERN_WEIGHTS['spam_chars']
+    weights[:, spam] = np.where(
+        (column('longest_run') < 12) & (is_reply | (column('emphasis') > 0)),
+        max(3, spam_weight // 2), spam_weight)
+
+    # Los enlaces a dominios permitidos por el servidor no cuentan
+    urls_allowed = column('urls_allowed') > 0
+    for name in ('suspicious_urls', 'suspicious_domains'):
+        weights[:, PATTERN_NAMES.index(name)] = np.where(
+            urls_allowed, 0, weights[:, PATTERN_NAMES.index(name)])
+
+    risk_level = (hits * weights).sum(axis=1)
+
+    # Dominios maliciosos
+    malicious = column('malicious_domains').astype(np.int64)
+    risk_level += malicious * 35
+    suspicious = malicious > 0
+
+    # Reglas personalizadas del servidor
+    custom_hits = column('custom_rule_hits').astype(np.int64)
+    risk_level += custom_hits * CUSTOM_RULE_WEIGHT
+    suspicious |= custom_hits > 0
+
+    # Menciones
+    mentions = column('mentions').astype(np.int64)
+    mention_limit = column('mention_limit').astype(np.int64)
+    excess = mentions > mention_limit
+    penalty = np.maximum(mentions - mention_limit, 0) * 8
+    penalty = np.where(is_reply & (original_length > 30), penalty // 2,
+                       penalty)
+    risk_level += np.where(excess, penalty, 0)
+    suspicious |= excess & (mentions > column('mass_mention_threshold'))
+
+    # Longitud
+    risk_level += np.where((length > 1500) & ~(is_reply | has_attachments),
+                           12, 0)
+    risk_level += np.where((length <= 1500) & (length > 800) & ~is_reply, 5,
+                           0)
+
+    # Unicode
+    unicode_ratio = column('non_ascii_ratio')
+    unicode_checked = (length > 10) & (column('non_ascii') > 0)
+    heavy_unicode = unicode_checked & (unicode_ratio > 0.5) & (
+        column('ascii_stripped_length') < 5)
+    risk_level += np.where(heavy_unicode, 20, 0)
+    suspicious |= heavy_unicode
+    risk_level += np.where(
+        unicode_checked & ~heavy_unicode & (unicode_ratio > 0.3) &
+        (column('ascii_alnum') == 0), 12, 0)
+
+    # Repetición de palabras
+    word_total = column('word_total')
+    risk_level += np.where(
+        (word_total > 5) &
+        (column('max_word_repetition') > word_total * 0.4), 15, 0)
+
+    suspicious |= risk_level > 20
+    risk_level = np.where(ignored, 0, risk_level)
+    suspicious &= ~ignored
+    return risk_level, suspicious
+
+
+def score_messages_batch(messages):
+    """Puntuar muchos mensajes a la vez (mismo resultado que analyze_message_content)"""
+    risk_level, suspicious = score_message_matrix(
+        build_message_feature_matrix(messages))
+    return {'risk_level': risk_level, 'suspicious': suspicious}
+
+
+MEMBER_CRITICAL_KEYWORDS = ['raid', 'nuke', 'destroy', 'massban', 'ddos']
+MEMBER_HIGH_RISK_KEYWORDS = ['spam', 'flood']
+
+
+def score_members_batch(members, now=None):
+    """Evaluar muchos usuarios a la vez (mismo resultado que is_suspicious_user)"""
+    if now is None:
+        now = datetime.utcnow().replace(tzinfo=timezone.utc).timestamp()
+
+    count = len(members)
+    ids = np.fromiter((member.id for member in members),
+                      dtype=np.uint64,
+                      count=count)
+    creation = ((ids >> np.uint64(22)).astype(np.float64) +
+                DISCORD_EPOCH_MS) / 1000
+    hours_old = (now - creation) / 3600
+
+    # Nombre y apodo de cada miembro en una sola línea del texto del lote
+    names = [member.name for member in members]
+    lowers = [name.lower() for name in names]
+    text, starts = joined_rows([
+        f"{name_lower}\n{(member.display_name or '').lower()}"
+        for name_lower, member in zip(lowers, members)
+    ])
+    critical = np.zeros(count, dtype=np.int64)
+    high_risk = np.zeros(count, dtype=np.int64)
+    for keyword in MEMBER_CRITICAL_KEYWORDS:
+        critical[literal_rows([keyword], text, starts)] += 1
+    for keyword in MEMBER_HIGH_RISK_KEYWORDS:
+        high_risk[literal_rows([keyword], text, starts)] += 1
+
+    unique_chars = np.fromiter(map(len, map(set, lowers)),
+                               dtype=np.int64,
+                               count=count)
+    name_length = np.fromiter(map(len, names), dtype=np.int64, count=count)
+    ascii_names = np.fromiter(map(str.isascii, names), dtype=bool, count=count)
+    digits_only = ascii_names & np.fromiter(
+        map(str.isdigit, names), dtype=bool, count=count)
+    random_like = ascii_names & (name_length >= 10) & np.fromiter(
+        map(str.isalnum, names), dtype=bool, count=count)
+    no_avatar = np.fromiter((member.avatar is None for member in members),
+                            dtype=bool,
+                            count=count)
+
+    severity = np.select([hours_old < 2, hours_old < 12, hours_old < 72],
+                         [3, 2, 1], 0)
+    severity += critical * 5 + high_risk * 3
+
+    repetitive = (name_length > 5) & (unique_chars < 3)
+    severity += np.where(repetitive, 2, 0)
+    severity += np.where(~repetitive & (name_length > 10) & (unique_chars < 5),
+                         1, 0)
+
+    severity += np.where(digits_only, 2, 0)
+    severity += np.where(
+        ~digits_only & random_like & (unique_chars < name_length * 0.4), 1, 0)
+
+    severity += np.where(no_avatar & (hours_old < 6), 2, 0)
+    severity += np.where(no_avatar & (hours_old >= 6) & (hours_old < 24), 1,
+                         0)
+
+    severity += np.where((hours_old < 1) & no_avatar & (severity >= 2), 2, 0)
+
+    return {
+        'severity': severity,
+        'suspicious': severity >= 4,
+        'requires_global_ban': critical > 0
+    }
+
+
+# Pipeline escalonado de mensajes
+PREFILTER_MAX_LENGTH = 200
+PREFILTER_RUN_LENGTH = 9  # Repetición mínima de spam_chars, (.)\1{8,}
+
+# Subcadenas sin las que ningún patrón puede sumar riesgo a un mensaje ASCII
+# corto sin menciones. Basta una subcadena necesaria por patrón: 'away' para
+# give.*away y 'nitro' para claim.*nitro. cryptocurrency solo suma 3-8 puntos,
+# pero el riesgo debe ser el mismo que en el análisis completo
+PREFILTER_TRIGGERS = (
+    # Enlaces, invitaciones y menciones
+    'http', 'www.', 'discord', '://', '@',
+    # suspicious_domains
+    'bit.ly', 'tinyurl', 't.co', 'shorturl', 'grabify', 'iplogger',
+    # scam_words
+    'nitro', 'away', 'generator',
+    # cryptocurrency
+    'bitcoin', 'btc', 'eth', 'crypto', 'wallet', 'seed', 'private key'
+) + tuple(MALICIOUS_DOMAINS)
+
+
+def has_repeated_run(content, length=PREFILTER_RUN_LENGTH):
+    """Recorrido lineal: ¿hay algún carácter repetido length veces seguidas?"""
+    previous = None
+    run = 0
+    for char in content:
+        if char == previous:
+            run += 1
+            if run >= length:
+                return True
+        else:
+            previous = char
+            run = 1
+    return False
+
+
+def is_low_risk_message(message):
+    """Etapa 0: propiedades baratas que garantizan que el mensaje no es sospechoso"""
+    content = message.content
+    if len(content) > PREFILTER_MAX_LENGTH or not content.isascii():
+        return False
+
+    if message.mentions or message.role_mentions:
+        return False
+
+    content = content.lower()
+    if any(trigger in content for trigger in PREFILTER_TRIGGERS):
+        return False
+
+    if has_repeated_run(content):
+        return False
+
+    # Condición necesaria para la penalización por repetición de palabras
+    words = content.split()
+    if len(words) > 5 and len(set(words)) < len(words) * 0.6 + 1:
+        return False
+
+    return True
+
+
+class MessagePipelineStats:
+    """Contadores de mensajes resueltos en cada etapa del pipeline"""
+    TIERS = ('bypass', 'minimal', 'cached', 'shed', 'full')
+
+    def __init__(self):
+        self.counts = dict.fromkeys(self.TIERS, 0)
+
+    def record(self, tier):
+        self.counts[tier] += 1
+
+    def fractions(self):
+        total = sum(self.counts.values())
+        return {
+            tier: (count / total if total else 0.0)
+            for tier, count in self.counts.items()
+        }
+
+
+message_pipeline_stats = MessagePipelineStats()
+
+# Caché de veredictos por huella del contenido
+VERDICT_CACHE_SIZE = 4096
+
+
+def message_verdict_key(message):
+    """Huella del contenido normalizado más todo lo que influye en la puntuación"""
+    content = message.content
+    config = get_compiled_config(message.guild.id)
+    return (hashlib.blake2b(content.lower().encode(),
+                            digest_size=16).digest(), len(content),
+            len(message.mentions) + len(message.role_mentions),
+            message.reference is not None, len(message.attachments) > 0,
+            config.mention_limit, config.mass_mention_threshold,
+            get_rule_set(message.guild.id).cache_scope)
+
+
+class VerdictCache:
+    """LRU de resultados de analyze_message_content para contenido repetido"""
+
+    def __init__(self, max_size=VERDICT_CACHE_SIZE):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        analysis = self.entries.get(key)
+        if analysis is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return analysis
+
+    def put(self, key, analysis):
+        self.entries[key] = analysis
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self.entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'size': len(self.entries)
+        }
+
+
+verdict_cache = VerdictCache()
+
+# Degradación gradual según el retraso del bucle de eventos
+LAG_SAMPLE_INTERVAL = 0.25  # Segundos entre muestras
+LAG_LEVELS = (0.1, 0.25, 0.5)  # Retraso (s) para entrar en cada nivel
+LAG_RECOVERY_FACTOR = 0.5  # Bajar de nivel con menos de la mitad del umbral
+LAG_RECOVERY_SAMPLES = 8  # Muestras tranquilas seguidas para bajar un nivel
+SHED_SAMPLE_RATE = 4  # Analizar 1 de cada 4 mensajes de usuarios de bajo riesgo
+SHED_LOW_RISK_SCORE = 20
+LOAD_LEVEL_NAMES = ('normal', 'sin alertas de baja prioridad',
+                    'análisis reducido', 'muestreo de bajo riesgo')
+
+
+class LoadShedder:
+    """Medir el retraso del bucle y decidir qué trabajo se puede omitir"""
+
+    def __init__(self):
+        self.level = 0
+        self.lag = 0.0
+        self.max_lag = 0.0
+        self.shifts = 0
+        self.calm_samples = 0
+        self.shed = {'alerts': 0, 'reduced': 0, 'sampled': 0}
+        self.sample_counter = itertools.count()
+        self.task = None
+
+    def start(self):
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.sample())
+
+    async def sample(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + LAG_SAMPLE_INTERVAL
+            await asyncio.sleep(LAG_SAMPLE_INTERVAL)
+            self.observe(max(0.0, loop.time() - expected))
+
+    def observe(self, lag):
+        self.lag = lag
+        self.max_lag = max(self.max_lag, lag)
+        target = sum(1 for threshold in LAG_LEVELS if lag > threshold)
+
+        if target > self.level:
+            self.calm_samples = 0
+            self.shift(target)
+        elif target < self.level and lag < LAG_LEVELS[
+                self.level - 1] * LAG_RECOVERY_FACTOR:
+            # Recuperación de un nivel en un nivel tras varias muestras tranquilas
+            self.calm_samples += 1
+            if self.calm_samples >= LAG_RECOVERY_SAMPLES:
+                self.calm_samples = 0
+                self.shift(self.level - 1)
+        else:
+            self.calm_samples = 0
+
+    def shift(self, level):
+        print(
+            f'⚙️ Carga: nivel {self.level} → {level} ({LOAD_LEVEL_NAMES[level]}), retraso del bucle {self.lag * 1000:.0f} ms'
+        )
+        self.level = level
+        self.shifts += 1
+
+    def allow_alert(self, priority):
+        if self.level >= 1 and priority == "low":
+            self.shed['alerts'] += 1
+            return False
+        return True
+
+    def extended_checks(self):
+        if self.level >= 2:
+            self.shed['reduced'] += 1
+            return False
+        return True
+
+    def should_skip_analysis(self, user_id):
+        """Muestrear los mensajes de usuarios de bajo riesgo en el nivel máximo"""
+        if self.level < 3:
+            return False
+        activity = user_activity.get(user_id)
+        if activity and activity['risk_score'] >= SHED_LOW_RISK_SCORE:
+            return False
+        if next(self.sample_counter) % SHED_SAMPLE_RATE == 0:
+            return False
+        self.shed['sampled'] += 1
+        return True
+
+    def metrics(self):
+        return {
+            'level': self.level,
+            'level_name': LOAD_LEVEL_NAMES[self.level],
+            'lag_ms': self.lag * 1000,
+            'max_lag_ms': self.max_lag * 1000,
+            'shifts': self.shifts,
+            **self.shed
+        }
+
+
+load_shedder = LoadShedder()
+
+
+def run_message_pipeline(message):
+    """Analizar un mensaje por etapas: filtro barato, caché de veredictos y análisis completo"""
+    rules = get_rule_set(message.guild.id)
+    if is_low_risk_message(message) and not (
+            rules.active and rules.search(message.content.lower())):
+        message_pipeline_stats.record('minimal')
+        return {
+            'suspicious': False,
+            'patterns': [],
+            'risk_level': 0,
+            'reason': []
+        }
+
+    # El spam copiado y pegado se resuelve con una sola búsqueda
+    key = message_verdict_key(message)
+    analysis = verdict_cache.get(key)
+    if analysis is not None:
+        message_pipeline_stats.record('cached')
+        return analysis
+
+    if load_shedder.should_skip_analysis(message.author.id):
+        message_pipeline_stats.record('shed')
+        return {
+            'suspicious': False,
+            'patterns': [],
+            'risk_level': 0,
+            'reason': []
+        }
+
+    message_pipeline_stats.record('full')
+    extended_checks = load_shedder.extended_checks()
+    analysis = analyze_message_content(message, extended_checks)
+    if extended_checks:  # Los veredictos reducidos no se guardan
+        verdict_cache.put(key, analysis)
+    return analysis
+
+
+# Análisis de oleadas de uniones por fecha de creación de cuenta
+DISCORD_EPOCH_MS = 1420070400000
+JOIN_WAVE_WINDOW = 120  # Segundos de uniones recientes a analizar
+JOIN_WAVE_CREATION_SPAN = 600  # Cuentas creadas con menos de 10 min de diferencia
+JOIN_WAVE_MIN_CLUSTER = 5  # Cuentas mínimas en el grupo para considerar oleada
+JOIN_WAVE_CAPACITY = 512  # Uniones retenidas por servidor
+
+
+def snowflake_to_timestamp(snowflake_id):
+    """Obtener el timestamp UNIX de creación codificado en un snowflake"""
+    return ((int(snowflake_id) >> 22) + DISCORD_EPOCH_MS) / 1000
+
+
+class JoinWaveAnalyzer:
+    """Ventana de uniones de un servidor con análisis vectorizado de creación de cuentas"""
+
+    def __init__(self, capacity=JOIN_WAVE_CAPACITY):
+        self.capacity = capacity
+        self.join_times = np.zeros(capacity, dtype=np.float64)
+        self.creation_times = np.zeros(capacity, dtype=np.float64)
+        self.total_joins = 0
+        self.last_result = None
+        self.last_alert = 0.0
+
+    def record_join(self, member_id, join_time=None):
+        """Registrar una unión y recalcular la densidad de creación"""
+        if join_time is None:
+            join_time = time.time()
+
+        slot = self.total_joins % self.capacity
+        self.join_times[slot] = join_time
+        self.creation_times[slot] = snowflake_to_timestamp(member_id)
+        self.total_joins += 1
+
+        self.last_result = self.analyze(join_time)
+        return self.last_result
+
+    def analyze(self, now=None):
+        """Buscar el grupo más denso de cuentas creadas casi a la vez"""
+        if now is None:
+            now = time.time()
+
+        filled = min(self.total_joins, self.capacity)
+        recent = self.join_times[:filled] >= now - JOIN_WAVE_WINDOW
+        creation = np.sort(self.creation_times[:filled][recent])
+
+        cluster_size = 0
+        if creation.size:
+            # Para cada cuenta, cuántas se crearon dentro del intervalo siguiente
+            ends = np.searchsorted(creation,
+                                   creation + JOIN_WAVE_CREATION_SPAN,
+                                   side='right')
+            cluster_size = int((ends - np.arange(creation.size)).max())
+
+        wave_detected = cluster_size >= JOIN_WAVE_MIN_CLUSTER
+        confidence_boost = 0
+        if wave_detected:
+            confidence_boost = min(
+                40, 20 + (cluster_size - JOIN_WAVE_MIN_CLUSTER) * 4)
+
+        return {
+            'recent_joins': int(creation.size),
+            'cluster_size': cluster_size,
+            'wave_detected': wave_detected,
+            'confidence_boost': confidence_boost
+        }
+
+    def should_alert(self, now=None):
+        """Evitar repetir la alerta durante la misma oleada"""
+        if now is None:
+            now = time.time()
+        if now - self.last_alert < JOIN_WAVE_WINDOW:
+            return False
+        self.last_alert = now
+        return True
+
+
+join_wave_analyzers = defaultdict(JoinWaveAnalyzer)
+
+# Índice de uniones por servidor en cubetas de un segundo
+JOIN_INDEX_SPAN = 900  # Segundos cubiertos (15 minutos)
+JOIN_BURST_WINDOW = 10  # Segundos para el detector rápido de ráfagas
+JOIN_BURST_MIN = 5
+
+
+class JoinIndex:
+    """Anillo de cubetas de un segundo con totales acumulados por servidor"""
+
+    def __init__(self, span=JOIN_INDEX_SPAN):
+        self.span = span
+        self.slots = span + 1
+        # cumulative[s % slots] = uniones totales hasta el final del segundo s
+        self.cumulative = [0] * self.slots
+        self.total = 0
+        self.last_second = None
+
+    def advance(self, second):
+        """Rellenar los segundos sin uniones hasta `second`"""
+        if self.last_second is None:
+            self.last_second = second
+            return
+        if second <= self.last_second:
+            return
+        start = max(self.last_second + 1, second - self.slots + 1)
+        for skipped in range(start, second + 1):
+            self.cumulative[skipped % self.slots] = self.total
+        self.last_second = second
+
+    def record(self, join_time=None):
+        second = int(join_time if join_time is not None else time.time())
+        self.advance(second)
+        second = self.last_second  # Relojes que retroceden cuentan en el último segundo
+        self.total += 1
+        self.cumulative[second % self.slots] = self.total
+
+    def cumulative_at(self, second):
+        if self.last_second is None or second >= self.last_second:
+            return self.total
+        second = max(second, self.last_second - self.span)
+        return self.cumulative[second % self.slots]
+
+    def joins_in_last(self, seconds, now=None):
+        """Uniones en los últimos `seconds` segundos en O(1)"""
+        now_second = int(now if now is not None else time.time())
+        seconds = min(int(seconds), self.span)
+        return self.total - self.cumulative_at(now_second - seconds)
+
+
+join_indexes = defaultdict(JoinIndex)
+
+# Series temporales por minuto y servidor (últimos 7 días)
+TIMESERIES_MINUTES = 7 * 24 * 60
+TIMESERIES_METRICS = ('messages', 'joins', 'suspicious', 'deletes', 'bans',
+                      'quarantines')
+BASELINE_WINDOW = 10  # Minutos recientes que se comparan con lo habitual
+BASELINE_EXCLUDE = 60  # La última hora no forma parte de lo habitual
+BASELINE_MIN_HISTORY = 6 * 60  # Historia mínima para fiarse de la línea base
+BASELINE_SIGMAS = 4  # Desviaciones sobre la media para considerar anomalía
+
+
+class GuildTimeSeries:
+    """Contadores por minuto en buffers circulares, uno por métrica y reservado con su primer evento"""
+
+    def __init__(self, minutes=TIMESERIES_MINUTES):
+        self.minutes = minutes
+        self.rows = {}  # métrica -> contadores por minuto (np.uint32)
+        self.first_minute = None
+        self.last_minute = None
+
+    def advance(self, minute):
+        """Vaciar los minutos sin eventos hasta `minute`"""
+        if self.last_minute is None:
+            self.first_minute = self.last_minute = minute
+            return
+        gap = minute - self.last_minute
+        if gap <= 0:
+            return
+        if gap >= self.minutes:
+            for row in self.rows.values():
+                row[:] = 0
+        elif self.rows:
+            stale = np.arange(self.last_minute + 1, minute + 1) % self.minutes
+            for row in self.rows.values():
+                row[stale] = 0
+        self.last_minute = minute
+
+    def record(self, metric, amount=1, now=None):
+        """Sumar eventos al minuto actual en O(1)"""
+        minute = int((now if now is not None else time.time()) // 60)
+        self.advance(minute)
+        if minute <= self.last_minute - self.minutes:
+            return  # Fuera de la ventana
+        row = self.rows.get(metric)
+        if row is None:
+            # La mayoría de servidores nunca registra bans o cuarentenas
+            row = self.rows[metric] = np.zeros(self.minutes, dtype=np.uint32)
+        row[minute % self.minutes] += amount
+
+    def window(self, metric, minutes, now=None):
+        """Eventos por minuto de los últimos `minutes` minutos, del más antiguo al actual"""
+        minutes = min(int(minutes), self.minutes)
+        if self.last_minute is None:
+            return np.zeros(minutes, dtype=np.uint32)
+        self.advance(int((now if now is not None else time.time()) // 60))
+        row = self.rows.get(metric)
+        if row is None:
+            return np.zeros(minutes, dtype=np.uint32)
+        start = self.last_minute - minutes + 1
+        return row[np.arange(start, self.last_minute + 1) % self.minutes]
+
+    def history_minutes(self):
+        if self.last_minute is None:
+            return 0
+        return min(self.minutes, self.last_minute - self.first_minute + 1)
+
+    def baseline(self, metric, window=BASELINE_WINDOW, now=None):
+        """Últimos `window` minutos frente a todas las ventanas iguales anteriores (sin la última hora)"""
+        history = self.history_minutes()
+        if history < BASELINE_MIN_HISTORY:
+            return None
+
+        counts = self.window(metric, history, now).astype(np.int64)
+        past = counts[:-BASELINE_EXCLUDE]
+        past = past[len(past) % window:].reshape(-1, window).sum(axis=1)
+        recent = int(counts[-window:].sum())
+        mean = float(past.mean())
+        std = float(past.std())
+        return {
+            'recent': recent,
+            'mean': mean,
+            'std': std,
+            'anomalous': recent > mean + BASELINE_SIGMAS * max(std, 1.0)
+        }
+
+    def to_arrays(self):
+        return {
+            'first_minute': self.first_minute,
+            'last_minute': self.last_minute,
+            # Copias: se serializan fuera del bucle
+            'rows': {metric: row.copy() for metric, row in self.rows.items()}
+        }
+
+    def load_arrays(self, arrays):
+        rows = arrays.get('rows')
+        if rows is None and 'counts' in arrays:
+            # Instantáneas antiguas: una matriz con todas las métricas
+            rows = {
+                metric: counts
+                for metric, counts in zip(TIMESERIES_METRICS, arrays['counts'])
+                if counts.any()
+            }
+        rows = {
+            metric: np.array(row, dtype=np.uint32)
+            for metric, row in (rows or {}).items()
+            if metric in TIMESERIES_METRICS and len(row) == self.minutes
+        }
+        if not rows:
+            return
+        self.rows = rows
+        self.first_minute = arrays['first_minute']
+        self.last_minute = arrays['last_minute']
+
+
+activity_series = defaultdict(GuildTimeSeries)
+
+
+def record_guild_event(guild_id, metric, amount=1):
+    """Registrar eventos de un servidor en su serie temporal"""
+    activity_series[guild_id].record(metric, amount)
+
+# Índice de n-gramas para oleadas de nombres similares
+NAME_CLUSTER_WINDOW = 600  # Segundos que un nombre permanece en el índice
+NAME_CLUSTER_MIN = 4  # Cuentas similares para considerar oleada
+NAME_SIMILARITY = 0.6  # Jaccard mínimo entre trigramas
+NAME_NGRAM = 3
+NAME_MINHASH_BANDS = 6
+NAME_MINHASH_ROWS = 4
+NAME_CANDIDATE_LIMIT = 64  # Candidatos verificados como máximo por unión
+NAME_MINHASH_PRIME = (1 << 31) - 1
+NAME_MINHASH_A = np.random.default_rng(39).integers(
+    1, NAME_MINHASH_PRIME, NAME_MINHASH_BANDS * NAME_MINHASH_ROWS,
+    dtype=np.uint64)
+NAME_MINHASH_B = np.random.default_rng(40).integers(
+    0, NAME_MINHASH_PRIME, NAME_MINHASH_BANDS * NAME_MINHASH_ROWS,
+    dtype=np.uint64)
+NAME_DIGIT_TABLE = str.maketrans('123456789', '000000000')
+
+
+def name_shingles(name):
+    """Trigramas del nombre normalizado (homoglifos y dígitos unificados)"""
+    text = name.lower().translate(SKELETON_TABLE).translate(NAME_DIGIT_TABLE)
+    text = f'^{text}$'
+    if len(text) <= NAME_NGRAM:
+        return frozenset([text])
+    return frozenset(text[i:i + NAME_NGRAM]
+                     for i in range(len(text) - NAME_NGRAM + 1))
+
+
+def name_band_keys(shingles):
+    """Claves LSH: bandas de la firma MinHash de los trigramas"""
+    hashes = np.fromiter(
+        (hash(shingle) & 0x7FFFFFFF for shingle in shingles),
+        dtype=np.uint64,
+        count=len(shingles))
+    signature = ((NAME_MINHASH_A[:, None] * hashes[None, :] + NAME_MINHASH_B[:, None])
+                 % NAME_MINHASH_PRIME).min(axis=1)
+    return [(band, signature[band * NAME_MINHASH_ROWS:(band + 1) *
+                             NAME_MINHASH_ROWS].tobytes())
+            for band in range(NAME_MINHASH_BANDS)]
+
+
+def jaccard(first, second):
+    return len(first & second) / len(first | second)
+
+
+class NameClusterIndex:
+    """Nombres de uniones recientes de un servidor indexados por bandas MinHash"""
+
+    def __init__(self, window=NAME_CLUSTER_WINDOW):
+        self.window = window
+        self.members = OrderedDict()  # member_id -> (hora, trigramas, claves)
+        self.buckets = defaultdict(set)
+        self.flagged = set()
+
+    def expire(self, now):
+        while self.members:
+            member_id, (joined_at, _, keys) = next(iter(self.members.items()))
+            if joined_at > now - self.window:
+                break
+            self.forget(member_id)
+
+    def forget(self, member_id):
+        entry = self.members.pop(member_id, None)
+        if entry is None:
+            return
+        self.flagged.discard(member_id)
+        for key in entry[2]:
+            bucket = self.buckets[key]
+            bucket.discard(member_id)
+            if not bucket:
+                del self.buckets[key]
+
+    def record(self, member_id, names, now=None):
+        """Registrar una unión y devolver las cuentas recientes con nombre similar"""
+        now = now if now is not None else time.time()
+        self.expire(now)
+
+        shingle_sets = list({name_shingles(name) for name in names if name})
+        keys = set()
+        for shingles in shingle_sets:
+            keys.update(name_band_keys(shingles))
+
+        # Solo se comparan los candidatos que comparten alguna banda
+        candidates = set()
+        for key in keys:
+            candidates.update(self.buckets.get(key, ()))
+            if len(candidates) >= NAME_CANDIDATE_LIMIT:
+                break
+        candidates.discard(member_id)
+
+        similar = [
+            candidate for candidate in itertools.islice(
+                candidates, NAME_CANDIDATE_LIMIT)
+            if any(
+                jaccard(shingles, other) >= NAME_SIMILARITY
+                for shingles in shingle_sets
+                for other in self.members[candidate][1])
+        ]
+
+        self.forget(member_id)
+        self.members[member_id] = (now, shingle_sets, keys)
+        for key in keys:
+            self.buckets[key].add(member_id)
+
+        return similar
+
+    def claim_unflagged(self, member_ids):
+        """Marcar como tratadas las cuentas del grupo que aún no lo estaban"""
+        unflagged = [
+            member_id for member_id in member_ids
+            if member_id not in self.flagged
+        ]
+        self.flagged.update(unflagged)
+        return unflagged
+
+
+name_cluster_indexes = defaultdict(NameClusterIndex)
+
+# Índice de avatares compartidos por cuentas que se unen
+AVATAR_CLUSTER_WINDOW = 600  # Segundos que una unión permanece en el índice
+AVATAR_CLUSTER_MIN = 4  # Cuentas con el mismo avatar para considerar oleada
+
+
+class AvatarIndex:
+    """Uniones recientes de un servidor agrupadas por hash de avatar"""
+
+    def __init__(self, window=AVATAR_CLUSTER_WINDOW):
+        self.window = window
+        self.joiners = defaultdict(OrderedDict)  # avatar -> member_id -> hora
+        self.order = deque()  # (hora, avatar, member_id) en orden de unión
+        self.flagged = set()
+
+    def expire(self, now):
+        while self.order and self.order[0][0] <= now - self.window:
+            joined_at, avatar_key, member_id = self.order.popleft()
+            joiners = self.joiners.get(avatar_key)
+            if joiners is None or joiners.get(member_id) != joined_at:
+                continue  # Se volvió a unir después
+            del joiners[member_id]
+            self.flagged.discard(member_id)
+            if not joiners:
+                del self.joiners[avatar_key]
+
+    def record(self, avatar_key, member_id, now=None):
+        """Registrar una unión y devolver las cuentas recientes con el mismo avatar"""
+        now = now if now is not None else time.time()
+        self.expire(now)
+
+        joiners = self.joiners[avatar_key]
+        joiners.pop(member_id, None)
+        same_avatar = list(joiners)
+        joiners[member_id] = now
+        self.order.append((now, avatar_key, member_id))
+        return same_avatar
+
+    def claim_unflagged(self, member_ids):
+        """Marcar como tratadas las cuentas del grupo que aún no lo estaban"""
+        unflagged = [
+            member_id for member_id in member_ids
+            if member_id not in self.flagged
+        ]
+        self.flagged.update(unflagged)
+        return unflagged
+
+
+avatar_indexes = defaultdict(AvatarIndex)
+
+# Avatares de oleadas vistos en varios servidores
+BAD_AVATAR_MIN_GUILDS = 2  # Servidores distintos con oleada para marcarlo globalmente
+BAD_AVATAR_TTL = 30 * 24 * 3600  # Segundos sin oleadas antes de olvidar un servidor
+
+
+class BadAvatarIndex:
+    """Avatares usados en oleadas, marcados solo si se repiten en varios servidores"""
+
+    def __init__(self, min_guilds=BAD_AVATAR_MIN_GUILDS, ttl=BAD_AVATAR_TTL):
+        self.min_guilds = min_guilds
+        self.ttl = ttl
+        self.entries = {}  # avatar -> guild_id -> hora de la última oleada
+        self.dirty = False
+
+    def __len__(self):
+        now = time.time()
+        return sum(1 for avatar_key in self.entries
+                   if self.is_bad(avatar_key, now))
+
+    def record(self, avatar_key, guild_id, now=None):
+        """Registrar una oleada con este avatar en un servidor"""
+        now = now if now is not None else time.time()
+        self.entries.setdefault(avatar_key, {})[guild_id] = now
+        self.dirty = True
+
+    def is_bad(self, avatar_key, now=None):
+        guilds = self.entries.get(avatar_key)
+        if not guilds or len(guilds) < self.min_guilds:
+            return False
+        now = now if now is not None else time.time()
+        recent = sum(1 for seen in guilds.values() if seen > now - self.ttl)
+        return recent >= self.min_guilds
+
+    def remove(self, avatar_key):
+        """Quitar un avatar; devuelve False si no estaba"""
+        if self.entries.pop(avatar_key, None) is None:
+            return False
+        self.dirty = True
+        return True
+
+    def expire(self, now=None):
+        now = now if now is not None else time.time()
+        for avatar_key in list(self.entries):
+            guilds = self.entries[avatar_key]
+            for guild_id, seen in list(guilds.items()):
+                if seen <= now - self.ttl:
+                    del guilds[guild_id]
+                    self.dirty = True
+            if not guilds:
+                del self.entries[avatar_key]
+
+    def to_data(self):
+        return {
+            avatar_key: {str(guild_id): seen
+                         for guild_id, seen in guilds.items()}
+            for avatar_key, guilds in self.entries.items()
+        }
+
+    def load(self, data):
+        self.entries = {}
+        self.dirty = False
+        if isinstance(data, list):
+            return  # Formato antiguo: cada hash venía de una sola oleada
+        for avatar_key, guilds in data.items():
+            self.entries[avatar_key] = {
+                int(guild_id): seen
+                for guild_id, seen in guilds.items()
+            }
+
+
+bad_avatars = BadAvatarIndex()
+
+
 def detect_raid_pattern(guild_id):
     """Detectar patrones de raid con análisis adaptativo y reducción de falsos positivos"""
     current_time = datetime.utcnow()
@@ -422,31 +2907,52 @@ def detect_raid_pattern(guild_id):
     coordinated_users = 0
     similar_patterns = 0
 
-    for user_id, activity in user_activity.items():
-        risk_score = calculate_risk_score(user_id, guild_id)
+    # Uniones de este servidor por ventana, directamente del índice
+    join_index = join_indexes.get(guild_id) or JoinIndex()
+    now = time.time()
+    stats['2min']['joins'] = join_index.joins_in_last(120, now)
+    stats['5min']['joins'] = join_index.joins_in_last(300, now)
+    stats['15min']['joins'] = join_index.joins_in_last(900, now)
+    burst_joins = join_index.joins_in_last(JOIN_BURST_WINDOW, now)
+
+    # Solo usuarios con actividad reciente en este servidor, según su clasificación
+    board = guild_risk_boards.get(guild_id) or GuildRiskBoard()
+    recent_users = [
+        user_id for user_id, last_seen in board.last_seen.items()
+        if last_seen > threshold_15min
+    ]
 
-        # Contar actividad por ventanas
-        for window, threshold in [('2min', threshold_2min),
-                                  ('5min', threshold_5min),
-                                  ('15min', threshold_15min)]:
-            user_joins = sum(1 for join in activity['joins']
-                             if join > threshold)
-            user_messages = sum(1 for msg in activity['messages']
-                                if msg['timestamp'] > threshold)
-            user_suspicious = sum(1 for msg in activity['messages']
-                                  if msg['timestamp'] > threshold
-                                  and msg.get('suspicious', False))
+    for user_id in recent_users:
+        activity = user_activity.get(user_id)
+        if activity is None:
+            continue
 
-            stats[window]['joins'] += user_joins
-            stats[window]['messages'] += user_messages
-            stats[window]['suspicious_messages'] += user_suspicious
+        if calculate_risk_score(user_id, guild_id) > 70:
+            last_seen = board.last_seen[user_id]
+            stats['15min']['high_risk'] += 1
+            stats['5min']['high_risk'] += last_seen > threshold_5min
+            stats['2min']['high_risk'] += last_seen > threshold_2min
 
-            if risk_score > 70:
-                stats[window]['high_risk'] += 1
+        # Contar los mensajes de este servidor por ventanas en una sola pasada
+        recent_messages = [
+            msg for msg in activity['messages']
+            if msg['timestamp'] > threshold_15min
+            and msg.get('guild') == guild_id
+        ]
+        for msg in recent_messages:
+            suspicious = msg.get('suspicious', False)
+            stats['15min']['messages'] += 1
+            stats['15min']['suspicious_messages'] += suspicious
+            if msg['timestamp'] > threshold_5min:
+                stats['5min']['messages'] += 1
+                stats['5min']['suspicious_messages'] += suspicious
+                if msg['timestamp'] > threshold_2min:
+                    stats['2min']['messages'] += 1
+                    stats['2min']['suspicious_messages'] += suspicious
 
         # Detectar actividad coordinada (usuarios con patrones similares)
         recent_messages = [
-            msg for msg in activity['messages']
+            msg for msg in recent_messages
             if msg['timestamp'] > threshold_5min
         ]
         if len(recent_messages) > 3:
@@ -472,6 +2978,8 @@ def detect_raid_pattern(guild_id):
 
     # Determinar indicadores de raid con umbrales adaptativos
     raid_indicators = {
+        'join_burst':
+        burst_joins >= max(JOIN_BURST_MIN, base_join_threshold),
         'mass_join_critical':
         stats['2min']['joins']
         > base_join_threshold * 2,  # Uniones muy rápidas
@@ -493,10 +3001,32 @@ def detect_raid_pattern(guild_id):
          and stats['15min']['messages'] > base_message_threshold * 3)
     }
 
+    # Oleada de cuentas creadas casi a la vez (análisis vectorizado)
+    join_wave = None
+    if guild_id in join_wave_analyzers:
+        join_wave = join_wave_analyzers[guild_id].analyze()
+    raid_indicators['creation_time_cluster'] = bool(
+        join_wave and join_wave['wave_detected'])
+
+    # Comparar con la actividad habitual del servidor en los últimos 7 días
+    join_baseline = message_baseline = None
+    if guild_id in activity_series:
+        series = activity_series[guild_id]
+        join_baseline = series.baseline('joins')
+        message_baseline = series.baseline('messages')
+    raid_indicators['join_rate_anomaly'] = bool(
+        join_baseline and join_baseline['anomalous']
+        and join_baseline['recent'] > base_join_threshold)
+    raid_indicators['message_rate_anomaly'] = bool(
+        message_baseline and message_baseline['anomalous']
+        and message_baseline['recent'] > base_message_threshold)
+
     # Calcular nivel de confianza del raid
     confidence_score = 0
     if raid_indicators['mass_join_critical']:
         confidence_score += 30
+    if raid_indicators['join_burst']:
+        confidence_score += 15
     if raid_indicators['message_flood_critical']:
         confidence_score += 25
     if raid_indicators['coordinated_activity']:
@@ -505,6 +3035,12 @@ def detect_raid_pattern(guild_id):
         confidence_score += 15
     if raid_indicators['sustained_activity']:
         confidence_score += 10
+    if raid_indicators['creation_time_cluster']:
+        confidence_score += join_wave['confidence_boost']
+    if raid_indicators['join_rate_anomaly']:
+        confidence_score += 15
+    if raid_indicators['message_rate_anomaly']:
+        confidence_score += 10
 
     # Solo reportar raid si hay suficiente confianza
     raid_indicators['confirmed_raid'] = confidence_score >= 40
@@ -515,8 +3051,7 @@ def detect_raid_pattern(guild_id):
 
 async def send_alert(guild, message, user=None, priority="normal"):
     """Enviar alerta al canal configurado con niveles de prioridad"""
-    config = get_server_config(guild.id)
-    alert_channel_id = config.get('alert_channel')
+    alert_channel_id = get_compiled_config(guild.id).alert_channel
 
     if alert_channel_id:
         channel = guild.get_channel(alert_channel_id)
@@ -570,9 +3105,8 @@ def is_suspicious_bot(member):
 
     # Verificar nombre del bot con coincidencias exactas
     name_lower = member.name.lower()
-    critical_keywords = ['raid', 'nuke', 'destroy', 'massban',
-                         'ddos']  # Estos causan ban global
-    high_risk_keywords = ['spam', 'flood']
+    critical_keywords = MEMBER_CRITICAL_KEYWORDS  # Estos causan ban global
+    high_risk_keywords = MEMBER_HIGH_RISK_KEYWORDS
     medium_risk_keywords = ['ghost', 'webhook', 'selfbot', 'token']
 
     for keyword in critical_keywords:
@@ -653,9 +3187,8 @@ def is_suspicious_user(member):
     display_name_lower = member.display_name.lower(
     ) if member.display_name else ""
 
-    critical_keywords = ['raid', 'nuke', 'destroy', 'massban',
-                         'ddos']  # Estos causan ban global
-    high_risk_keywords = ['spam', 'flood']
+    critical_keywords = MEMBER_CRITICAL_KEYWORDS  # Estos causan ban global
+    high_risk_keywords = MEMBER_HIGH_RISK_KEYWORDS
 
     for keyword in critical_keywords:
         if keyword in name_lower or keyword in display_name_lower:
@@ -696,87 +3229,350 @@ def is_suspicious_user(member):
     elif member.avatar is None and hours_old < 24:
         severity_score += 1
 
-    # Verificar combinación de factores peligrosos para ban global
-    if hours_old < 1 and member.avatar is None and severity_score >= 2:
-        reasons.append(
-            "Combinación crítica: cuenta nueva, sin avatar y nombre sospechoso"
-        )
-        severity_score += 2
+    # Verificar combinación de factores peligrosos para ban global
+    if hours_old < 1 and member.avatar is None and severity_score >= 2:
+        reasons.append(
+            "Combinación crítica: cuenta nueva, sin avatar y nombre sospechoso"
+        )
+        severity_score += 2
+
+        # Si tiene nombre crítico y es muy nuevo, ban global
+        if any(keyword in name_lower or keyword in display_name_lower
+               for keyword in critical_keywords):
+            requires_global_ban = True
+
+    # Solo considerar sospechoso si hay suficientes indicadores
+    return severity_score >= 4, reasons, requires_global_ban
+
+
+async def quarantine_user(member, reason="Actividad sospechosa"):
+    """Poner usuario en cuarentena"""
+    quarantine_role_id = get_compiled_config(member.guild.id).quarantine_role
+
+    if quarantine_role_id:
+        quarantine_role = member.guild.get_role(quarantine_role_id)
+        if quarantine_role:
+            try:
+                await member.add_roles(quarantine_role, reason=reason)
+                return True
+            except discord.Forbidden:
+                pass
+
+    return False
+
+
+def build_ban_notification(is_global=False, guild_name=None, reason=None):
+    """Construir el embed de notificación de ban"""
+    embed = discord.Embed(title="🚫 Has sido baneado",
+                          color=discord.Color.red(),
+                          timestamp=datetime.utcnow())
+
+    if is_global:
+        embed.description = f"**Has recibido un ban global por actividad extremadamente peligrosa.**"
+        embed.add_field(
+            name="📋 Detalles:",
+            value=
+            f"• **Tipo**: Ban Global\n• **Razón**: {reason or 'Actividad maliciosa detectada'}\n• **Alcance**: Todos los servidores con Exside",
+            inline=False)
+    else:
+        embed.description = f"**Has sido baneado del servidor: {guild_name}**"
+        embed.add_field(
+            name="📋 Detalles:",
+            value=
+            f"• **Servidor**: {guild_name}\n• **Razón**: {reason or 'Violación de las normas de seguridad'}",
+            inline=False)
+
+    embed.add_field(
+        name="⚖️ ¿Crees que es un error?",
+        value=
+        "Si consideras que este ban fue aplicado incorrectamente, puedes apelar la sanción en nuestro servidor de soporte:",
+        inline=False)
+
+    embed.add_field(name="🔗 Servidor de Soporte",
+                    value="https://discord.gg/4JFmFxZEyR",
+                    inline=False)
+
+    embed.add_field(
+        name="ℹ️ Información Adicional",
+        value=
+        "• Nuestro equipo revisará tu apelación en un plazo de 24-48 horas\n• Proporciona toda la información relevante en tu apelación\n• Los bans por actividad maliciosa son tomados muy en serio",
+        inline=False)
+
+    return embed
+
+
+# Planificador de presupuesto REST por ruta
+PROTECTIVE_ACTIONS = {'ban', 'delete', 'quarantine'}
+COSMETIC_RESERVE = 1  # Peticiones por ruta reservadas a acciones protectoras
+COSMETIC_BACKOFF = 0.5  # Espera de las acciones cosméticas mientras hay urgentes
+MAJOR_ROUTE_PARAMS = ('channels', 'guilds', 'webhooks')
 
-        # Si tiene nombre crítico y es muy nuevo, ban global
-        if any(keyword in name_lower or keyword in display_name_lower
-               for keyword in critical_keywords):
-            requires_global_ban = True
 
-    # Solo considerar sospechoso si hay suficientes indicadores
-    return severity_score >= 4, reasons, requires_global_ban
+def rest_route(method, path):
+    """Normalizar una ruta REST conservando solo sus parámetros principales"""
+    segments = path.split('?', 1)[0].strip('/').split('/')
+    if len(segments) > 1 and segments[0] == 'api' and segments[1][:1] == 'v':
+        segments = segments[2:]
 
+    normalized = []
+    for index, segment in enumerate(segments):
+        if segment.isdigit() and (index == 0 or segments[index - 1]
+                                  not in MAJOR_ROUTE_PARAMS):
+            segment = '{id}'
+        normalized.append(segment)
 
-async def quarantine_user(member, reason="Actividad sospechosa"):
-    """Poner usuario en cuarentena"""
-    config = get_server_config(member.guild.id)
-    quarantine_role_id = config.get('quarantine_role')
+    return f"{method.upper()} /{'/'.join(normalized)}"
 
-    if quarantine_role_id:
-        quarantine_role = member.guild.get_role(quarantine_role_id)
-        if quarantine_role:
+
+class RestBudgetScheduler:
+    """Presupuesto de rate limit por ruta: prioriza acciones protectoras y pospone las cosméticas"""
+
+    def __init__(self):
+        self.routes = {}  # ruta -> [restantes, momento de reinicio]
+        self.global_reset_at = 0.0
+        self.blocked_protective = 0
+        self.stats = {
+            'observed': 0,
+            'rate_limited': 0,
+            'global_limited': 0,
+            'protective_waits': 0,
+            'deferred': 0
+        }
+
+    def observe(self, method, path, status, headers):
+        """Actualizar el presupuesto con las cabeceras de una respuesta"""
+        route = rest_route(method, path)
+        now = time.monotonic()
+        self.stats['observed'] += 1
+
+        if 'X-RateLimit-Remaining' in headers:
             try:
-                await member.add_roles(quarantine_role, reason=reason)
-                return True
-            except discord.Forbidden:
+                self.routes[route] = [
+                    int(headers['X-RateLimit-Remaining']),
+                    now + float(headers.get('X-RateLimit-Reset-After', 0))
+                ]
+            except ValueError:
                 pass
 
-    return False
+        if status == 429:
+            self.stats['rate_limited'] += 1
+            try:
+                retry_after = float(headers.get('Retry-After', 1))
+            except ValueError:
+                retry_after = 1.0
+
+            if (headers.get('X-RateLimit-Global', '').lower() == 'true'
+                    or headers.get('X-RateLimit-Scope') == 'global'):
+                self.stats['global_limited'] += 1
+                self.global_reset_at = max(self.global_reset_at,
+                                           now + retry_after)
+            else:
+                self.routes[route] = [0, now + retry_after]
+
+    def delay_for(self, route, kind):
+        """Segundos que debe esperar una acción antes de usar la ruta"""
+        now = time.monotonic()
+        delay = max(0.0, self.global_reset_at - now)
+
+        budget = self.routes.get(route)
+        if budget:
+            remaining, reset_at = budget
+            if reset_at <= now:
+                del self.routes[route]
+            else:
+                reserve = 0 if kind in PROTECTIVE_ACTIONS else COSMETIC_RESERVE
+                if remaining <= reserve:
+                    delay = max(delay, reset_at - now)
 
+        # Las acciones cosméticas ceden mientras haya protectoras bloqueadas
+        if kind not in PROTECTIVE_ACTIONS and self.blocked_protective:
+            delay = max(delay, COSMETIC_BACKOFF)
 
-async def send_ban_notification(user,
-                                is_global=False,
-                                guild_name=None,
-                                reason=None):
-    """Enviar notificación de ban al usuario"""
-    try:
-        embed = discord.Embed(title="🚫 Has sido baneado",
-                              color=discord.Color.red(),
-                              timestamp=datetime.utcnow())
-
-        if is_global:
-            embed.description = f"**Has recibido un ban global por actividad extremadamente peligrosa.**"
-            embed.add_field(
-                name="📋 Detalles:",
-                value=
-                f"• **Tipo**: Ban Global\n• **Razón**: {reason or 'Actividad maliciosa detectada'}\n• **Alcance**: Todos los servidores con Exside",
-                inline=False)
-        else:
-            embed.description = f"**Has sido baneado del servidor: {guild_name}**"
-            embed.add_field(
-                name="📋 Detalles:",
-                value=
-                f"• **Servidor**: {guild_name}\n• **Razón**: {reason or 'Violación de las normas de seguridad'}",
-                inline=False)
+        return delay
 
-        embed.add_field(
-            name="⚖️ ¿Crees que es un error?",
-            value=
-            "Si consideras que este ban fue aplicado incorrectamente, puedes apelar la sanción en nuestro servidor de soporte:",
-            inline=False)
+    async def acquire(self, route, kind):
+        """Esperar a que la ruta tenga presupuesto para este tipo de acción"""
+        protective = kind in PROTECTIVE_ACTIONS
+        blocked = False
+        try:
+            while True:
+                delay = self.delay_for(route, kind)
+                if delay <= 0:
+                    break
 
-        embed.add_field(name="🔗 Servidor de Soporte",
-                        value="https://discord.gg/4JFmFxZEyR",
-                        inline=False)
+                if protective:
+                    if not blocked:
+                        blocked = True
+                        self.blocked_protective += 1
+                    self.stats['protective_waits'] += 1
+                else:
+                    self.stats['deferred'] += 1
+                await asyncio.sleep(delay)
+        finally:
+            if blocked:
+                self.blocked_protective -= 1
+
+        # Consumir presupuesto localmente hasta recibir la próxima respuesta
+        budget = self.routes.get(route)
+        if budget and budget[0] > 0:
+            budget[0] -= 1
+
+    def metrics(self):
+        metrics = dict(self.stats)
+        metrics['tracked_routes'] = len(self.routes)
+        metrics['blocked_protective'] = self.blocked_protective
+        return metrics
+
+
+rest_scheduler = RestBudgetScheduler()
+
+
+async def on_rest_request_end(session, context, params):
+    """Traza aiohttp: registrar el presupuesto devuelto por cada respuesta"""
+    rest_scheduler.observe(params.method, params.url.path,
+                           params.response.status, params.response.headers)
+
+
+rest_trace.on_request_end.append(on_rest_request_end)
+
+
+# Cola de notificaciones por DM
+DM_DEDUP_WINDOW = 600  # Segundos en los que se descarta la misma notificación
+DM_WORKERS = 2
+DM_QUEUE_SIZE = 2000
+DM_MAX_ATTEMPTS = 4
+DM_CLOSED_TTL = 6 * 3600  # Segundos que se recuerda que un usuario cerró sus DMs
+DM_CANNOT_MESSAGE_USER = 50007  # Código de Discord para DMs rechazados
+DM_ROUTE = rest_route('POST', '/users/@me/channels')  # Crear el canal de DM
+
+
+class DirectMessageQueue:
+    """Envío de DMs fuera del camino crítico con deduplicación y reintentos"""
+
+    def __init__(self, workers=DM_WORKERS, maxsize=DM_QUEUE_SIZE):
+        self.worker_count = workers
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.recent = {}  # clave -> momento del último envío encolado
+        self.closed_dms = {}  # Usuarios con los DMs cerrados -> caducidad
+        self.workers = []
+        self.stats = {
+            'queued': 0,
+            'sent': 0,
+            'duplicates': 0,
+            'closed': 0,
+            'skipped_closed': 0,
+            'rate_limited': 0,
+            'failed': 0,
+            'dropped': 0
+        }
 
-        embed.add_field(
-            name="ℹ️ Información Adicional",
-            value=
-            "• Nuestro equipo revisará tu apelación en un plazo de 24-48 horas\n• Proporciona toda la información relevante en tu apelación\n• Los bans por actividad maliciosa son tomados muy en serio",
-            inline=False)
+    def submit(self, user, embed, key):
+        """Encolar un DM salvo que esté duplicado o el usuario no acepte DMs"""
+        now = time.monotonic()
+        closed_until = self.closed_dms.get(user.id)
+        if closed_until is not None:
+            if now < closed_until:
+                self.stats['skipped_closed'] += 1
+                return False
+            del self.closed_dms[user.id]
+
+        last_sent = self.recent.get(key)
+        if last_sent is not None and now - last_sent < DM_DEDUP_WINDOW:
+            self.stats['duplicates'] += 1
+            return False
+
+        try:
+            self.queue.put_nowait((user, embed))
+        except asyncio.QueueFull:
+            self.stats['dropped'] += 1
+            return False
+
+        self.recent[key] = now
+        self.stats['queued'] += 1
+
+        # Purgar claves fuera de la ventana para acotar memoria
+        if len(self.recent) > 10000:
+            self.recent = {
+                k: t
+                for k, t in self.recent.items() if now - t < DM_DEDUP_WINDOW
+            }
+        if len(self.closed_dms) > 10000:
+            self.closed_dms = {
+                user_id: closed_until
+                for user_id, closed_until in self.closed_dms.items()
+                if closed_until > now
+            }
+        return True
 
-        await user.send(embed=embed)
+    def start(self):
+        """Iniciar los workers si no están corriendo"""
+        self.workers = [task for task in self.workers if not task.done()]
+        while len(self.workers) < self.worker_count:
+            self.workers.append(asyncio.create_task(self.worker()))
+
+    async def worker(self):
+        while True:
+            user, embed = await self.queue.get()
+            try:
+                await self.deliver(user, embed)
+            except Exception as e:
+                self.stats['failed'] += 1
+                print(f"Error enviando DM a {user.id}: {e}")
+            finally:
+                self.queue.task_done()
+
+    async def deliver(self, user, embed):
+        """Enviar el DM reintentando con espera ante límites de tasa"""
+        for attempt in range(DM_MAX_ATTEMPTS):
+            try:
+                # Crear el canal y enviar son dos rutas con límites distintos
+                channel = user.dm_channel
+                if channel is None:
+                    await rest_scheduler.acquire(DM_ROUTE, 'dm')
+                    channel = await user.create_dm()
+                await rest_scheduler.acquire(
+                    rest_route('POST', f'/channels/{channel.id}/messages'),
+                    'dm')
+                await channel.send(embed=embed)
+                self.stats['sent'] += 1
+                return
+            except discord.Forbidden as e:
+                # Tras un ban el rechazo se debe a no compartir servidor, no
+                # a los DMs cerrados: solo se recuerda si aún comparte alguno
+                if e.code == DM_CANNOT_MESSAGE_USER and user.mutual_guilds:
+                    self.closed_dms[user.id] = time.monotonic() + DM_CLOSED_TTL
+                self.stats['closed'] += 1
+                return
+            except discord.HTTPException as e:
+                if e.status != 429 and e.status < 500:
+                    raise
+
+                if e.status == 429:
+                    self.stats['rate_limited'] += 1
+                await asyncio.sleep(retry_after_seconds(e, 2**attempt))
+
+        self.stats['failed'] += 1
+
+    def metrics(self):
+        metrics = dict(self.stats)
+        metrics['depth'] = self.queue.qsize()
+        now = time.monotonic()
+        metrics['closed_users'] = sum(1 for closed_until in self.closed_dms.values()
+                                      if closed_until > now)
+        return metrics
+
+
+def retry_after_seconds(error, default):
+    """Leer Retry-After de una respuesta HTTP con error"""
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None) or {}
+    try:
+        return float(headers.get('Retry-After', default))
+    except (TypeError, ValueError):
+        return default
 
-    except discord.Forbidden:
-        # El usuario tiene los DMs cerrados
-        pass
-    except Exception as e:
-        print(f"Error enviando notificación de ban a {user.id}: {e}")
+
+dm_queue = DirectMessageQueue()
 
 
 async def global_ban_user(user_id, reason="Actividad maliciosa extrema"):
@@ -795,17 +3591,19 @@ async def global_ban_user(user_id, reason="Actividad maliciosa extrema"):
         try:
             # Verificar si el usuario está en el servidor
             member = guild.get_member(user_id)
+            await rest_scheduler.acquire(
+                rest_route('PUT', f'/guilds/{guild.id}/bans/{user_id}'),
+                'ban')
             if member:
                 await member.ban(reason=f"BAN GLOBAL: {reason}")
                 banned_guilds.append(guild.name)
+                record_guild_event(guild.id, 'bans')
 
                 # Enviar notificación por DM
-                await send_ban_notification(member,
-                                            is_global=True,
-                                            reason=reason)
+                queue_ban_notification(member, is_global=True, reason=reason)
 
                 # Enviar alerta al canal del servidor
-                await send_alert(
+                queue_alert(
                     guild,
                     f"🚫 **BAN GLOBAL APLICADO**\n**Usuario**: {member.mention} ({member.id})\n**Razón**: {reason}\n**Acción**: Usuario baneado automáticamente por detección global",
                     member,
@@ -817,6 +3615,7 @@ async def global_ban_user(user_id, reason="Actividad maliciosa extrema"):
                     await guild.ban(user,
                                     reason=f"BAN GLOBAL PREVENTIVO: {reason}")
                     banned_guilds.append(f"{guild.name} (preventivo)")
+                    record_guild_event(guild.id, 'bans')
                 except:
                     failed_guilds.append(guild.name)
 
@@ -836,38 +3635,351 @@ async def global_ban_user(user_id, reason="Actividad maliciosa extrema"):
     return len(banned_guilds), len(failed_guilds)
 
 
-async def check_global_ban_on_join(member):
-    """Verificar si un usuario tiene ban global al unirse a un servidor"""
-    if member.id in global_bans:
-        try:
-            await member.ban(
-                reason="Usuario con ban global - aplicación automática")
+def check_global_ban_on_join(member):
+    """Verificar si un usuario tiene ban global al unirse y encolar su ban"""
+    if member.id not in global_bans:
+        return False
+
+    def on_banned(_):
+        queue_alert(
+            member.guild,
+            f"🚫 **BAN GLOBAL DETECTADO**\n**Usuario**: {member.mention} ({member.id})\n**Acción**: Usuario baneado automáticamente por ban global existente",
+            member,
+            priority="high")
 
-            await send_alert(
-                member.guild,
-                f"🚫 **BAN GLOBAL DETECTADO**\n**Usuario**: {member.mention} ({member.id})\n**Acción**: Usuario baneado automáticamente por ban global existente",
-                member,
-                priority="high")
+        # Enviar notificación al usuario
+        queue_ban_notification(member,
+                               is_global=True,
+                               reason="Ban global existente")
 
-            # Enviar notificación al usuario
-            await send_ban_notification(member,
-                                        is_global=True,
-                                        reason="Ban global existente")
+    def on_forbidden():
+        queue_alert(
+            member.guild,
+            f"⚠️ **USUARIO CON BAN GLOBAL DETECTADO**\n**Usuario**: {member.mention} ({member.id})\n**Error**: No pude banear automáticamente - verificar permisos",
+            member,
+            priority="critical")
 
-            return True
+    queue_ban(member,
+              "Usuario con ban global - aplicación automática",
+              on_success=on_banned,
+              on_forbidden=on_forbidden)
+    return True
 
-        except discord.Forbidden:
-            await send_alert(
-                member.guild,
-                f"⚠️ **USUARIO CON BAN GLOBAL DETECTADO**\n**Usuario**: {member.mention} ({member.id})\n**Error**: No pude banear automáticamente - verificar permisos",
-                member,
-                priority="critical")
-        except Exception as e:
+
+# Sincronización de bans globales al unirse a un servidor
+BAN_SYNC_CHUNK = 200  # Máximo de usuarios por llamada a bulk_ban
+BAN_SYNC_FILE = 'ban_sync_state.json'
+
+
+class GlobalBanSync:
+    """Aplicar en bloque los bans globales que le faltan a un servidor, con cursor reanudable"""
+
+    def __init__(self):
+        self.state = {}  # guild_id (str) -> progreso de la sincronización
+        self.tasks = {}
+        self.loaded = False
+
+    def load_state(self):
+        if self.loaded:
+            return
+        self.loaded = True
+        try:
+            self.state.update(load_data(BAN_SYNC_FILE))
+        except FileNotFoundError:
+            pass
+
+    def save_state(self):
+        save_data(BAN_SYNC_FILE, self.state, JSON_SERIALIZER)
+
+    def start(self, guild):
+        task = self.tasks.get(guild.id)
+        if task is None or task.done():
+            self.tasks[guild.id] = asyncio.create_task(self.sync(guild))
+
+    def resume_pending(self):
+        """Retomar las sincronizaciones que quedaron a medias"""
+        for guild_id in list(self.state):
+            guild = bot.get_guild(int(guild_id))
+            if guild:
+                self.start(guild)
+            else:
+                del self.state[guild_id]
+        self.save_state()
+
+    def finish(self, guild_id):
+        self.state.pop(str(guild_id), None)
+        self.save_state()
+
+    async def sync(self, guild):
+        progress = self.state.setdefault(str(guild.id), {
+            'cursor': 0,
+            'applied': 0,
+            'failed': 0,
+            'total': 0
+        })
+        self.save_state()
+
+        if not guild.me.guild_permissions.ban_members:
+            print(f"❌ Sin permisos para sincronizar bans globales en {guild.name}")
+            self.finish(guild.id)
+            return
+
+        # Recorrer los bans existentes del servidor y calcular la diferencia
+        existing = set()
+        try:
+            async for entry in guild.bans(limit=None):
+                existing.add(entry.user.id)
+        except discord.HTTPException as e:
+            print(f"Error leyendo bans de {guild.name}: {e}")
+            return  # Se reintentará en el próximo arranque
+
+        # Ordenados por ID: el cursor marca hasta dónde ya se aplicaron
+        missing = sorted(user_id for user_id in global_bans
+                         if user_id not in existing
+                         and user_id > progress['cursor'])
+        progress['total'] = progress['applied'] + progress['failed'] + len(
+            missing)
+
+        if missing:
+            queue_alert(
+                guild,
+                f"🔄 **Sincronizando bans globales**\n**Pendientes**: {len(missing)}",
+                priority="normal")
+
+        route = rest_route('POST', f'/guilds/{guild.id}/bulk-ban')
+        for start in range(0, len(missing), BAN_SYNC_CHUNK):
+            chunk = missing[start:start + BAN_SYNC_CHUNK]
+            await rest_scheduler.acquire(route, 'ban')
+            try:
+                result = await guild.bulk_ban(
+                    [discord.Object(id=user_id) for user_id in chunk],
+                    reason="BAN GLOBAL: sincronización al unirse al servidor")
+                progress['applied'] += len(result.banned)
+                if result.banned:
+                    record_guild_event(guild.id, 'bans', len(result.banned))
+                progress['failed'] += len(result.failed)
+            except discord.Forbidden:
+                print(f"❌ Sin permisos para aplicar bans en {guild.name}")
+                self.finish(guild.id)
+                return
+            except discord.HTTPException as e:
+                if e.status == 429 or e.status >= 500:
+                    print(f"Sincronización de bans interrumpida en {guild.name}: {e}")
+                    return  # El cursor guardado permite reanudar
+                progress['failed'] += len(chunk)
+
+            progress['cursor'] = chunk[-1]
+            self.save_state()
+            done = progress['applied'] + progress['failed']
             print(
-                f"Error aplicando ban global a {member.id} en {member.guild.name}: {e}"
+                f"🔄 Sincronización de bans en {guild.name}: {done}/{progress['total']}"
             )
 
-    return False
+        if progress['total']:
+            queue_alert(
+                guild,
+                f"✅ **Bans globales sincronizados**\n**Aplicados**: {progress['applied']}\n**Fallidos**: {progress['failed']}",
+                priority="normal")
+        self.finish(guild.id)
+
+
+ban_sync = GlobalBanSync()
+
+
+# Cola priorizada de acciones de moderación
+ACTION_PRIORITIES = {'ban': 0, 'delete': 1, 'quarantine': 2, 'alert': 3}
+MODERATION_WORKERS = 4
+MODERATION_QUEUE_SIZE = 5000
+
+
+@dataclass(order=True)
+class ModerationJob:
+    """Acción de moderación pendiente de ejecutar"""
+    priority: int
+    sequence: int
+    kind: str = field(compare=False)
+    key: tuple = field(compare=False)
+    action: object = field(compare=False)
+    route: str = field(compare=False)
+    on_success: object = field(default=None, compare=False)
+    on_forbidden: object = field(default=None, compare=False)
+    enqueued_at: float = field(default_factory=time.monotonic, compare=False)
+
+
+class ModerationQueue:
+    """Cola priorizada (ban > delete > quarantine > alert) drenada por workers"""
+
+    def __init__(self, workers=MODERATION_WORKERS,
+                 maxsize=MODERATION_QUEUE_SIZE):
+        self.worker_count = workers
+        self.queue = asyncio.PriorityQueue(maxsize=maxsize)
+        self.sequence = itertools.count()
+        self.pending_keys = set()
+        self.workers = []
+        self.stats = {
+            'enqueued': 0,
+            'processed': 0,
+            'failed': 0,
+            'forbidden': 0,
+            'duplicates': 0,
+            'rejected': 0,
+            'max_depth': 0,
+            'total_wait': 0.0
+        }
+
+    def submit(self,
+               kind,
+               key,
+               action,
+               route,
+               on_success=None,
+               on_forbidden=None):
+        """Encolar una acción; se descarta si ya hay una idéntica pendiente"""
+        job_key = (kind, ) + key
+        if job_key in self.pending_keys:
+            self.stats['duplicates'] += 1
+            return False
+
+        job = ModerationJob(ACTION_PRIORITIES[kind], next(self.sequence),
+                            kind, job_key, action, route, on_success,
+                            on_forbidden)
+        try:
+            self.queue.put_nowait(job)
+        except asyncio.QueueFull:
+            self.stats['rejected'] += 1
+            return False
+
+        self.pending_keys.add(job_key)
+        self.stats['enqueued'] += 1
+        self.stats['max_depth'] = max(self.stats['max_depth'],
+                                      self.queue.qsize())
+        return True
+
+    def start(self):
+        """Iniciar los workers si no están corriendo"""
+        self.workers = [task for task in self.workers if not task.done()]
+        while len(self.workers) < self.worker_count:
+            self.workers.append(asyncio.create_task(self.worker()))
+
+    async def worker(self):
+        while True:
+            job = await self.queue.get()
+            self.stats['total_wait'] += time.monotonic() - job.enqueued_at
+            callback, args = None, ()
+
+            try:
+                if job.route:
+                    await rest_scheduler.acquire(job.route, job.kind)
+                result = await job.action()
+                callback, args = job.on_success, (result, )
+            except discord.Forbidden:
+                self.stats['forbidden'] += 1
+                callback = job.on_forbidden
+            except Exception as e:
+                self.stats['failed'] += 1
+                print(f"Error ejecutando acción {job.kind} {job.key}: {e}")
+            finally:
+                self.stats['processed'] += 1
+                self.pending_keys.discard(job.key)
+                self.queue.task_done()
+
+            # Las acciones de seguimiento solo encolan nuevos trabajos
+            if callback:
+                try:
+                    callback(*args)
+                except Exception as e:
+                    print(f"Error en seguimiento de {job.kind} {job.key}: {e}")
+
+    def metrics(self):
+        """Métricas de contrapresión de la cola"""
+        metrics = dict(self.stats)
+        metrics['depth'] = self.queue.qsize()
+        processed = self.stats['processed']
+        metrics['avg_wait_ms'] = (self.stats['total_wait'] / processed *
+                                  1000 if processed else 0.0)
+        return metrics
+
+
+moderation_queue = ModerationQueue()
+
+
+def queue_alert(guild, message, user=None, priority="normal"):
+    """Encolar una alerta para el canal de alertas del servidor"""
+    if not load_shedder.allow_alert(priority):
+        return False
+    channel_id = get_compiled_config(guild.id).alert_channel
+    return moderation_queue.submit(
+        'alert', (guild.id, message),
+        lambda: send_alert(guild, message, user, priority=priority),
+        rest_route('POST', f'/channels/{channel_id}/messages'))
+
+
+def queue_ban_notification(user, is_global=False, guild_name=None,
+                           reason=None):
+    """Encolar la notificación de ban por DM (una sola vez por usuario y tipo)"""
+    return dm_queue.submit(
+        user,
+        build_ban_notification(is_global=is_global,
+                               guild_name=guild_name,
+                               reason=reason),
+        key=(user.id, is_global, guild_name))
+
+
+def queue_ban(member, reason, on_success=None, on_forbidden=None):
+    """Encolar el ban local de un miembro"""
+
+    def on_banned(result):
+        reputation_index.record(member.id, 'bans')
+        record_guild_event(member.guild.id, 'bans')
+        if on_success:
+            on_success(result)
+
+    return moderation_queue.submit(
+        'ban', (member.guild.id, member.id), lambda: member.ban(reason=reason),
+        rest_route('PUT', f'/guilds/{member.guild.id}/bans/{member.id}'),
+        on_banned, on_forbidden)
+
+
+def queue_global_ban(user_id, reason):
+    """Encolar un ban global (cada servidor consulta su propia ruta)"""
+    return moderation_queue.submit('ban', ('global', user_id),
+                                   lambda: global_ban_user(user_id, reason),
+                                   None)
+
+
+def queue_delete(message, on_success=None, on_forbidden=None):
+    """Encolar la eliminación de un mensaje"""
+
+    def on_deleted(result):
+        record_guild_event(message.guild.id, 'deletes')
+        if on_success:
+            on_success(result)
+
+    return moderation_queue.submit(
+        'delete', (message.channel.id, message.id), message.delete,
+        rest_route('DELETE',
+                   f'/channels/{message.channel.id}/messages/{message.id}'),
+        on_deleted, on_forbidden)
+
+
+def queue_quarantine(member, reason, on_success=None):
+    """Encolar la cuarentena de un miembro (on_success recibe si se aplicó)"""
+    quarantine_role = get_compiled_config(member.guild.id).quarantine_role
+
+    def on_quarantined(quarantined):
+        if quarantined:
+            reputation_index.record(member.id, 'quarantines')
+            record_guild_event(member.guild.id, 'quarantines')
+        if on_success:
+            on_success(quarantined)
+
+    return moderation_queue.submit(
+        'quarantine', (member.guild.id, member.id),
+        lambda: quarantine_user(member, reason),
+        rest_route(
+            'PUT',
+            f'/guilds/{member.guild.id}/members/{member.id}/roles/{quarantine_role}'
+        ), on_quarantined)
 
 
 async def create_automatic_panel():
@@ -1004,9 +4116,7 @@ async def setup_server_roles(guild):
             )
 
             # Configurar automáticamente el rol de cuarentena
-            config = get_server_config(guild.id)
-            config['quarantine_role'] = quarantine_role.id
-            save_config()
+            update_server_config(guild.id, quarantine_role=quarantine_role.id)
 
         return True
 
@@ -1028,6 +4138,9 @@ async def on_guild_join(guild):
     # Configurar roles automáticamente
     await setup_server_roles(guild)
 
+    # Aplicar los bans globales que le faltan al servidor
+    ban_sync.start(guild)
+
     # Crear canal de alertas por defecto si es posible
     try:
         if guild.me.guild_permissions.manage_channels:
@@ -1051,9 +4164,7 @@ async def on_guild_join(guild):
                     reason="Canal automático para alertas de seguridad")
 
                 # Configurar automáticamente como canal de alertas
-                config = get_server_config(guild.id)
-                config['alert_channel'] = alert_channel.id
-                save_config()
+                update_server_config(guild.id, alert_channel=alert_channel.id)
 
                 print(
                     f"✅ Canal de alertas creado: #{alert_channel.name} en {guild.name}"
@@ -1087,6 +4198,27 @@ async def on_guild_join(guild):
         print(f"❌ Error creando canal de alertas en {guild.name}: {e}")
 
 
+@bot.event
+async def setup_hook():
+    """Restaurar la actividad guardada antes de conectar con el gateway"""
+    global activity_snapshot_loaded
+    if activity_snapshot_loaded:
+        return
+    activity_snapshot_loaded = True
+
+    # La lectura y descompresión van a un hilo; el reparto se hace antes de
+    # que lleguen eventos, así que no retrasa ningún mensaje
+    start = time.perf_counter()
+    snapshot = await asyncio.to_thread(read_activity_snapshot)
+    if snapshot is not None:
+        restored = apply_activity_snapshot(snapshot)
+        # Los registros restaurados viven horas: sacarlos de las pasadas del gc
+        gc.freeze()
+        print(
+            f'Actividad restaurada: {restored} usuarios en {time.perf_counter() - start:.2f}s'
+        )
+
+
 @bot.event
 async def on_ready():
     print(f'🛡️ Bot de seguridad {bot.user} conectado!')
@@ -1103,6 +4235,23 @@ async def on_ready():
     # Iniciar tareas de monitoreo
     if not monitor_activity.is_running():
         monitor_activity.start()
+    if not snapshot_activity.is_running():
+        snapshot_activity.start()
+    if not expire_activity.is_running():
+        expire_activity.start()
+    if not persist_bad_avatars.is_running():
+        persist_bad_avatars.start()
+
+    # Iniciar workers de la cola de moderación y de DMs
+    moderation_queue.start()
+    dm_queue.start()
+    load_shedder.start()
+    event_scheduler.start()
+    attachment_scanner.start()
+
+    # Retomar sincronizaciones de bans interrumpidas
+    ban_sync.load_state()
+    ban_sync.resume_pending()
 
     # Sincronizar comandos slash
     try:
@@ -1118,9 +4267,7 @@ async def monitor_activity():
     current_time = datetime.utcnow()
 
     for guild in bot.guilds:
-        config = get_server_config(guild.id)
-
-        if not config.get('advanced_detection', True):
+        if not get_compiled_config(guild.id).advanced_detection:
             continue
 
         # Detectar patrones de raid con nuevo sistema
@@ -1137,7 +4284,7 @@ async def monitor_activity():
             alert_message = f"🚨 **RAID DETECTADO** (Confianza: {confidence}%)\n"
             alert_message += f"**Indicadores**: {', '.join(active_indicators)}"
 
-            await send_alert(guild, alert_message, priority=priority)
+            queue_alert(guild, alert_message, priority=priority)
 
         elif any(
                 raid_indicators.get(k, False)
@@ -1146,172 +4293,675 @@ async def monitor_activity():
             alert_message = "⚠️ **Actividad sospechosa detectada**\n"
             alert_message += "Monitoreando posibles patrones de raid..."
 
-            await send_alert(guild, alert_message, priority="normal")
+            queue_alert(guild, alert_message, priority="normal")
 
-    # Limpiar datos antiguos
-    for user_id in list(user_activity.keys()):
-        activity = user_activity[user_id]
-        # Eliminar mensajes antiguos
-        activity['messages'] = deque([
-            msg for msg in activity['messages']
-            if msg['timestamp'] > current_time - timedelta(hours=24)
-        ],
-                                     maxlen=50)
-        # Eliminar uniones antiguas
-        activity['joins'] = deque([
-            join for join in activity['joins']
-            if join > current_time - timedelta(hours=24)
-        ],
-                                  maxlen=10)
+    # Los mensajes y uniones antiguos caducan en expire_activity
+    for board in guild_risk_boards.values():
+        board.expire(current_time - RISK_BOARD_RETENTION)
+
+
+@tasks.loop(seconds=15)
+async def expire_activity():
+    """Avanzar la rueda de caducidad de la actividad en pasos pequeños"""
+    activity_expiry.advance()
+
+
+@tasks.loop(seconds=30)
+async def persist_bad_avatars():
+    """Caducar y guardar los avatares de oleadas si cambiaron"""
+    bad_avatars.expire()
+    if not bad_avatars.dirty:
+        return
+    bad_avatars.dirty = False
+    try:
+        await asyncio.to_thread(save_data, BAD_AVATARS_FILE,
+                                bad_avatars.to_data(), JSON_SERIALIZER)
+    except OSError as e:
+        bad_avatars.dirty = True
+        print(f'Error guardando avatares de oleadas: {e}')
+
+
+@tasks.loop(minutes=2)
+async def snapshot_activity():
+    """Guardar periódicamente la actividad para poder reanudarla tras reiniciar"""
+    try:
+        await save_activity_snapshot()
+    except OSError as e:
+        print(f'Error guardando instantánea de actividad: {e}')
+
+
+def quarantine_join_cluster(guild, index, member_ids, label):
+    """Poner en cuarentena a las cuentas anteriores de una oleada detectada al unirse"""
+    earlier = index.claim_unflagged(member_ids)
+    if not earlier:
+        return
+
+    for member_id in earlier:
+        member = guild.get_member(member_id)
+        if member:
+            queue_quarantine(member, f"Oleada de {label}")
+
+    queue_alert(
+        guild,
+        f"👥 **Oleada de {label}**\n**Cuentas en el grupo**: {len(member_ids) + 1}\n**Puestas en cuarentena ahora**: {len(earlier)}",
+        priority="high")
+
+
+def check_avatar_on_join(member):
+    """Comprobar el avatar contra la lista global y el índice del servidor (sin red)"""
+    if member.avatar is None:
+        return None
+
+    avatar_key = member.avatar.key
+    avatar_index = avatar_indexes[member.guild.id]
+    same_avatar = avatar_index.record(avatar_key, member.id)
+
+    if len(same_avatar) + 1 >= AVATAR_CLUSTER_MIN:
+        # Se guarda en persist_bad_avatars, fuera del camino de las uniones
+        bad_avatars.record(avatar_key, member.guild.id)
+        avatar_index.claim_unflagged([member.id])
+        quarantine_join_cluster(member.guild, avatar_index, same_avatar,
+                                "avatares idénticos")
+        return f"Avatar compartido con {len(same_avatar)} cuentas recientes"
+
+    if bad_avatars.is_bad(avatar_key):
+        return "Avatar usado en raids de otros servidores"
+
+    return None
+
+
+# Huellas de adjuntos maliciosos conocidos (imágenes de estafas, archivos)
+ATTACHMENT_MAX_BYTES = 8 * 1024 * 1024  # No se descargan adjuntos mayores
+ATTACHMENT_FETCH_TIMEOUT = 15  # Segundos por descarga
+ATTACHMENT_FETCH_WORKERS = 4
+ATTACHMENT_QUEUE_SIZE = 256  # Mensajes con adjuntos pendientes de revisar
+ATTACHMENT_CACHE_SIZE = 4096  # Huellas recordadas por URL
+DHASH_BANDS = 8  # 8 bandas de 8 bits: a distancia < 8 al menos una coincide
+DHASH_MAX_DISTANCE = 6  # Bits distintos para considerar dos imágenes iguales
+
+
+def attachment_cache_key(url):
+    """URL sin parámetros: las firmas del CDN cambian pero el archivo no"""
+    return url.split('?', 1)[0]
+
+
+def image_dhash(data):
+    """Hash perceptual de diferencias (64 bits) o None si no es una imagen"""
+    if Image is None:
+        return None
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            image.draft('L', (64, 64))  # Decodificar JPEG a tamaño reducido
+            pixels = np.asarray(image.convert('L').resize(
+                (9, 8), Image.Resampling.BILINEAR))
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return None
+
+    # Un bit por píxel: ¿es más claro que su vecino de la derecha?
+    bits = np.packbits(pixels[:, :-1] > pixels[:, 1:])
+    return int.from_bytes(bits.tobytes(), 'big')
+
+
+def fingerprint_attachment_bytes(data):
+    """Huella exacta (sha256) y perceptual (dHash) del contenido de un adjunto"""
+    return {
+        'sha256': hashlib.sha256(data).hexdigest(),
+        'dhash': image_dhash(data)
+    }
+
+
+class AttachmentIndex:
+    """Huellas de adjuntos maliciosos con búsqueda O(1) exacta y por bandas"""
+
+    def __init__(self):
+        self.sha256 = set()
+        self.dhashes = set()
+        self.bands = [defaultdict(set) for _ in range(DHASH_BANDS)]
+
+    def __len__(self):
+        return len(self.sha256)  # Cada adjunto marcado aporta un sha256
+
+    @staticmethod
+    def band_keys(dhash):
+        return [(dhash >> (8 * band)) & 0xFF for band in range(DHASH_BANDS)]
+
+    def add(self, fingerprint):
+        """Añadir una huella; devuelve False si ya estaba"""
+        added = fingerprint['sha256'] not in self.sha256
+        self.sha256.add(fingerprint['sha256'])
+
+        dhash = fingerprint.get('dhash')
+        if dhash is not None and dhash not in self.dhashes:
+            self.add_dhash(dhash)
+            added = True
+        return added
+
+    def add_dhash(self, dhash):
+        self.dhashes.add(dhash)
+        for band, key in enumerate(self.band_keys(dhash)):
+            self.bands[band][key].add(dhash)
+
+    def match(self, fingerprint):
+        """Razón si la huella coincide con un adjunto malicioso conocido"""
+        if fingerprint['sha256'] in self.sha256:
+            return "Adjunto idéntico a uno malicioso conocido"
+
+        dhash = fingerprint.get('dhash')
+        if dhash is None or not self.dhashes:
+            return None
+
+        # Solo se comparan las huellas que comparten alguna banda
+        candidates = set()
+        for band, key in enumerate(self.band_keys(dhash)):
+            candidates.update(self.bands[band].get(key, ()))
+        distance = min(((dhash ^ known).bit_count() for known in candidates),
+                       default=DHASH_MAX_DISTANCE + 1)
+        if distance <= DHASH_MAX_DISTANCE:
+            return f"Imagen casi idéntica a una maliciosa conocida (distancia {distance})"
+        return None
+
+    def to_data(self):
+        return {'sha256': sorted(self.sha256), 'dhash': sorted(self.dhashes)}
+
+    def load(self, data):
+        self.__init__()
+        self.sha256.update(data.get('sha256', []))
+        for dhash in data.get('dhash', []):
+            self.add_dhash(dhash)
+
+
+attachment_index = AttachmentIndex()
+
+
+class AttachmentScanner:
+    """Descargar y comprobar adjuntos en segundo plano con límites de tamaño"""
+
+    def __init__(self, index, max_bytes=ATTACHMENT_MAX_BYTES):
+        self.index = index
+        self.max_bytes = max_bytes
+        self.cache = OrderedDict()  # URL sin parámetros -> huella
+        self.queue = None
+        self.session = None
+        self.workers = []
+        self.stats = {
+            'fetched': 0,
+            'cache_hits': 0,
+            'too_large': 0,
+            'dropped': 0,
+            'errors': 0,
+            'matches': 0
+        }
+
+    def start(self):
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(
+                total=ATTACHMENT_FETCH_TIMEOUT))
+        if self.queue is None:
+            self.queue = asyncio.Queue(maxsize=ATTACHMENT_QUEUE_SIZE)
+        self.workers = [worker for worker in self.workers if not worker.done()]
+        while len(self.workers) < ATTACHMENT_FETCH_WORKERS:
+            self.workers.append(asyncio.create_task(self.worker()))
+
+    def submit(self, message):
+        """Encolar un mensaje con adjuntos; sin huellas conocidas no hay nada que buscar"""
+        if not message.attachments or not len(self.index) or self.queue is None:
+            return False
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self.stats['dropped'] += 1
+            return False
+        return True
+
+    async def worker(self):
+        while True:
+            message = await self.queue.get()
+            try:
+                await self.scan(message)
+            except Exception as e:
+                self.stats['errors'] += 1
+                print(f"Error revisando adjuntos: {e}")
+            finally:
+                self.queue.task_done()
+
+    async def fetch(self, url):
+        """Descargar un adjunto sin superar max_bytes"""
+        async with self.session.get(url) as response:
+            response.raise_for_status()
+            if (response.content_length or 0) > self.max_bytes:
+                raise ValueError('Adjunto demasiado grande')
+            data = bytearray()
+            async for chunk in response.content.iter_chunked(64 * 1024):
+                data += chunk
+                if len(data) > self.max_bytes:
+                    raise ValueError('Adjunto demasiado grande')
+        self.stats['fetched'] += 1
+        return bytes(data)
+
+    async def fingerprint(self, attachment):
+        """Huella de un adjunto, desde la caché por URL si ya se calculó"""
+        key = attachment_cache_key(attachment.url)
+        fingerprint = self.cache.get(key)
+        if fingerprint is not None:
+            self.cache.move_to_end(key)
+            self.stats['cache_hits'] += 1
+            return fingerprint
+
+        if attachment.size > self.max_bytes:
+            self.stats['too_large'] += 1
+            return None
+
+        try:
+            data = await self.fetch(attachment.url)
+        except ValueError:
+            self.stats['too_large'] += 1
+            return None
+
+        # El hash y la decodificación de la imagen no bloquean el bucle
+        fingerprint = await asyncio.to_thread(fingerprint_attachment_bytes,
+                                              data)
+        self.cache[key] = fingerprint
+        if len(self.cache) > ATTACHMENT_CACHE_SIZE:
+            self.cache.popitem(last=False)
+        return fingerprint
+
+    async def scan(self, message):
+        for attachment in message.attachments:
+            fingerprint = await self.fingerprint(attachment)
+            if fingerprint is None:
+                continue
+            reason = self.index.match(fingerprint)
+            if reason:
+                self.stats['matches'] += 1
+                handle_malicious_attachment(message, attachment, reason)
+                return reason
+        return None
+
+    async def close(self):
+        """Detener los workers y cerrar la sesión HTTP"""
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+
+    def metrics(self):
+        return {
+            'indexed': len(self.index),
+            'pending': self.queue.qsize() if self.queue else 0,
+            'cached': len(self.cache),
+            **self.stats
+        }
+
+
+attachment_scanner = AttachmentScanner(attachment_index)
+
+
+def handle_malicious_attachment(message, attachment, reason):
+    """Registrar, eliminar y alertar de un adjunto malicioso conocido"""
+    reputation_index.record(message.author.id, 'flags')
+    user_activity[message.author.id]['suspicious_actions'].append({
+        'type': 'malicious_attachment',
+        'timestamp': datetime.utcnow(),
+        'details': [reason, attachment.filename]
+    })
+    risk_score_cache.invalidate_user(message.author.id)
+
+    queue_delete(
+        message,
+        on_success=lambda _: queue_alert(
+            message.guild,
+            f"🖼️ **Adjunto malicioso eliminado**\n**Usuario**: {message.author.mention}\n**Archivo**: {attachment.filename}\n**Razón**: {reason}",
+            message.author,
+            priority="high"),
+        on_forbidden=lambda: queue_alert(
+            message.guild,
+            f"⚠️ **Adjunto malicioso detectado (no pude eliminarlo)**\n**Usuario**: {message.author.mention}\n**Archivo**: {attachment.filename}\n**Razón**: {reason}",
+            message.author,
+            priority="high"))
+
+
+# Planificación equitativa de eventos por servidor
+EVENT_QUANTUM = 4  # Eventos que cada servidor puede despachar por ronda
+EVENT_MESSAGE_CAPACITY = 200  # Mensajes en cola por servidor (se descartan los más antiguos)
+
+
+class GuildEventQueue:
+    """Cola acotada de mensajes y uniones pendientes de un servidor"""
+
+    def __init__(self):
+        self.messages = deque()
+        self.joins = deque()
+        self.deficit = 0
+        self.running = 0
+        self.scheduled = False
+        self.processed = 0
+        self.dropped = 0
+        self.max_depth = 0
+
+    def depth(self):
+        return len(self.messages) + len(self.joins)
+
+    def pop(self):
+        # Las uniones tienen prioridad y nunca se descartan
+        if self.joins:
+            return self.joins.popleft()
+        return self.messages.popleft()
+
+
+class GuildEventScheduler:
+    """Reparto de mensajes y uniones entre servidores con déficit round-robin"""
+
+    def __init__(self):
+        self.queues = defaultdict(GuildEventQueue)
+        self.active = deque()
+        self.wakeup = asyncio.Event()
+        self.task = None
+        self.handlers = set()  # Referencias a las tareas en curso
+
+    def start(self):
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+
+    def submit_message(self, guild_id, handler, payload):
+        queue = self.queues[guild_id]
+        queue.messages.append((handler, payload))
+        if len(queue.messages) > EVENT_MESSAGE_CAPACITY:
+            queue.messages.popleft()  # En una avalancha importan los más nuevos
+            queue.dropped += 1
+        self.activate(guild_id, queue)
+
+    def submit_join(self, guild_id, handler, payload):
+        queue = self.queues[guild_id]
+        queue.joins.append((handler, payload))
+        self.activate(guild_id, queue)
+
+    def activate(self, guild_id, queue):
+        queue.max_depth = max(queue.max_depth, queue.depth())
+        if not queue.scheduled:
+            queue.scheduled = True
+            self.active.append(guild_id)
+        self.wakeup.set()
+
+    async def run(self):
+        while True:
+            await self.wakeup.wait()
+            self.wakeup.clear()
+            self.dispatch()
+
+    def dispatch(self):
+        """Rondas de déficit: cada servidor activo recibe el mismo cupo por ronda"""
+        progress = True
+        while self.active and progress:
+            progress = False
+            for _ in range(len(self.active)):
+                guild_id = self.active.popleft()
+                queue = self.queues[guild_id]
+                limit = get_compiled_config(guild_id).event_concurrency
+                queue.deficit = min(queue.deficit + EVENT_QUANTUM,
+                                    EVENT_QUANTUM * 2)
+
+                while (queue.deficit >= 1 and queue.running < limit
+                       and queue.depth()):
+                    handler, payload = queue.pop()
+                    queue.deficit -= 1
+                    queue.running += 1
+                    task = asyncio.create_task(
+                        self.execute(queue, handler, payload))
+                    self.handlers.add(task)
+                    task.add_done_callback(self.handlers.discard)
+                    progress = True
+
+                if queue.depth():
+                    self.active.append(guild_id)
+                else:
+                    queue.scheduled = False
+                    queue.deficit = 0
+
+    async def execute(self, queue, handler, payload):
+        try:
+            await handler(payload)
+        except Exception as e:
+            print(f'Error procesando evento: {e}')
+        finally:
+            queue.running -= 1
+            queue.processed += 1
+            self.wakeup.set()
+
+    def metrics(self, limit=5):
+        busiest = sorted(self.queues.items(),
+                         key=lambda item: item[1].depth(),
+                         reverse=True)[:limit]
+        return {
+            'active_guilds': len(self.active),
+            'depth': sum(queue.depth() for queue in self.queues.values()),
+            'dropped': sum(queue.dropped for queue in self.queues.values()),
+            'guilds': [{
+                'guild_id': guild_id,
+                'messages': len(queue.messages),
+                'joins': len(queue.joins),
+                'running': queue.running,
+                'max_depth': queue.max_depth,
+                'processed': queue.processed,
+                'dropped': queue.dropped
+            } for guild_id, queue in busiest]
+        }
+
+
+event_scheduler = GuildEventScheduler()
 
 
 @bot.event
 async def on_member_join(member):
+    """Encolar la unión en la cola de su servidor"""
+    event_scheduler.submit_join(member.guild.id, process_member_join, member)
+
+
+async def process_member_join(member):
     """Detectar y manejar miembros sospechosos con análisis mejorado"""
-    config = get_server_config(member.guild.id)
+    config = get_compiled_config(member.guild.id)
+    record_guild_event(member.guild.id, 'joins')
 
     # Verificar ban global primero
-    if await check_global_ban_on_join(member):
-        return  # Usuario ya baneado globalmente
+    if check_global_ban_on_join(member):
+        return  # Ban global ya encolado
 
-    if not config.get('raid_detection', True):
+    if not config.raid_detection:
         return
 
     # Registrar unión
-    user_activity[member.id]['joins'].append(datetime.utcnow())
+    record_join_activity(member.id, datetime.utcnow())
     user_activity[member.id]['account_age'] = member.created_at.replace(
         tzinfo=None)
+    guild_risk_boards[member.guild.id].touch(member.id)
+    join_indexes[member.guild.id].record()
+    risk_score_cache.invalidate_user(member.id)
+
+    # Analizar oleada de uniones con cuentas creadas casi a la vez
+    analyzer = join_wave_analyzers[member.guild.id]
+    join_wave = analyzer.record_join(member.id)
+    if join_wave['wave_detected'] and analyzer.should_alert():
+        queue_alert(
+            member.guild,
+            f"🌊 **Oleada de uniones detectada**\n**Cuentas creadas casi a la vez**: {join_wave['cluster_size']}\n**Uniones recientes**: {join_wave['recent_joins']} en {JOIN_WAVE_WINDOW}s",
+            priority="high")
+
+    # Avatares compartidos por cuentas de una misma oleada
+    avatar_reason = check_avatar_on_join(member)
 
     # Analizar bot sospechoso
     if member.bot:
         is_suspicious, reasons, requires_global_ban = is_suspicious_bot(member)
+        if avatar_reason:
+            is_suspicious = True
+            reasons.append(avatar_reason)
         if is_suspicious:
-            try:
-                if requires_global_ban:
-                    # Ban global para bots extremadamente peligrosos
-                    await global_ban_user(
-                        member.id,
-                        f"Bot de raid crítico: {', '.join(reasons)}")
-                else:
-                    # Ban local normal
-                    await member.ban(
-                        reason=f"Bot sospechoso: {', '.join(reasons)}")
+            if requires_global_ban:
+                # Ban global para bots extremadamente peligrosos
+                queue_global_ban(member.id,
+                                 f"Bot de raid crítico: {', '.join(reasons)}")
+            else:
+                # Ban local normal
+                reason = f"Bot sospechoso: {', '.join(reasons)}"
 
+                def on_banned(_):
                     # Enviar notificación al usuario
-                    await send_ban_notification(
-                        member,
-                        is_global=False,
-                        guild_name=member.guild.name,
-                        reason=f"Bot sospechoso: {', '.join(reasons)}")
+                    queue_ban_notification(member,
+                                           is_global=False,
+                                           guild_name=member.guild.name,
+                                           reason=reason)
 
-                    await send_alert(
+                    queue_alert(
                         member.guild,
                         f"🚫 **Bot sospechoso baneado**: {member.name}\n**Razones**: {', '.join(reasons)}",
                         member,
                         priority="high")
-            except discord.Forbidden:
-                await send_alert(
-                    member.guild,
-                    f"⚠️ **Bot sospechoso detectado pero no pude banearlo**: {member.name}\n**Razones**: {', '.join(reasons)}",
+
+                queue_ban(
                     member,
-                    priority="normal")
+                    reason,
+                    on_success=on_banned,
+                    on_forbidden=lambda: queue_alert(
+                        member.guild,
+                        f"⚠️ **Bot sospechoso detectado pero no pude banearlo**: {member.name}\n**Razones**: {', '.join(reasons)}",
+                        member,
+                        priority="normal"))
 
     # Analizar usuario sospechoso
     else:
         is_suspicious, reasons, requires_global_ban = is_suspicious_user(
             member)
+
+        # Oleadas de cuentas con nombres similares
+        name_index = name_cluster_indexes[member.guild.id]
+        similar = name_index.record(member.id,
+                                    (member.name, member.display_name))
+        if len(similar) + 1 >= NAME_CLUSTER_MIN:
+            is_suspicious = True
+            reasons.append(
+                f"Nombre similar a {len(similar)} cuentas recientes")
+            name_index.claim_unflagged([member.id])
+            quarantine_join_cluster(member.guild, name_index, similar,
+                                    "nombres similares")
+
+        if avatar_reason:
+            is_suspicious = True
+            reasons.append(avatar_reason)
+
+        # Reincidentes vistos en otros servidores
+        reputation_reason, reputation_risk = check_reputation_on_join(member)
+        if reputation_reason:
+            is_suspicious = True
+            reasons.append(reputation_reason)
+
         if is_suspicious:
-            risk_score = calculate_risk_score(member.id, member.guild.id)
-            user_activity[member.id]['risk_score'] = risk_score
+            reputation_index.record(member.id, 'flags')
+            risk_score = min(
+                100,
+                calculate_risk_score(member.id, member.guild.id) +
+                reputation_risk)
+            set_risk_score(member.id, member.guild.id, risk_score)
+
+            def on_quarantine(quarantined):
+                if quarantined:
+                    queue_alert(
+                        member.guild,
+                        f"🔒 **Usuario en cuarentena**: {member.name}\n**Razones**: {', '.join(reasons)}\n**Riesgo**: {risk_score}/100",
+                        member,
+                        priority="normal")
+                else:
+                    queue_alert(
+                        member.guild,
+                        f"⚠️ **Usuario sospechoso detectado**: {member.name}\n**Razones**: {', '.join(reasons)}\n**Riesgo**: {risk_score}/100",
+                        member,
+                        priority="normal")
 
             if requires_global_ban:
                 # Ban global para usuarios extremadamente peligrosos
-                await global_ban_user(
-                    member.id, f"Usuario crítico: {', '.join(reasons)}")
+                queue_global_ban(member.id,
+                                 f"Usuario crítico: {', '.join(reasons)}")
 
-            elif risk_score > config.get('risk_threshold', 75):
+            elif risk_score > config.risk_threshold:
                 # Ban local para alto riesgo
-                try:
-                    await member.ban(
-                        reason=f"Alto riesgo: {', '.join(reasons)}")
+                reason = f"Alto riesgo: {', '.join(reasons)}"
 
+                def on_banned(_):
                     # Enviar notificación al usuario
-                    await send_ban_notification(
-                        member,
-                        is_global=False,
-                        guild_name=member.guild.name,
-                        reason=f"Alto riesgo: {', '.join(reasons)}")
+                    queue_ban_notification(member,
+                                           is_global=False,
+                                           guild_name=member.guild.name,
+                                           reason=reason)
 
-                    await send_alert(
+                    queue_alert(
                         member.guild,
                         f"🚫 **Usuario de alto riesgo baneado**: {member.name}\n**Razones**: {', '.join(reasons)}\n**Riesgo**: {risk_score}/100",
                         member,
                         priority="high")
-                except discord.Forbidden:
-                    # Intentar cuarentena si no se puede banear
-                    quarantined = await quarantine_user(
-                        member, f"Alto riesgo: {', '.join(reasons)}")
-
-                    if quarantined:
-                        await send_alert(
-                            member.guild,
-                            f"🔒 **Usuario en cuarentena**: {member.name}\n**Razones**: {', '.join(reasons)}\n**Riesgo**: {risk_score}/100",
-                            member,
-                            priority="normal")
-                    else:
-                        await send_alert(
-                            member.guild,
-                            f"⚠️ **Usuario sospechoso detectado**: {member.name}\n**Razones**: {', '.join(reasons)}\n**Riesgo**: {risk_score}/100",
-                            member,
-                            priority="normal")
+
+                # Intentar cuarentena si no se puede banear
+                queue_ban(member,
+                          reason,
+                          on_success=on_banned,
+                          on_forbidden=lambda: queue_quarantine(
+                              member, reason, on_success=on_quarantine))
             else:
                 # Solo cuarentena para riesgo moderado
-                quarantined = await quarantine_user(
-                    member, f"Riesgo moderado: {', '.join(reasons)}")
-
-                if quarantined:
-                    await send_alert(
-                        member.guild,
-                        f"🔒 **Usuario en cuarentena**: {member.name}\n**Razones**: {', '.join(reasons)}\n**Riesgo**: {risk_score}/100",
-                        member,
-                        priority="normal")
-                else:
-                    await send_alert(
-                        member.guild,
-                        f"⚠️ **Usuario sospechoso detectado**: {member.name}\n**Razones**: {', '.join(reasons)}\n**Riesgo**: {risk_score}/100",
-                        member,
-                        priority="normal")
+                queue_quarantine(member,
+                                 f"Riesgo moderado: {', '.join(reasons)}",
+                                 on_success=on_quarantine)
 
 
 @bot.event
 async def on_message(message):
-    """Monitorear mensajes con análisis avanzado"""
+    """Encolar el mensaje en la cola de su servidor"""
     if message.author.bot and message.author != bot.user:
         return
 
     if not message.guild:
         return
 
-    config = get_server_config(message.guild.id)
+    config = get_compiled_config(message.guild.id)
+
+    # Usuarios de confianza y canales permitidos no pasan por el análisis
+    if (message.author.id in config.trusted_users
+            or message.channel.id in config.whitelist_channels):
+        message_pipeline_stats.record('bypass')
+    else:
+        event_scheduler.submit_message(message.guild.id, process_message,
+                                       message)
+
+    await bot.process_commands(message)
+
+
+async def process_message(message):
+    """Monitorear mensajes con análisis avanzado"""
+    config = get_compiled_config(message.guild.id)
+    record_guild_event(message.guild.id, 'messages')
 
     # Registrar actividad del mensaje
-    user_activity[message.author.id]['messages'].append({
-        'content':
-        message.content,
-        'timestamp':
-        datetime.utcnow(),
-        'channel':
-        message.channel.id,
-        'suspicious':
-        False
-    })
+    record_message_activity(
+        message.author.id, {
+            'content': message.content,
+            'timestamp': datetime.utcnow(),
+            'channel': message.channel.id,
+            'guild': message.guild.id,
+            'suspicious': False
+        })
     user_activity[message.author.id]['last_activity'] = datetime.utcnow()
+    risk_score_cache.invalidate_user(message.author.id)
+
+    # Los adjuntos se comparan con las huellas conocidas en segundo plano
+    attachment_scanner.submit(message)
 
     # Análisis de contenido
-    analysis = analyze_message_content(message)
+    analysis = run_message_pipeline(message)
 
     if analysis['suspicious']:
-        user_activity[message.author.id]['messages'][-1]['suspicious'] = True
+        reputation_index.record(message.author.id, 'flags')
+        record_guild_event(message.guild.id, 'suspicious')
+        mark_message_suspicious(
+            user_activity[message.author.id]['messages'][-1])
         user_activity[message.author.id]['suspicious_actions'].append({
             'type':
             'suspicious_message',
@@ -1323,18 +4973,17 @@ async def on_message(message):
 
         # Calcular riesgo actualizado
         risk_score = calculate_risk_score(message.author.id, message.guild.id)
-        user_activity[message.author.id]['risk_score'] = risk_score
+        set_risk_score(message.author.id, message.guild.id, risk_score)
 
         # Tomar acción según el riesgo con umbrales más inteligentes
-        threshold = config.get('risk_threshold', 75)
+        threshold = config.risk_threshold
 
         if risk_score > threshold and analysis[
                 'risk_level'] > 25:  # Doble verificación
-            try:
-                await message.delete()
 
+            def on_deleted(_):
                 # Enviar alerta de alto riesgo
-                await send_alert(
+                queue_alert(
                     message.guild,
                     f"🗑️ **Mensaje sospechoso eliminado**\n**Usuario**: {message.author.mention}\n**Razones**: {', '.join(analysis['reason'])}\n**Riesgo**: {risk_score}/100",
                     message.author,
@@ -1342,47 +4991,44 @@ async def on_message(message):
 
                 # Considerar cuarentena solo con alto riesgo confirmado
                 if risk_score > 90 and analysis['risk_level'] > 30:
-                    await quarantine_user(message.author,
-                                          f"Riesgo crítico: {risk_score}/100")
+                    queue_quarantine(message.author,
+                                     f"Riesgo crítico: {risk_score}/100")
 
-            except discord.Forbidden:
-                await send_alert(
+            queue_delete(
+                message,
+                on_success=on_deleted,
+                on_forbidden=lambda: queue_alert(
                     message.guild,
                     f"⚠️ **Mensaje sospechoso detectado (no pude eliminarlo)**\n**Usuario**: {message.author.mention}\n**Razones**: {', '.join(analysis['reason'])}\n**Riesgo**: {risk_score}/100",
                     message.author,
-                    priority="normal")
+                    priority="normal"))
 
-        elif config.get(
-                'link_filter',
-                True) and analysis['risk_level'] > 25:  # Umbral más alto
+        elif config.link_filter and analysis[
+                'risk_level'] > 25:  # Umbral más alto
             # Solo eliminar si hay alta confianza de que es malicioso
             malicious_indicators = [
-                'dominio malicioso', 'scam_words', 'suspicious_domains'
+                'dominio malicioso', 'scam_words', 'suspicious_domains',
+                'Regla personalizada'
             ]
             has_high_confidence = any(indicator in ' '.join(analysis['reason'])
                                       for indicator in malicious_indicators)
 
             if has_high_confidence:
-                try:
-                    await message.delete()
-                    await send_alert(
-                        message.guild,
-                        f"🗑️ **Mensaje con contenido malicioso eliminado**\n**Usuario**: {message.author.mention}\n**Razones**: {', '.join(analysis['reason'])}",
-                        message.author,
-                        priority="normal")
-                except discord.Forbidden:
-                    pass
+                queue_delete(message,
+                             on_success=lambda _: queue_alert(
+                                 message.guild,
+                                 f"🗑️ **Mensaje con contenido malicioso eliminado**\n**Usuario**: {message.author.mention}\n**Razones**: {', '.join(analysis['reason'])}",
+                                 message.author,
+                                 priority="normal"))
             else:
                 # Solo alertar sin eliminar para contenido dudoso
                 if analysis['risk_level'] > 20:
-                    await send_alert(
+                    queue_alert(
                         message.guild,
                         f"⚠️ **Contenido potencialmente sospechoso detectado**\n**Usuario**: {message.author.mention}\n**Razones**: {', '.join(analysis['reason'])}\n**Nivel**: {analysis['risk_level']}",
                         message.author,
                         priority="low")
 
-    await bot.process_commands(message)
-
 
 # Comandos de configuración mejorados
 @bot.tree.command(name="configurar",
@@ -1405,6 +5051,7 @@ async def configurar(interaction: discord.Interaction):
         `/auto_ban <on/off>` - Auto-ban de usuarios sospechosos
         `/limite_menciones <número>` - Límite de menciones por mensaje
         `/umbral_riesgo <número>` - Umbral de riesgo (0-100)
+        `/concurrencia_eventos <número>` - Eventos procesados a la vez
         """,
                     inline=False)
 
@@ -1414,6 +5061,13 @@ async def configurar(interaction: discord.Interaction):
         `/deteccion_raids <on/off>` - Detección de patrones de raid
         `/filtro_links <on/off>` - Filtro de enlaces maliciosos
         `/cuarentena_rol <rol>` - Rol de cuarentena
+        `/usuario_confianza <usuario>` - Excluir/incluir usuario del análisis
+        `/canal_ignorado <canal>` - Excluir/incluir canal del análisis
+        `/regla_frase <frase>` - Añadir/quitar frase prohibida
+        `/regla_dominio <dominio>` - Añadir/quitar dominio permitido
+        `/regla_regex <patrón>` - Añadir/quitar expresión regular prohibida
+        `/reglas` - Ver las reglas personalizadas
+        `/adjunto_malicioso <id>` - Marcar adjuntos de un mensaje como maliciosos
         """,
                     inline=False)
 
@@ -1421,7 +5075,9 @@ async def configurar(interaction: discord.Interaction):
                     value="""
         `/estado` - Ver configuración actual
         `/estadisticas` - Estadísticas de seguridad
+        `/actividad [horas]` - Actividad por minuto y comparación con lo habitual
         `/lista_riesgo` - Usuarios de alto riesgo
+        `/rendimiento` - Métricas internas de rendimiento
         `/ban_manual <usuario>` - Ban manual del servidor
         `/lista_bans_globales` - Ver bans globales activos
         
@@ -1447,9 +5103,7 @@ async def umbral_riesgo(interaction: discord.Interaction, umbral: int):
             "❌ El umbral debe estar entre 0 y 100", ephemeral=True)
         return
 
-    config = get_server_config(interaction.guild.id)
-    config['risk_threshold'] = umbral
-    save_config()
+    update_server_config(interaction.guild.id, risk_threshold=umbral)
 
     await interaction.response.send_message(
         f"✅ Umbral de riesgo configurado: {umbral}/100", ephemeral=True)
@@ -1470,9 +5124,9 @@ async def deteccion_avanzada(interaction: discord.Interaction, estado: str):
             "❌ Usa: on/off o activar/desactivar", ephemeral=True)
         return
 
-    config = get_server_config(interaction.guild.id)
-    config['advanced_detection'] = estado.lower() in ['on', 'activar']
-    save_config()
+    config = update_server_config(
+        interaction.guild.id,
+        advanced_detection=estado.lower() in ['on', 'activar'])
 
     status = "activada" if config['advanced_detection'] else "desactivada"
     await interaction.response.send_message(f"✅ Detección avanzada {status}",
@@ -1489,9 +5143,7 @@ async def cuarentena_rol(interaction: discord.Interaction, rol: discord.Role):
             ephemeral=True)
         return
 
-    config = get_server_config(interaction.guild.id)
-    config['quarantine_role'] = rol.id
-    save_config()
+    update_server_config(interaction.guild.id, quarantine_role=rol.id)
 
     await interaction.response.send_message(
         f"✅ Rol de cuarentena configurado: {rol.mention}", ephemeral=True)
@@ -1506,15 +5158,11 @@ async def estadisticas(interaction: discord.Interaction):
             ephemeral=True)
         return
 
-    # Calcular estadísticas
-    total_users = len(user_activity)
-    high_risk_users = sum(1 for activity in user_activity.values()
-                          if activity.get('risk_score', 0) > 50)
-    suspicious_messages = sum(
-        len([
-            msg for msg in activity['messages']
-            if msg.get('suspicious', False)
-        ]) for activity in user_activity.values())
+    # Estadísticas mantenidas de forma incremental para este servidor
+    board_stats = guild_risk_boards[interaction.guild.id].stats()
+    total_users = board_stats['monitored_users']
+    high_risk_users = board_stats['high_risk_users']
+    suspicious_messages = board_stats['suspicious_messages']
 
     embed = discord.Embed(title="📊 Estadísticas de Seguridad",
                           color=discord.Color.green())
@@ -1541,6 +5189,80 @@ async def estadisticas(interaction: discord.Interaction):
     await interaction.response.send_message(embed=embed, ephemeral=True)
 
 
+TIMESERIES_LABELS = {
+    'messages': '💬 Mensajes',
+    'joins': '📥 Uniones',
+    'suspicious': '⚠️ Mensajes sospechosos',
+    'deletes': '🗑️ Mensajes eliminados',
+    'bans': '🔨 Bans',
+    'quarantines': '🔒 Cuarentenas'
+}
+SPARKLINE_CHARS = '▁▂▃▄▅▆▇█'
+
+
+def sparkline(values, bins=24):
+    """Resumir una serie en una línea de bloques Unicode"""
+    sums = np.array([chunk.sum() for chunk in np.array_split(values, bins)],
+                    dtype=np.float64)
+    peak = sums.max()
+    if peak == 0:
+        return SPARKLINE_CHARS[0] * bins
+    levels = np.ceil(sums / peak * (len(SPARKLINE_CHARS) - 1)).astype(int)
+    return ''.join(SPARKLINE_CHARS[level] for level in levels)
+
+
+@bot.tree.command(
+    name="actividad",
+    description="Ver la actividad por minuto del servidor (hasta 7 días)")
+async def actividad(interaction: discord.Interaction, horas: int = 24):
+    if not has_admin_permissions(interaction.user):
+        await interaction.response.send_message(
+            "❌ Solo usuarios con permisos de administrador pueden usar este comando.",
+            ephemeral=True)
+        return
+
+    if horas < 1 or horas > TIMESERIES_MINUTES // 60:
+        await interaction.response.send_message(
+            f"❌ Las horas deben estar entre 1 y {TIMESERIES_MINUTES // 60}",
+            ephemeral=True)
+        return
+
+    series = activity_series[interaction.guild.id]
+    minutes = horas * 60
+    recorded = series.history_minutes()
+
+    embed = discord.Embed(
+        title=f"📈 Actividad de las últimas {horas} h",
+        description=f"Historial disponible: {recorded // 60} h {recorded % 60} min",
+        color=discord.Color.blue())
+
+    for metric in TIMESERIES_METRICS:
+        values = series.window(metric, minutes)
+        total = int(values.sum())
+        peak = int(values.max()) if total else 0
+        embed.add_field(
+            name=TIMESERIES_LABELS[metric],
+            value=
+            f"`{sparkline(values)}`\nTotal: {total} | {total / horas:.1f}/h | Pico: {peak}/min",
+            inline=False)
+
+    baselines = []
+    for metric in ('messages', 'joins'):
+        baseline = series.baseline(metric)
+        if baseline:
+            marker = " 🚨" if baseline['anomalous'] else ""
+            baselines.append(
+                f"{TIMESERIES_LABELS[metric]}: {baseline['recent']} en {BASELINE_WINDOW} min (habitual {baseline['mean']:.1f} ± {baseline['std']:.1f}){marker}"
+            )
+    embed.add_field(
+        name="📏 Frente a lo habitual",
+        value='\n'.join(baselines) or
+        f"Se necesitan al menos {BASELINE_MIN_HISTORY // 60} h de historial",
+        inline=False)
+
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+
 @bot.tree.command(name="lista_riesgo",
                   description="Ver lista de usuarios con alto riesgo")
 async def lista_riesgo(interaction: discord.Interaction):
@@ -1551,14 +5273,12 @@ async def lista_riesgo(interaction: discord.Interaction):
         return
 
     high_risk_users = []
-    for user_id, activity in user_activity.items():
-        risk_score = activity.get('risk_score', 0)
-        if risk_score > 50:
-            try:
-                user = await bot.fetch_user(user_id)
-                high_risk_users.append((user, risk_score))
-            except:
-                continue
+    for user_id, risk_score in guild_risk_boards[interaction.guild.id].top(10):
+        try:
+            user = bot.get_user(user_id) or await bot.fetch_user(user_id)
+            high_risk_users.append((user, risk_score))
+        except:
+            continue
 
     if not high_risk_users:
         await interaction.response.send_message(
@@ -1570,9 +5290,7 @@ async def lista_riesgo(interaction: discord.Interaction):
         description="Usuarios con puntuación de riesgo > 50:",
         color=discord.Color.orange())
 
-    for user, risk_score in sorted(high_risk_users,
-                                   key=lambda x: x[1],
-                                   reverse=True)[:10]:
+    for user, risk_score in high_risk_users:
         embed.add_field(name=f"{user.name} ({user.id})",
                         value=f"Riesgo: {risk_score}/100",
                         inline=False)
@@ -1580,6 +5298,95 @@ async def lista_riesgo(interaction: discord.Interaction):
     await interaction.response.send_message(embed=embed, ephemeral=True)
 
 
+@bot.tree.command(name="rendimiento",
+                  description="Ver métricas internas de rendimiento")
+async def rendimiento(interaction: discord.Interaction):
+    if not has_admin_permissions(interaction.user):
+        await interaction.response.send_message(
+            "❌ Solo usuarios con permisos de administrador pueden usar este comando.",
+            ephemeral=True)
+        return
+
+    embed = discord.Embed(title="⚙️ Métricas de Rendimiento",
+                          color=discord.Color.blue())
+
+    cache_stats = risk_score_cache.stats()
+    embed.add_field(
+        name="🧮 Caché de riesgo",
+        value=
+        f"Tasa de aciertos: {cache_stats['hit_rate']:.1%}\nAciertos: {cache_stats['hits']} | Fallos: {cache_stats['misses']}\nExpiraciones: {cache_stats['expirations']} | Invalidaciones: {cache_stats['invalidations']}\nDescartados por tamaño: {cache_stats['evictions']} | Usuarios en caché: {cache_stats['cached_users']}",
+        inline=False)
+
+    fractions = message_pipeline_stats.fractions()
+    counts = message_pipeline_stats.counts
+    embed.add_field(
+        name="📨 Pipeline de mensajes",
+        value=
+        f"Omitidos (confianza/canal): {counts['bypass']} ({fractions['bypass']:.1%})\nRuta mínima: {counts['minimal']} ({fractions['minimal']:.1%})\nVeredicto en caché: {counts['cached']} ({fractions['cached']:.1%})\nOmitidos por carga: {counts['shed']} ({fractions['shed']:.1%})\nAnálisis completo: {counts['full']} ({fractions['full']:.1%})",
+        inline=False)
+
+    event_metrics = event_scheduler.metrics()
+    busiest = "\n".join(
+        f"`{guild['guild_id']}`: {guild['messages']} mensajes, {guild['joins']} uniones, {guild['running']} en curso (máx. {guild['max_depth']}, descartados {guild['dropped']})"
+        for guild in event_metrics['guilds']) or "Sin actividad"
+    embed.add_field(
+        name="🗂️ Colas por servidor",
+        value=
+        f"Servidores con eventos pendientes: {event_metrics['active_guilds']}\nEventos en cola: {event_metrics['depth']} | Mensajes descartados: {event_metrics['dropped']}\n{busiest}",
+        inline=False)
+
+    expiry_metrics = activity_expiry.metrics()
+    embed.add_field(
+        name="⏳ Caducidad de actividad",
+        value=
+        f"Usuarios seguidos: {len(user_activity)} | En la rueda: {expiry_metrics['scheduled_users']}\nEventos caducados: {expiry_metrics['expired_events']} | Usuarios liberados: {expiry_metrics['removed_users']}",
+        inline=False)
+
+    load_metrics = load_shedder.metrics()
+    embed.add_field(
+        name="🫀 Carga del bucle",
+        value=
+        f"Nivel: {load_metrics['level']} ({load_metrics['level_name']})\nRetraso: {load_metrics['lag_ms']:.0f} ms (máx. {load_metrics['max_lag_ms']:.0f} ms) | Cambios: {load_metrics['shifts']}\nAlertas omitidas: {load_metrics['alerts']} | Análisis reducidos: {load_metrics['reduced']} | Mensajes muestreados: {load_metrics['sampled']}",
+        inline=False)
+
+    attachment_metrics = attachment_scanner.metrics()
+    embed.add_field(
+        name="🖼️ Huellas de adjuntos",
+        value=
+        f"Huellas conocidas: {attachment_metrics['indexed']} | Coincidencias: {attachment_metrics['matches']}\nDescargados: {attachment_metrics['fetched']} | Desde caché: {attachment_metrics['cache_hits']} | En caché: {attachment_metrics['cached']}\nPendientes: {attachment_metrics['pending']} | Descartados: {attachment_metrics['dropped']} | Demasiado grandes: {attachment_metrics['too_large']} | Errores: {attachment_metrics['errors']}",
+        inline=False)
+
+    verdict_stats = verdict_cache.stats()
+    embed.add_field(
+        name="🧾 Caché de veredictos",
+        value=
+        f"Tasa de aciertos: {verdict_stats['hit_rate']:.1%}\nAciertos: {verdict_stats['hits']} | Fallos: {verdict_stats['misses']}\nEntradas: {verdict_stats['size']} | Desalojos: {verdict_stats['evictions']}",
+        inline=False)
+
+    queue_metrics = moderation_queue.metrics()
+    embed.add_field(
+        name="📬 Cola de moderación",
+        value=
+        f"Pendientes: {queue_metrics['depth']} (máx. {queue_metrics['max_depth']})\nProcesadas: {queue_metrics['processed']} | Espera media: {queue_metrics['avg_wait_ms']:.0f} ms\nDuplicadas: {queue_metrics['duplicates']} | Rechazadas: {queue_metrics['rejected']}\nSin permisos: {queue_metrics['forbidden']} | Errores: {queue_metrics['failed']}",
+        inline=False)
+
+    dm_metrics = dm_queue.metrics()
+    embed.add_field(
+        name="✉️ Cola de DMs",
+        value=
+        f"Pendientes: {dm_metrics['depth']} | Enviados: {dm_metrics['sent']}\nDuplicados descartados: {dm_metrics['duplicates']}\nDMs cerrados: {dm_metrics['closed_users']} usuarios ({dm_metrics['skipped_closed']} omitidos)\nLímites de tasa: {dm_metrics['rate_limited']} | Errores: {dm_metrics['failed']}",
+        inline=False)
+
+    rest_metrics = rest_scheduler.metrics()
+    embed.add_field(
+        name="🌐 Presupuesto REST",
+        value=
+        f"Respuestas observadas: {rest_metrics['observed']} | Rutas con límite: {rest_metrics['tracked_routes']}\nRespuestas 429: {rest_metrics['rate_limited']} (globales: {rest_metrics['global_limited']})\nEsperas protectoras: {rest_metrics['protective_waits']} | Cosméticas pospuestas: {rest_metrics['deferred']}",
+        inline=False)
+
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+
 # Comandos existentes actualizados
 @bot.tree.command(name="canal_alertas",
                   description="Configurar canal de alertas de seguridad")
@@ -1591,9 +5398,7 @@ async def canal_alertas(interaction: discord.Interaction,
             ephemeral=True)
         return
 
-    config = get_server_config(interaction.guild.id)
-    config['alert_channel'] = canal.id
-    save_config()
+    update_server_config(interaction.guild.id, alert_channel=canal.id)
 
     await interaction.response.send_message(
         f"✅ Canal de alertas configurado: {canal.mention}", ephemeral=True)
@@ -1614,9 +5419,9 @@ async def auto_ban(interaction: discord.Interaction, estado: str):
             "❌ Usa: on/off o activar/desactivar", ephemeral=True)
         return
 
-    config = get_server_config(interaction.guild.id)
-    config['auto_ban'] = estado.lower() in ['on', 'activar']
-    save_config()
+    config = update_server_config(
+        interaction.guild.id,
+        auto_ban=estado.lower() in ['on', 'activar'])
 
     status = "activado" if config['auto_ban'] else "desactivado"
     await interaction.response.send_message(f"✅ Auto-ban {status}",
@@ -1637,14 +5442,33 @@ async def limite_menciones(interaction: discord.Interaction, limite: int):
             "❌ El límite debe estar entre 1 y 20", ephemeral=True)
         return
 
-    config = get_server_config(interaction.guild.id)
-    config['mention_limit'] = limite
-    save_config()
+    update_server_config(interaction.guild.id, mention_limit=limite)
 
     await interaction.response.send_message(
         f"✅ Límite de menciones configurado: {limite}", ephemeral=True)
 
 
+@bot.tree.command(
+    name="concurrencia_eventos",
+    description="Configurar eventos procesados a la vez en este servidor")
+async def concurrencia_eventos(interaction: discord.Interaction, limite: int):
+    if not has_admin_permissions(interaction.user):
+        await interaction.response.send_message(
+            "❌ Solo usuarios con permisos de administrador pueden usar este comando.",
+            ephemeral=True)
+        return
+
+    if limite < 1 or limite > 32:
+        await interaction.response.send_message(
+            "❌ El límite debe estar entre 1 y 32", ephemeral=True)
+        return
+
+    update_server_config(interaction.guild.id, event_concurrency=limite)
+
+    await interaction.response.send_message(
+        f"✅ Eventos simultáneos por servidor: {limite}", ephemeral=True)
+
+
 @bot.tree.command(
     name="filtro_links",
     description="Activar/desactivar filtro de enlaces maliciosos")
@@ -1660,9 +5484,9 @@ async def filtro_links(interaction: discord.Interaction, estado: str):
             "❌ Usa: on/off o activar/desactivar", ephemeral=True)
         return
 
-    config = get_server_config(interaction.guild.id)
-    config['link_filter'] = estado.lower() in ['on', 'activar']
-    save_config()
+    config = update_server_config(
+        interaction.guild.id,
+        link_filter=estado.lower() in ['on', 'activar'])
 
     status = "activado" if config['link_filter'] else "desactivado"
     await interaction.response.send_message(f"✅ Filtro de enlaces {status}",
@@ -1683,15 +5507,291 @@ async def deteccion_raids(interaction: discord.Interaction, estado: str):
             "❌ Usa: on/off o activar/desactivar", ephemeral=True)
         return
 
-    config = get_server_config(interaction.guild.id)
-    config['raid_detection'] = estado.lower() in ['on', 'activar']
-    save_config()
+    config = update_server_config(
+        interaction.guild.id,
+        raid_detection=estado.lower() in ['on', 'activar'])
 
     status = "activado" if config['raid_detection'] else "desactivado"
     await interaction.response.send_message(f"✅ Detección de raids {status}",
                                             ephemeral=True)
 
 
+@bot.tree.command(
+    name="usuario_confianza",
+    description="Añadir o quitar un usuario de confianza (no se analiza)")
+async def usuario_confianza(interaction: discord.Interaction,
+                            usuario: discord.Member):
+    if not has_admin_permissions(interaction.user):
+        await interaction.response.send_message(
+            "❌ Solo usuarios con permisos de administrador pueden usar este comando.",
+            ephemeral=True)
+        return
+
+    config = get_server_config(interaction.guild.id)
+    trusted_users = list(config.get('trusted_users', []))
+
+    if usuario.id in trusted_users:
+        trusted_users.remove(usuario.id)
+        action = "eliminado de"
+    else:
+        trusted_users.append(usuario.id)
+        action = "añadido a"
+
+    update_server_config(interaction.guild.id, trusted_users=trusted_users)
+
+    await interaction.response.send_message(
+        f"✅ {usuario.mention} {action} la lista de usuarios de confianza",
+        ephemeral=True)
+
+
+@bot.tree.command(
+    name="canal_ignorado",
+    description="Añadir o quitar un canal excluido del análisis")
+async def canal_ignorado(interaction: discord.Interaction,
+                         canal: discord.TextChannel):
+    if not has_admin_permissions(interaction.user):
+        await interaction.response.send_message(
+            "❌ Solo usuarios con permisos de administrador pueden usar este comando.",
+            ephemeral=True)
+        return
+
+    config = get_server_config(interaction.guild.id)
+    whitelist_channels = list(config.get('whitelist_channels', []))
+
+    if canal.id in whitelist_channels:
+        whitelist_channels.remove(canal.id)
+        action = "eliminado de"
+    else:
+        whitelist_channels.append(canal.id)
+        action = "añadido a"
+
+    update_server_config(interaction.guild.id,
+                         whitelist_channels=whitelist_channels)
+
+    await interaction.response.send_message(
+        f"✅ {canal.mention} {action} la lista de canales ignorados",
+        ephemeral=True)
+
+
+def toggle_custom_rule(guild_id, key, value, limit=CUSTOM_RULES_MAX):
+    """Añadir o quitar una regla personalizada y subir la versión de las reglas"""
+    config = get_server_config(guild_id)
+    rules = list(config.get(key, []))
+
+    if value in rules:
+        rules.remove(value)
+        added = False
+    elif len(rules) >= limit:
+        return None
+    else:
+        rules.append(value)
+        added = True
+
+    update_server_config(guild_id,
+                         rules_version=config.get('rules_version', 0) + 1,
+                         **{key: rules})
+    return added
+
+
+async def respond_rule_toggle(interaction, added, label,
+                              limit=CUSTOM_RULES_MAX):
+    """Responder al cambio de una regla personalizada"""
+    if added is None:
+        await interaction.response.send_message(
+            f"❌ Máximo {limit} reglas de este tipo por servidor",
+            ephemeral=True)
+        return
+
+    action = "añadida a" if added else "eliminada de"
+    await interaction.response.send_message(
+        f"✅ {label} {action} las reglas personalizadas", ephemeral=True)
+
+
+@bot.tree.command(
+    name="regla_frase",
+    description="Añadir o quitar una frase prohibida en este servidor")
+async def regla_frase(interaction: discord.Interaction, frase: str):
+    if not has_admin_permissions(interaction.user):
+        await interaction.response.send_message(
+            "❌ Solo usuarios con permisos de administrador pueden usar este comando.",
+            ephemeral=True)
+        return
+
+    phrase = normalize_rule_text(frase)
+    if len(phrase) < 3 or len(phrase) > CUSTOM_RULE_MAX_LENGTH:
+        await interaction.response.send_message(
+            f"❌ La frase debe tener entre 3 y {CUSTOM_RULE_MAX_LENGTH} caracteres",
+            ephemeral=True)
+        return
+
+    added = toggle_custom_rule(interaction.guild.id, 'custom_phrases', phrase)
+    await respond_rule_toggle(interaction, added, f"Frase `{phrase}`")
+
+
+@bot.tree.command(
+    name="regla_dominio",
+    description="Añadir o quitar un dominio permitido en este servidor")
+async def regla_dominio(interaction: discord.Interaction, dominio: str):
+    if not has_admin_permissions(interaction.user):
+        await interaction.response.send_message(
+            "❌ Solo usuarios con permisos de administrador pueden usar este comando.",
+            ephemeral=True)
+        return
+
+    domain = normalize_rule_domain(dominio)
+    if '.' not in domain or len(domain) > CUSTOM_RULE_MAX_LENGTH:
+        await interaction.response.send_message(
+            "❌ Dominio no válido (ejemplo: `ejemplo.com`)", ephemeral=True)
+        return
+
+    if any(domain == bad or domain.endswith(f'.{bad}')
+           for bad in MALICIOUS_DOMAINS):
+        await interaction.response.send_message(
+            "❌ No se puede permitir un dominio malicioso conocido",
+            ephemeral=True)
+        return
+
+    added = toggle_custom_rule(interaction.guild.id, 'allowed_domains',
+                               domain)
+    await respond_rule_toggle(interaction, added, f"Dominio `{domain}`")
+
+
+@bot.tree.command(
+    name="regla_regex",
+    description="Añadir o quitar una regex prohibida (el texto se analiza en minúsculas)")
+async def regla_regex(interaction: discord.Interaction, patron: str):
+    if not has_admin_permissions(interaction.user):
+        await interaction.response.send_message(
+            "❌ Solo usuarios con permisos de administrador pueden usar este comando.",
+            ephemeral=True)
+        return
+
+    # Validar la regex: se ejecuta en cada mensaje dentro de la regex combinada
+    config = get_compiled_config(interaction.guild.id)
+    if patron not in config.custom_regexes:
+        error = regex_rule_error(patron)
+        if error:
+            await interaction.response.send_message(
+                f"❌ La expresión regular {error}", ephemeral=True)
+            return
+
+    added = toggle_custom_rule(interaction.guild.id, 'custom_regexes', patron,
+                               CUSTOM_REGEX_MAX)
+    await respond_rule_toggle(interaction, added, f"Regex `{patron}`",
+                              CUSTOM_REGEX_MAX)
+
+
+@bot.tree.command(
+    name="adjunto_malicioso",
+    description="Marcar los adjuntos de un mensaje de este canal como maliciosos")
+async def adjunto_malicioso(interaction: discord.Interaction, mensaje_id: str):
+    if not has_admin_permissions(interaction.user):
+        await interaction.response.send_message(
+            "❌ Solo usuarios con permisos de administrador pueden usar este comando.",
+            ephemeral=True)
+        return
+
+    await interaction.response.defer(ephemeral=True)
+
+    try:
+        message = await interaction.channel.fetch_message(int(mensaje_id))
+    except (ValueError, discord.NotFound):
+        await interaction.followup.send(
+            "❌ No encontré ese mensaje en este canal", ephemeral=True)
+        return
+    except discord.HTTPException as e:
+        await interaction.followup.send(f"❌ Error leyendo el mensaje: {e}",
+                                        ephemeral=True)
+        return
+
+    if not message.attachments:
+        await interaction.followup.send("❌ Ese mensaje no tiene adjuntos",
+                                        ephemeral=True)
+        return
+
+    attachment_scanner.start()
+    added = 0
+    skipped = []
+    for attachment in message.attachments:
+        try:
+            fingerprint = await attachment_scanner.fingerprint(attachment)
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            fingerprint = None
+        if fingerprint is None:
+            skipped.append(attachment.filename)
+        elif attachment_index.add(fingerprint):
+            added += 1
+
+    if added:
+        save_config()
+
+    response = f"✅ {added} adjunto(s) añadidos a las huellas maliciosas ({len(attachment_index)} en total)"
+    if Image is None:
+        response += "\nℹ️ Sin Pillow solo se detectarán copias exactas"
+    if skipped:
+        response += f"\n⚠️ No se pudieron procesar: {', '.join(skipped)}"
+    await interaction.followup.send(response, ephemeral=True)
+
+
+@bot.tree.command(
+    name="avatar_seguro",
+    description="Quitar un avatar de la lista de avatares usados en raids")
+async def avatar_seguro(interaction: discord.Interaction, usuario_id: str):
+    if not has_admin_permissions(interaction.user):
+        await interaction.response.send_message(
+            "❌ Solo usuarios con permisos de administrador pueden usar este comando.",
+            ephemeral=True)
+        return
+
+    try:
+        user = await bot.fetch_user(int(usuario_id))
+    except (ValueError, discord.NotFound):
+        await interaction.response.send_message(
+            "❌ No encontré a ese usuario", ephemeral=True)
+        return
+
+    if user.avatar is None or not bad_avatars.remove(user.avatar.key):
+        await interaction.response.send_message(
+            f"ℹ️ El avatar de {user.name} no está en la lista", ephemeral=True)
+        return
+
+    await interaction.response.send_message(
+        f"✅ Avatar de {user.name} quitado de la lista ({len(bad_avatars)} marcados)",
+        ephemeral=True)
+
+
+@bot.tree.command(name="reglas",
+                  description="Ver las reglas personalizadas de este servidor")
+async def reglas(interaction: discord.Interaction):
+    if not has_admin_permissions(interaction.user):
+        await interaction.response.send_message(
+            "❌ Solo usuarios con permisos de administrador pueden usar este comando.",
+            ephemeral=True)
+        return
+
+    config = get_compiled_config(interaction.guild.id)
+    rules = get_rule_set(interaction.guild.id)
+
+    embed = discord.Embed(
+        title="📜 Reglas Personalizadas",
+        description=f"Versión {rules.version} · {len(rules.phrases.goto) if rules.phrases else 0} estados en el autómata · {rules.regex_timeouts} búsquedas regex cortadas por tiempo",
+        color=discord.Color.blue())
+
+    for name, values in [("🚫 Frases prohibidas", config.custom_phrases),
+                         ("✅ Dominios permitidos",
+                          sorted(config.allowed_domains)),
+                         ("🔣 Expresiones regulares", config.custom_regexes)]:
+        # Acortar cada regla para no superar el límite de un campo del embed
+        listed = '\n'.join(f"`{value[:60]}`" for value in list(values)[:15])
+        if len(values) > 15:
+            listed += f"\n... y {len(values) - 15} más"
+        embed.add_field(name=f"{name} ({len(values)})",
+                        value=listed or "Ninguna",
+                        inline=False)
+
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+
 @bot.tree.command(name="estado",
                   description="Ver configuración actual de seguridad")
 async def estado(interaction: discord.Interaction):
@@ -1754,6 +5854,14 @@ async def estado(interaction: discord.Interaction):
                     value=config.get('mention_limit', 3),
                     inline=True)
 
+    embed.add_field(name="🤝 Usuarios de Confianza",
+                    value=len(config.get('trusted_users', [])),
+                    inline=True)
+
+    embed.add_field(name="🔇 Canales Ignorados",
+                    value=len(config.get('whitelist_channels', [])),
+                    inline=True)
+
     await interaction.response.send_message(embed=embed, ephemeral=True)
 
 
@@ -1772,14 +5880,15 @@ async def ban_manual(interaction: discord.Interaction,
         # Solo ban local
         await usuario.ban(
             reason=f"Ban manual por {interaction.user.name}: {razon}")
+        record_guild_event(interaction.guild.id, 'bans')
 
         # Enviar notificación al usuario
-        await send_ban_notification(usuario,
-                                    is_global=False,
-                                    guild_name=interaction.guild.name,
-                                    reason=razon)
+        queue_ban_notification(usuario,
+                               is_global=False,
+                               guild_name=interaction.guild.name,
+                               reason=razon)
 
-        await send_alert(
+        queue_alert(
             interaction.guild,
             f"🔨 **{usuario.name}** ha sido baneado manualmente por {interaction.user.mention}\n**Razón**: {razon}",
             usuario,
@@ -1855,7 +5964,7 @@ class UnbanGlobalModal(discord.ui.Modal, title='Remover Ban Global'):
                                                         ephemeral=True)
 
                 # Enviar alerta al canal de alertas
-                await send_alert(
+                queue_alert(
                     interaction.guild,
                     f"🔓 **Ban global removido**\n**Usuario**: {user_name}\n**Removido por**: {interaction.user.mention}\n**Razón**: {self.reason.value}",
                     priority="normal")
@@ -2010,6 +6119,15 @@ async def setup(ctx):
     await ctx.send(embed=embed)
 
 
+async def run_bot(token):
+    """Ejecutar el bot y cerrar las sesiones propias al apagarse"""
+    async with bot:
+        try:
+            await bot.start(token)
+        finally:
+            await attachment_scanner.close()
+
+
 if __name__ == "__main__":
     # El token debe ser configurado como secreto en Replit
     token = os.getenv('DISCORD_BOT_TOKEN')
@@ -2024,7 +6142,10 @@ if __name__ == "__main__":
         exit(1)
 
     try:
-        bot.run(token)
+        discord.utils.setup_logging()
+        asyncio.run(run_bot(token))
+    except KeyboardInterrupt:
+        pass  # Ctrl+C: apagado normal
     except discord.LoginFailure:
         print("❌ Error: Token de Discord inválido")
     except Exception as e:
@@ -2075,9 +6196,7 @@ async def setup_server_roles(guild):
             )
 
         # Configurar automáticamente el rol de cuarentena
-        config = get_server_config(guild.id)
-        config['quarantine_role'] = quarantine_role.id
-        save_config()
+        update_server_config(guild.id, quarantine_role=quarantine_role.id)
 
     except Exception as e:
         print(f"❌ Error en setup_server_roles: {e}")
@@ -0,0 +1,55 @@
+"""Fixtures compartidas: un servidor de prueba sin configuración persistente."""
+import os
+import sys
+from collections import defaultdict
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+
+GUILD_ID = 424242
+
+
+@pytest.fixture(autouse=True)
+def isolated_config(monkeypatch, tmp_path):
+    """Ninguna prueba escribe en los ficheros del repositorio ni comparte configuración"""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(main, 'save_config', lambda: None)
+    monkeypatch.setattr(main, 'server_configs', {})
+    monkeypatch.setattr(main, 'compiled_configs', {})
+    monkeypatch.setattr(main, 'guild_rule_sets', {})
+
+
+@pytest.fixture
+def guild():
+    main.server_configs[str(GUILD_ID)] = {}
+    return SimpleNamespace(id=GUILD_ID)
+
+
+@pytest.fixture
+def activity(monkeypatch):
+    """Estado de actividad vacío; se restaura al terminar la prueba"""
+    monkeypatch.setattr(main, 'user_activity',
+                        defaultdict(main.new_user_activity))
+    monkeypatch.setattr(main, 'guild_risk_boards',
+                        defaultdict(main.GuildRiskBoard))
+    monkeypatch.setattr(main, 'risk_score_cache', main.RiskScoreCache())
+    monkeypatch.setattr(main, 'activity_expiry', main.ActivityExpiryWheel())
+    monkeypatch.setattr(main, 'join_indexes', defaultdict(main.JoinIndex))
+    monkeypatch.setattr(main, 'activity_series',
+                        defaultdict(main.GuildTimeSeries))
+    monkeypatch.setattr(main, 'join_wave_analyzers',
+                        defaultdict(main.JoinWaveAnalyzer))
+    return main.user_activity
+
+
+def make_message(guild, content, reply=False):
+    return SimpleNamespace(content=content,
+                           mentions=[],
+                           role_mentions=[],
+                           reference=object() if reply else None,
+                           attachments=[],
+                           guild=guild)
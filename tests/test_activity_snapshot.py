@@ -0,0 +1,93 @@
+"""Instantánea de actividad: ida y vuelta completa y retención al restaurar."""
+import asyncio
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+import main
+from conftest import GUILD_ID
+
+
+def reset_state(monkeypatch):
+    monkeypatch.setattr(main, 'user_activity',
+                        defaultdict(main.new_user_activity))
+    monkeypatch.setattr(main, 'activity_expiry', main.ActivityExpiryWheel())
+    monkeypatch.setattr(main, 'reputation_index', main.ReputationIndex())
+    monkeypatch.setattr(main, 'activity_series',
+                        defaultdict(main.GuildTimeSeries))
+
+
+def populate(now):
+    main.record_message_activity(1, {
+        'content': 'hola ñandú',
+        'timestamp': now - timedelta(minutes=5),
+        'channel': 10,
+        'guild': GUILD_ID,
+        'suspicious': True
+    })
+    main.record_message_activity(1, {
+        'content': 'sin servidor',
+        'timestamp': now - timedelta(minutes=1),
+        'channel': 11,
+        'guild': None,
+        'suspicious': False
+    })
+    main.record_message_activity(2, {
+        'content': 'muy antiguo',
+        'timestamp': now - timedelta(hours=30),
+        'channel': 10,
+        'guild': GUILD_ID,
+        'suspicious': False
+    })
+    main.record_join_activity(2, now - timedelta(minutes=3))
+    activity = main.user_activity[1]
+    activity['warnings'] = 2
+    activity['risk_score'] = 40
+    activity['last_activity'] = now
+    activity['account_age'] = now - timedelta(days=3)
+    activity['message_patterns']['hola'] += 3
+    activity['suspicious_actions'].append({
+        'type': 'suspicious_message',
+        'timestamp': now - timedelta(minutes=5),
+        'details': ['Enlace sospechoso']
+    })
+    main.reputation_index.record(1, 'bans')
+    main.activity_series[GUILD_ID].record('messages', 4)
+
+
+def test_snapshot_round_trip(monkeypatch, tmp_path, activity):
+    now = datetime.utcnow()
+    reset_state(monkeypatch)
+    populate(now)
+    path = tmp_path / 'activity_snapshot.bin'
+    assert asyncio.run(main.save_activity_snapshot(path)) > 0
+
+    reset_state(monkeypatch)
+    assert main.load_activity_snapshot(path, now) == 2
+
+    restored = main.user_activity[1]
+    assert [msg['content'] for msg in restored['messages']] == [
+        'hola ñandú', 'sin servidor'
+    ]
+    assert restored['messages'][0]['guild'] == GUILD_ID
+    assert restored['messages'][0]['suspicious']
+    assert restored['messages'][1]['guild'] is None
+    assert restored['warnings'] == 2
+    assert restored['risk_score'] == 40
+    assert restored['account_age'] == now - timedelta(days=3)
+    assert restored['message_patterns'] == {'hola': 3}
+    assert restored['suspicious_actions'][0]['details'] == ['Enlace sospechoso']
+    assert main.reputation_index.get(1)['bans'] > 0
+    assert main.activity_series[GUILD_ID].window('messages', 5).sum() == 4
+
+    # El mensaje de hace 30 h no vuelve; la unión reciente sí
+    assert not main.user_activity[2]['messages']
+    assert len(main.user_activity[2]['joins']) == 1
+    assert {1, 2} <= set(main.activity_expiry.scheduled)
+
+
+def test_missing_or_unreadable_snapshot_is_ignored(tmp_path):
+    assert main.load_activity_snapshot(tmp_path / 'no_existe.bin') == 0
+
+    path = tmp_path / 'roto.bin'
+    path.write_bytes(b'EXBIN1P' + b'\x00' * 16)
+    assert main.load_activity_snapshot(path) == 0
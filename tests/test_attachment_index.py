@@ -0,0 +1,87 @@
+"""Búsqueda de adjuntos maliciosos exacta y por bandas de dHash."""
+import io
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+
+
+def flip_bits(dhash, bits):
+    for bit in bits:
+        dhash ^= 1 << bit
+    return dhash
+
+
+def fingerprint(sha256, dhash):
+    return {'sha256': sha256, 'dhash': dhash}
+
+
+def test_exact_match_by_sha256():
+    index = main.AttachmentIndex()
+    assert index.add(fingerprint('a' * 64, None))
+    assert not index.add(fingerprint('a' * 64, None))
+    assert index.match(fingerprint('a' * 64, None))
+    assert index.match(fingerprint('b' * 64, None)) is None
+
+
+@pytest.mark.parametrize('distance', range(main.DHASH_MAX_DISTANCE + 1))
+def test_near_duplicates_share_a_band(distance):
+    rng = random.Random(distance)
+    known = rng.getrandbits(64)
+    index = main.AttachmentIndex()
+    index.add(fingerprint('a' * 64, known))
+
+    # Bits cambiados al azar: alguna banda queda intacta
+    bits = rng.sample(range(64), distance)
+    reason = index.match(fingerprint('b' * 64, flip_bits(known, bits)))
+    assert reason == f"Imagen casi idéntica a una maliciosa conocida (distancia {distance})"
+
+
+def test_one_change_per_band_still_matches():
+    known = random.Random(1).getrandbits(64)
+    index = main.AttachmentIndex()
+    index.add(fingerprint('a' * 64, known))
+
+    # Seis bandas alteradas: las dos restantes deben encontrar la huella
+    bits = [8 * band for band in range(main.DHASH_MAX_DISTANCE)]
+    assert index.match(fingerprint('b' * 64, flip_bits(known, bits)))
+
+
+def test_distant_hashes_do_not_match():
+    known = random.Random(2).getrandbits(64)
+    index = main.AttachmentIndex()
+    index.add(fingerprint('a' * 64, known))
+
+    bits = [8 * band + 1 for band in range(main.DHASH_BANDS)]
+    assert index.match(fingerprint('b' * 64, flip_bits(known, bits))) is None
+    assert index.match(fingerprint('b' * 64, ~known & (2**64 - 1))) is None
+
+
+def test_load_rebuilds_bands():
+    known = random.Random(3).getrandbits(64)
+    index = main.AttachmentIndex()
+    index.add(fingerprint('a' * 64, known))
+
+    restored = main.AttachmentIndex()
+    restored.load(index.to_data())
+    assert len(restored) == 1
+    assert restored.match(fingerprint('b' * 64, flip_bits(known, [0, 20])))
+
+
+def test_reencoded_image_matches():
+    Image = pytest.importorskip('PIL.Image')
+    image = Image.linear_gradient('L').resize((256, 256)).rotate(30)
+
+    original = io.BytesIO()
+    image.save(original, 'PNG')
+    copy = io.BytesIO()
+    image.resize((200, 200)).save(copy, 'JPEG', quality=70)
+
+    index = main.AttachmentIndex()
+    index.add(main.fingerprint_attachment_bytes(original.getvalue()))
+    assert index.match(main.fingerprint_attachment_bytes(copy.getvalue()))
@@ -0,0 +1,124 @@
+"""Descarga de adjuntos contra un servidor aiohttp de prueba."""
+import asyncio
+from collections import Counter
+from types import SimpleNamespace
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+import main
+
+MAX_BYTES = 100 * 1024
+CHUNK = b'x' * 16 * 1024
+
+
+class FakeCdn:
+    """CDN de prueba: un fichero pequeño, uno grande y un flujo sin fin"""
+
+    def __init__(self):
+        self.requests = Counter()
+        self.streamed = 0
+        app = web.Application()
+        app.router.add_get('/small.bin', self.small)
+        app.router.add_get('/large.bin', self.large)
+        app.router.add_get('/endless.bin', self.endless)
+        self.server = TestServer(app)
+
+    async def small(self, request):
+        self.requests[request.path] += 1
+        return web.Response(body=b'hola' * 100)
+
+    async def large(self, request):
+        self.requests[request.path] += 1
+        return web.Response(body=b'x' * (MAX_BYTES + 1))
+
+    async def endless(self, request):
+        # Sin Content-Length: solo el corte durante la lectura lo detiene
+        self.requests[request.path] += 1
+        response = web.StreamResponse()
+        await response.prepare(request)
+        while True:
+            await response.write(CHUNK)
+            self.streamed += len(CHUNK)
+            await asyncio.sleep(0)
+
+
+def attachment(cdn, path, size=400):
+    return SimpleNamespace(url=str(cdn.server.make_url(path)),
+                           size=size,
+                           filename=path.lstrip('/'))
+
+
+def run(scenario):
+
+    async def main_task():
+        cdn = FakeCdn()
+        await cdn.server.start_server()
+        scanner = main.AttachmentScanner(main.AttachmentIndex(),
+                                         max_bytes=MAX_BYTES)
+        scanner.start()
+        try:
+            return await asyncio.wait_for(scenario(cdn, scanner), 10)
+        finally:
+            await scanner.close()
+            assert scanner.session.closed
+            assert not scanner.workers
+            await cdn.server.close()
+
+    return asyncio.run(main_task())
+
+
+def test_fetch_returns_small_files():
+
+    async def scenario(cdn, scanner):
+        return await scanner.fetch(attachment(cdn, '/small.bin').url)
+
+    assert run(scenario) == b'hola' * 100
+
+
+def test_declared_length_over_the_limit_is_rejected():
+
+    async def scenario(cdn, scanner):
+        with pytest.raises(ValueError):
+            await scanner.fetch(attachment(cdn, '/large.bin').url)
+
+    run(scenario)
+
+
+def test_stream_is_cut_off_at_the_limit():
+
+    async def scenario(cdn, scanner):
+        fingerprint = await scanner.fingerprint(attachment(cdn, '/endless.bin'))
+        return fingerprint, scanner.stats['too_large'], cdn.streamed
+
+    fingerprint, too_large, streamed = run(scenario)
+    assert fingerprint is None
+    assert too_large == 1
+    assert streamed < 10 * MAX_BYTES
+
+
+def test_declared_size_skips_the_download():
+
+    async def scenario(cdn, scanner):
+        item = attachment(cdn, '/small.bin', size=MAX_BYTES + 1)
+        return await scanner.fingerprint(item), cdn.requests['/small.bin']
+
+    assert run(scenario) == (None, 0)
+
+
+def test_signed_urls_share_the_cache():
+
+    async def scenario(cdn, scanner):
+        item = attachment(cdn, '/small.bin')
+        first = await scanner.fingerprint(
+            SimpleNamespace(**{**vars(item), 'url': item.url + '?ex=1&hm=a'}))
+        second = await scanner.fingerprint(
+            SimpleNamespace(**{**vars(item), 'url': item.url + '?ex=2&hm=b'}))
+        return first, second, cdn.requests['/small.bin'], scanner.stats
+
+    first, second, requests, stats = run(scenario)
+    assert first == second
+    assert requests == 1
+    assert stats['fetched'] == 1
+    assert stats['cache_hits'] == 1
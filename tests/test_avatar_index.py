@@ -0,0 +1,70 @@
+"""Avatares compartidos por oleadas de uniones y lista global de avatares malos."""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+
+NOW = 1_750_000_000.0
+
+
+def test_same_avatar_joiners_are_grouped():
+    index = main.AvatarIndex()
+    assert index.record('abc', 1, NOW) == []
+    assert index.record('abc', 2, NOW + 1) == [1]
+    assert index.record('def', 3, NOW + 2) == []
+    assert index.record('abc', 4, NOW + 3) == [1, 2]
+
+
+def test_joiners_expire_and_rejoins_are_not_duplicated():
+    index = main.AvatarIndex(window=60)
+    index.record('abc', 1, NOW)
+    index.record('abc', 2, NOW + 30)
+    assert index.record('abc', 2, NOW + 40) == [1]
+
+    # La primera unión de 2 caduca, pero su nueva unión sigue en la ventana
+    assert index.record('abc', 3, NOW + 80) == [2]
+    assert 1 not in index.joiners['abc']
+
+
+def test_claimed_members_are_not_flagged_twice():
+    index = main.AvatarIndex()
+    for member_id in (1, 2, 3):
+        index.record('abc', member_id, NOW)
+    assert index.claim_unflagged([1, 2]) == [1, 2]
+    assert index.claim_unflagged([1, 2, 3]) == [3]
+
+
+def test_bad_avatar_needs_several_guilds():
+    bad = main.BadAvatarIndex(min_guilds=2, ttl=100)
+    bad.record('abc', 1, NOW)
+    assert not bad.is_bad('abc', NOW)
+    bad.record('abc', 1, NOW + 1)
+    assert not bad.is_bad('abc', NOW + 1)
+
+    bad.record('abc', 2, NOW + 2)
+    assert bad.is_bad('abc', NOW + 2)
+    assert not bad.is_bad('abc', NOW + 101)
+
+
+def test_bad_avatars_expire_and_persist():
+    bad = main.BadAvatarIndex(min_guilds=2, ttl=100)
+    bad.record('abc', 1, NOW)
+    bad.record('abc', 2, NOW + 50)
+    bad.record('old', 3, NOW)
+
+    restored = main.BadAvatarIndex(min_guilds=2, ttl=100)
+    restored.load(bad.to_data())
+    assert restored.entries == bad.entries
+
+    restored.expire(NOW + 120)
+    assert restored.entries == {'abc': {2: NOW + 50}}
+    assert restored.remove('abc')
+    assert not restored.remove('abc')
+
+
+def test_legacy_avatar_list_is_ignored():
+    bad = main.BadAvatarIndex()
+    bad.load(['abc', 'def'])
+    assert bad.entries == {}
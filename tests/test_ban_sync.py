@@ -0,0 +1,107 @@
+"""Sincronización en bloque de los bans globales con cursor reanudable."""
+import asyncio
+import json
+from types import SimpleNamespace
+
+import discord
+import pytest
+
+import main
+from conftest import GUILD_ID
+
+
+@pytest.fixture(autouse=True)
+def environment(monkeypatch, activity):
+    monkeypatch.setattr(main, 'rest_scheduler', main.RestBudgetScheduler())
+    monkeypatch.setattr(main, 'global_bans', set())
+    alerts = []
+    monkeypatch.setattr(main, 'queue_alert',
+                        lambda guild, message, priority="normal": alerts.append(message))
+    return alerts
+
+
+def http_error(error_class, status):
+    response = SimpleNamespace(status=status, reason='error', headers={})
+    return error_class(response, {'code': 0, 'message': 'error'})
+
+
+class FakeGuild:
+    """Servidor con bans existentes y bulk_ban que puede fallar en una llamada"""
+
+    def __init__(self, existing=(), can_ban=True, failures=None):
+        self.id = GUILD_ID
+        self.name = 'prueba'
+        self.me = SimpleNamespace(guild_permissions=SimpleNamespace(
+            ban_members=can_ban))
+        self.existing = list(existing)
+        self.failures = failures or {}
+        self.calls = []
+
+    async def bans(self, limit=None):
+        for user_id in self.existing:
+            yield SimpleNamespace(user=SimpleNamespace(id=user_id))
+
+    async def bulk_ban(self, users, reason=None):
+        self.calls.append([user.id for user in users])
+        error = self.failures.pop(len(self.calls), None)
+        if error:
+            raise error
+        banned = [user for user in users if user.id % 10]
+        failed = [user for user in users if not user.id % 10]
+        return SimpleNamespace(banned=banned, failed=failed)
+
+
+def test_only_missing_bans_are_applied_in_chunks(monkeypatch, environment):
+    monkeypatch.setattr(main, 'BAN_SYNC_CHUNK', 3)
+    main.global_bans.update(range(1, 11))
+    guild = FakeGuild(existing=[2, 4])
+    sync = main.GlobalBanSync()
+
+    asyncio.run(sync.sync(guild))
+    assert guild.calls == [[1, 3, 5], [6, 7, 8], [9, 10]]
+    assert main.activity_series[GUILD_ID].window('bans', 1) == 7
+    assert 'Aplicados**: 7\n**Fallidos**: 1' in environment[-1]
+    assert sync.state == {}
+
+
+def test_rate_limit_keeps_the_cursor_and_resumes(monkeypatch):
+    monkeypatch.setattr(main, 'BAN_SYNC_CHUNK', 2)
+    main.global_bans.update(range(1, 7))
+    guild = FakeGuild(failures={2: http_error(discord.HTTPException, 429)})
+    sync = main.GlobalBanSync()
+
+    asyncio.run(sync.sync(guild))
+    with open(main.BAN_SYNC_FILE) as f:
+        saved = json.load(f)
+    assert saved[str(GUILD_ID)]['cursor'] == 2
+
+    # Tras reiniciar se continúa desde el cursor guardado
+    restarted = main.GlobalBanSync()
+    restarted.load_state()
+    guild.calls.clear()
+    asyncio.run(restarted.sync(guild))
+    assert guild.calls == [[3, 4], [5, 6]]
+    assert restarted.state == {}
+
+
+def test_client_errors_count_the_chunk_as_failed(monkeypatch, environment):
+    monkeypatch.setattr(main, 'BAN_SYNC_CHUNK', 2)
+    main.global_bans.update(range(1, 5))
+    guild = FakeGuild(failures={1: http_error(discord.HTTPException, 400)})
+
+    asyncio.run(main.GlobalBanSync().sync(guild))
+    assert guild.calls == [[1, 2], [3, 4]]
+    assert 'Aplicados**: 2\n**Fallidos**: 2' in environment[-1]
+
+
+@pytest.mark.parametrize('fake_guild', [
+    FakeGuild(can_ban=False),
+    FakeGuild(failures={1: http_error(discord.Forbidden, 403)})
+])
+def test_missing_permissions_abandon_the_sync(fake_guild):
+    main.global_bans.update(range(1, 5))
+    sync = main.GlobalBanSync()
+
+    asyncio.run(sync.sync(fake_guild))
+    assert len(fake_guild.calls) <= 1
+    assert sync.state == {}
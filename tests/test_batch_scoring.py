@@ -0,0 +1,93 @@
+"""La puntuación por lotes debe coincidir con analyze_message_content."""
+import os
+import random
+import sys
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+from conftest import GUILD_ID, make_message  # noqa: E402
+
+VOCABULARY = [
+    'hola', 'que', 'tal', 'buy gold', 'promo123', 'https://bit.ly/x',
+    'https://shop.example.com/a', 'https://evil.net', 'free nitro',
+    'discord.gg/abc', 'wallet', 'precio', '!!!!!!!!!!', 'ẕ̴a̸l̶g̷o', '@everyone',
+    '\n\n\n', '\u200bhola', 'grabify.link', 'steamcommunity.ru/x',
+    'give it away', 'análisis', 'ＦＲＥＥ', 'youtube.com', 'aaaaaaaaaaaaaa'
+]
+MEMBER_NAMES = [
+    'raidking', 'juan', 'maria_22', '1234567890', 'aaaaaaa', 'SpamBot',
+    'nukebot', 'abcdefghijk', 'qwertyuiopas', '١٢٣٤٥', 'ＡＢＣ123456789', 'zz'
+]
+
+
+def random_messages(guild, count=500, seed=7):
+    rng = random.Random(seed)
+    return [
+        make_message(guild,
+                     ' '.join(rng.choice(VOCABULARY)
+                              for _ in range(rng.randint(1, 10))),
+                     reply=rng.random() < 0.3) for _ in range(count)
+    ]
+
+
+def assert_same_scores(messages):
+    batch = main.score_messages_batch(messages)
+    for i, message in enumerate(messages):
+        analysis = main.analyze_message_content(message)
+        assert batch['risk_level'][i] == analysis['risk_level'], message.content
+        assert batch['suspicious'][i] == analysis['suspicious'], message.content
+
+
+def test_batch_matches_single_path_without_rules(guild):
+    assert_same_scores(random_messages(guild))
+
+
+def test_batch_matches_single_path_with_custom_rules(guild):
+    main.update_server_config(GUILD_ID,
+                              custom_phrases=['buy gold'],
+                              custom_regexes=[r'promo\d+'],
+                              allowed_domains=['bit.ly', 'example.com'],
+                              rules_version=1)
+
+    message = make_message(guild, 'hey buy gold now please')
+    batch = main.score_messages_batch([message])
+    assert batch['risk_level'][0] == main.CUSTOM_RULE_WEIGHT
+    assert batch['suspicious'][0]
+
+    assert_same_scores(random_messages(guild))
+
+
+def test_blank_lines_are_not_repeated_characters(guild):
+    message = make_message(guild, 'hola\n\n\n\n\n\n\n\n\n\n\n\nque tal')
+    assert main.extract_text_features(message.content)['longest_run'] == 1
+    assert main.analyze_message_content(message)['risk_level'] == 0
+    assert_same_scores([message])
+
+
+def test_member_batch_matches_is_suspicious_user():
+    rng = random.Random(5)
+    now = datetime.now(timezone.utc).timestamp()
+    members = []
+    for _ in range(2000):
+        created_ms = int((now - rng.randint(0, 200 * 3600)) * 1000)
+        members.append(
+            SimpleNamespace(
+                id=((created_ms - main.DISCORD_EPOCH_MS) << 22) +
+                rng.randrange(1 << 22),
+                name=rng.choice(MEMBER_NAMES),
+                display_name=rng.choice(MEMBER_NAMES + [None]),
+                avatar=None if rng.random() < 0.5 else object(),
+                created_at=datetime.fromtimestamp(created_ms / 1000,
+                                                  timezone.utc),
+                bot=False))
+
+    batch = main.score_members_batch(members, now=now)
+    for i, member in enumerate(members):
+        suspicious, _, global_ban = main.is_suspicious_user(member)
+        assert batch['suspicious'][i] == suspicious, member.name
+        assert batch['requires_global_ban'][i] == global_ban, member.name
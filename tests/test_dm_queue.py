@@ -0,0 +1,87 @@
+"""Cola de DMs: deduplicación, usuarios con DMs cerrados y reintentos."""
+import asyncio
+from types import SimpleNamespace
+
+import discord
+import pytest
+
+import main
+
+
+@pytest.fixture(autouse=True)
+def scheduler(monkeypatch):
+    monkeypatch.setattr(main, 'rest_scheduler', main.RestBudgetScheduler())
+
+
+def http_error(error_class, status, code=0, headers=None):
+    response = SimpleNamespace(status=status, reason='error',
+                               headers=headers or {})
+    return error_class(response, {'code': code, 'message': 'error'})
+
+
+def make_user(user_id=1, failures=(), mutual_guilds=('guild', )):
+    """Usuario cuyo canal de DM lanza `failures` en orden y luego envía"""
+    failures = list(failures)
+    sent = []
+
+    async def send(embed):
+        if failures:
+            raise failures.pop(0)
+        sent.append(embed)
+
+    return SimpleNamespace(id=user_id,
+                           dm_channel=SimpleNamespace(id=99, send=send),
+                           mutual_guilds=list(mutual_guilds),
+                           sent=sent)
+
+
+def test_duplicate_notifications_are_dropped():
+    queue = main.DirectMessageQueue()
+    user = make_user()
+    assert queue.submit(user, 'embed', key=(1, False, 'a'))
+    assert not queue.submit(user, 'embed', key=(1, False, 'a'))
+    assert queue.submit(user, 'embed', key=(1, False, 'b'))
+    assert queue.stats['duplicates'] == 1
+
+
+def test_rate_limited_send_is_retried():
+    queue = main.DirectMessageQueue()
+    user = make_user(failures=[
+        http_error(discord.HTTPException, 429, headers={'Retry-After': '0.01'})
+    ])
+    asyncio.run(queue.deliver(user, 'embed'))
+
+    assert user.sent == ['embed']
+    assert queue.stats['rate_limited'] == 1
+    assert queue.stats['sent'] == 1
+
+
+def test_closed_dms_are_remembered_while_sharing_a_guild():
+    queue = main.DirectMessageQueue()
+    user = make_user(failures=[
+        http_error(discord.Forbidden, 403, main.DM_CANNOT_MESSAGE_USER)
+    ])
+    asyncio.run(queue.deliver(user, 'embed'))
+
+    assert queue.stats['closed'] == 1
+    assert not queue.submit(user, 'otro', key=(1, True, None))
+    assert queue.stats['skipped_closed'] == 1
+
+
+def test_rejection_after_a_ban_is_not_remembered():
+    queue = main.DirectMessageQueue()
+    user = make_user(failures=[
+        http_error(discord.Forbidden, 403, main.DM_CANNOT_MESSAGE_USER)
+    ], mutual_guilds=())
+    asyncio.run(queue.deliver(user, 'embed'))
+
+    assert user.id not in queue.closed_dms
+    assert queue.submit(user, 'otro', key=(1, True, None))
+
+
+def test_client_errors_are_not_retried():
+    queue = main.DirectMessageQueue()
+    user = make_user(failures=[http_error(discord.HTTPException, 400)])
+    with pytest.raises(discord.HTTPException):
+        asyncio.run(queue.deliver(user, 'embed'))
+    assert queue.stats['sent'] == 0
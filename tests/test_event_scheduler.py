@@ -0,0 +1,82 @@
+"""Reparto de eventos entre servidores y referencias a las tareas en curso."""
+import asyncio
+
+import main
+
+FLOODED_GUILD = 1
+QUIET_GUILD = 2
+
+
+def run(scenario):
+
+    async def main_task():
+        scheduler = main.GuildEventScheduler()
+        scheduler.start()
+        try:
+            return await asyncio.wait_for(scenario(scheduler), 10)
+        finally:
+            scheduler.task.cancel()
+
+    return asyncio.run(main_task())
+
+
+def test_running_handlers_are_referenced_until_done():
+
+    async def scenario(scheduler):
+        release = asyncio.Event()
+
+        async def handler(_):
+            await release.wait()
+
+        for i in range(10):
+            scheduler.submit_message(FLOODED_GUILD, handler, i)
+        await asyncio.sleep(0.01)
+        running = len(scheduler.handlers)
+
+        release.set()
+        while scheduler.queues[FLOODED_GUILD].processed < 10:
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0)
+        return running, len(scheduler.handlers)
+
+    running, left = run(scenario)
+    assert running == main.get_compiled_config(FLOODED_GUILD).event_concurrency
+    assert left == 0
+
+
+def test_flooded_guild_does_not_delay_others():
+
+    async def scenario(scheduler):
+        done = []
+
+        async def handler(payload):
+            await asyncio.sleep(0)
+            done.append(payload)
+
+        for i in range(100):
+            scheduler.submit_message(FLOODED_GUILD, handler, (FLOODED_GUILD, i))
+        for i in range(4):
+            scheduler.submit_join(QUIET_GUILD, handler, (QUIET_GUILD, i))
+
+        while len(done) < 104:
+            await asyncio.sleep(0.01)
+        return done
+
+    done = run(scenario)
+    quiet = [index for index, (guild_id, _) in enumerate(done)
+             if guild_id == QUIET_GUILD]
+    assert max(quiet) < 20
+
+
+def test_message_backlog_keeps_the_newest():
+
+    async def handler(_):
+        pass
+
+    scheduler = main.GuildEventScheduler()
+    for i in range(main.EVENT_MESSAGE_CAPACITY + 5):
+        scheduler.submit_message(FLOODED_GUILD, handler, i)
+
+    queue = scheduler.queues[FLOODED_GUILD]
+    assert queue.dropped == 5
+    assert queue.messages[0][1] == 5
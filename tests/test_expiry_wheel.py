@@ -0,0 +1,99 @@
+"""Caducidad de la actividad con la rueda de tiempo."""
+import os
+import sys
+from datetime import datetime, timedelta
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+from conftest import GUILD_ID  # noqa: E402
+
+START = datetime(2025, 6, 1, 12, 0)
+
+
+def message(moment):
+    return {
+        'content': 'hola',
+        'timestamp': moment,
+        'channel': 1,
+        'guild': GUILD_ID,
+        'suspicious': False
+    }
+
+
+def test_each_user_is_scheduled_once(activity):
+    for minute in range(10):
+        main.record_message_activity(1, message(START + timedelta(minutes=minute)))
+    main.record_join_activity(1, START + timedelta(minutes=20))
+
+    wheel = main.activity_expiry
+    assert wheel.scheduled == {1: wheel.minute_of(START + main.ACTIVITY_RETENTION)}
+    assert sum(len(slot) for slot in wheel.slots) == 1
+
+
+def test_advance_expires_old_events_and_reschedules(activity):
+    main.record_message_activity(1, message(START))
+    main.record_message_activity(1, message(START + timedelta(hours=2)))
+    main.record_join_activity(1, START + timedelta(hours=3))
+
+    wheel = main.activity_expiry
+    wheel.advance(START + timedelta(hours=23))
+    assert len(activity[1]['messages']) == 2
+
+    wheel.advance(START + main.ACTIVITY_RETENTION + timedelta(minutes=1))
+    assert len(activity[1]['messages']) == 1
+    assert wheel.scheduled[1] == wheel.minute_of(
+        START + timedelta(hours=2) + main.ACTIVITY_RETENTION)
+
+    wheel.advance(START + timedelta(hours=30))
+    assert 1 not in activity
+    assert wheel.metrics() == {
+        'scheduled_users': 0,
+        'expired_events': 3,
+        'removed_users': 1
+    }
+
+
+def test_users_with_warnings_are_kept(activity):
+    main.record_message_activity(1, message(START))
+    activity[1]['warnings'] = 1
+
+    main.activity_expiry.advance(START + timedelta(hours=25))
+    assert not activity[1]['messages']
+    assert activity[1]['warnings'] == 1
+    assert main.activity_expiry.metrics()['removed_users'] == 0
+
+
+def test_long_pause_still_expires_everything(activity):
+    for user_id in range(50):
+        main.record_message_activity(
+            user_id, message(START + timedelta(minutes=user_id * 17)))
+
+    # Más de una vuelta completa de la rueda sin avanzar
+    main.activity_expiry.advance(START + timedelta(days=5))
+    assert not activity
+    assert not main.activity_expiry.scheduled
+
+
+def test_late_schedules_are_not_lost(activity):
+    wheel = main.activity_expiry
+    wheel.advance(START)
+
+    # Un evento que ya debería haber caducado se revisa en el minuto siguiente
+    main.record_message_activity(1, message(START - timedelta(hours=30)))
+    wheel.schedule_many([2], [wheel.minute_of(START) - 100])
+    assert wheel.scheduled == {1: wheel.minute_of(START) + 1,
+                               2: wheel.minute_of(START) + 1}
+
+    wheel.advance(START + timedelta(minutes=1))
+    assert 1 not in activity
+    assert not wheel.scheduled
+
+
+def test_vectorized_minutes_match():
+    wheel = main.ActivityExpiryWheel()
+    moments = [START + timedelta(seconds=seconds) for seconds in (0, 59, 60, 3601)]
+    expected = [wheel.minute_of(moment) for moment in moments]
+    assert main.expiry_minutes(np.array(moments, dtype='datetime64[us]')) == expected
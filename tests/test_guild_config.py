@@ -0,0 +1,46 @@
+"""Configuración compilada: inmutable, cacheada y recompilada al cambiar."""
+import dataclasses
+
+import pytest
+
+import main
+from conftest import GUILD_ID
+
+
+def test_config_is_compiled_once(guild):
+    config = main.get_compiled_config(GUILD_ID)
+    assert main.get_compiled_config(GUILD_ID) is config
+    with pytest.raises(dataclasses.FrozenInstanceError):
+        config.auto_ban = False
+
+
+def test_defaults_for_a_new_guild():
+    config = main.get_compiled_config(GUILD_ID)
+    assert str(GUILD_ID) in main.server_configs
+    assert config.risk_threshold == 75
+    assert config.whitelist_channels == frozenset()
+    assert config.spam_5min_threshold == 20
+    assert config.mass_mention_threshold == 6
+
+
+def test_update_recompiles_and_normalizes_ids(guild):
+    before = main.get_compiled_config(GUILD_ID)
+    main.update_server_config(GUILD_ID,
+                              whitelist_channels=['10', 11],
+                              trusted_users=['20'],
+                              max_messages_per_minute=4,
+                              mention_limit=5)
+
+    config = main.get_compiled_config(GUILD_ID)
+    assert config is not before
+    assert config.whitelist_channels == frozenset({10, 11})
+    assert 20 in config.trusted_users
+    assert config.spam_5min_threshold == 8
+    assert config.spam_15min_threshold == 12
+    assert config.mass_mention_threshold == 10
+
+
+def test_update_drops_cached_risk_scores(guild, activity):
+    main.calculate_risk_score(1, GUILD_ID)
+    main.update_server_config(GUILD_ID, risk_threshold=60)
+    assert not main.risk_score_cache.entries
@@ -0,0 +1,54 @@
+"""Índice de uniones por segundo con totales acumulados."""
+import time
+
+import main
+
+NOW = 1_750_000_000
+
+
+def test_counts_joins_per_window():
+    index = main.JoinIndex()
+    for offset in (0, 0, 30, 100, 400):
+        index.record(NOW + offset)
+
+    end = NOW + 400
+    assert index.joins_in_last(10, end) == 1
+    # La ventana es (end - segundos, end]: el segundo inicial queda fuera
+    assert index.joins_in_last(300, end) == 1
+    assert index.joins_in_last(301, end) == 2
+    assert index.joins_in_last(400, end) == 3
+    assert index.joins_in_last(900, end) == 5
+
+
+def test_time_passing_without_joins():
+    index = main.JoinIndex()
+    for _ in range(5):
+        index.record(NOW)
+
+    assert index.joins_in_last(10, NOW + 5) == 5
+    assert index.joins_in_last(10, NOW + 11) == 0
+
+
+def test_history_beyond_the_span_is_forgotten():
+    index = main.JoinIndex(span=60)
+    index.record(NOW)
+    index.record(NOW + 200)
+
+    # Las ventanas mayores que el anillo se recortan a su tamaño
+    assert index.joins_in_last(900, NOW + 200) == 1
+
+
+def test_clock_going_back_counts_in_the_last_second():
+    index = main.JoinIndex()
+    index.record(NOW + 10)
+    index.record(NOW)
+    assert index.joins_in_last(1, NOW + 10) == 2
+
+
+def test_raid_burst_indicator(activity):
+    now = time.time()
+    for _ in range(main.JOIN_BURST_MIN):
+        main.join_indexes[1].record(now)
+
+    assert main.detect_raid_pattern(1)['join_burst']
+    assert not main.detect_raid_pattern(2)['join_burst']
@@ -0,0 +1,72 @@
+"""Oleadas de uniones de cuentas creadas casi a la vez."""
+import time
+
+import main
+
+NOW = 1_750_000_000.0
+
+
+def snowflake(created_at):
+    """Snowflake cuyo timestamp de creación es `created_at` (segundos UNIX)"""
+    return (int(created_at * 1000) - main.DISCORD_EPOCH_MS) << 22
+
+
+def test_snowflake_round_trip():
+    assert main.snowflake_to_timestamp(snowflake(NOW - 3600)) == NOW - 3600
+
+
+def test_accounts_created_together_form_a_wave():
+    analyzer = main.JoinWaveAnalyzer()
+    created = NOW - 86400
+    for i in range(main.JOIN_WAVE_MIN_CLUSTER):
+        result = analyzer.record_join(snowflake(created + i * 60), NOW + i)
+
+    assert result['wave_detected']
+    assert result['cluster_size'] == main.JOIN_WAVE_MIN_CLUSTER
+    assert result['confidence_boost'] == 20
+
+
+def test_spread_out_accounts_are_not_a_wave():
+    analyzer = main.JoinWaveAnalyzer()
+    for i in range(20):
+        result = analyzer.record_join(snowflake(NOW - 86400 * (i + 1)), NOW + i)
+
+    assert not result['wave_detected']
+    assert result['cluster_size'] == 1
+    assert result['recent_joins'] == 20
+
+
+def test_old_joins_leave_the_window():
+    analyzer = main.JoinWaveAnalyzer()
+    for i in range(main.JOIN_WAVE_MIN_CLUSTER):
+        analyzer.record_join(snowflake(NOW - 86400 + i), NOW)
+
+    later = analyzer.analyze(NOW + main.JOIN_WAVE_WINDOW + 1)
+    assert later['recent_joins'] == 0
+    assert not later['wave_detected']
+
+
+def test_ring_keeps_only_the_latest_joins():
+    analyzer = main.JoinWaveAnalyzer(capacity=8)
+    for i in range(20):
+        result = analyzer.record_join(snowflake(NOW - 86400), NOW + i * 0.1)
+
+    assert result['recent_joins'] == 8
+    assert result['confidence_boost'] == 32
+
+
+def test_alert_once_per_wave():
+    analyzer = main.JoinWaveAnalyzer()
+    assert analyzer.should_alert(NOW)
+    assert not analyzer.should_alert(NOW + 10)
+    assert analyzer.should_alert(NOW + main.JOIN_WAVE_WINDOW + 1)
+
+
+def test_wave_raises_the_raid_indicator(activity):
+    now = time.time()
+    analyzer = main.join_wave_analyzers[1]
+    for i in range(main.JOIN_WAVE_MIN_CLUSTER):
+        analyzer.record_join(snowflake(now - 86400 + i), now)
+
+    assert main.detect_raid_pattern(1)['creation_time_cluster']
+    assert not main.detect_raid_pattern(2)['creation_time_cluster']
@@ -0,0 +1,74 @@
+"""Niveles de carga según el retraso del bucle y trabajo que se omite en cada uno."""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+
+
+def test_lag_raises_the_level_immediately():
+    shedder = main.LoadShedder()
+    shedder.observe(0.05)
+    assert shedder.level == 0
+
+    shedder.observe(0.3)
+    assert shedder.level == 2
+    shedder.observe(0.6)
+    assert shedder.level == 3
+    assert shedder.shifts == 2
+    assert shedder.metrics()['max_lag_ms'] == 600
+
+
+def test_recovery_is_one_level_after_calm_samples():
+    shedder = main.LoadShedder()
+    shedder.observe(0.6)
+
+    for _ in range(main.LAG_RECOVERY_SAMPLES - 1):
+        shedder.observe(0.0)
+    assert shedder.level == 3
+    shedder.observe(0.0)
+    assert shedder.level == 2
+
+    # Una muestra con retraso reinicia la cuenta
+    for _ in range(main.LAG_RECOVERY_SAMPLES - 1):
+        shedder.observe(0.0)
+    shedder.observe(0.2)
+    for _ in range(main.LAG_RECOVERY_SAMPLES - 1):
+        shedder.observe(0.0)
+    assert shedder.level == 2
+
+
+def test_lag_near_the_threshold_does_not_recover():
+    shedder = main.LoadShedder()
+    shedder.observe(0.2)
+    for _ in range(main.LAG_RECOVERY_SAMPLES * 2):
+        shedder.observe(main.LAG_LEVELS[0] * 0.9)
+    assert shedder.level == 1
+
+
+def test_each_level_sheds_more_work():
+    shedder = main.LoadShedder()
+    assert shedder.allow_alert('low') and shedder.extended_checks()
+
+    shedder.level = 1
+    assert not shedder.allow_alert('low')
+    assert shedder.allow_alert('high')
+    assert shedder.extended_checks()
+
+    shedder.level = 2
+    assert not shedder.extended_checks()
+    assert shedder.shed == {'alerts': 1, 'reduced': 1, 'sampled': 0}
+
+
+def test_low_risk_users_are_sampled_at_the_top_level(activity):
+    shedder = main.LoadShedder()
+    assert not shedder.should_skip_analysis(1)
+
+    shedder.level = 3
+    activity[2]['risk_score'] = main.SHED_LOW_RISK_SCORE
+    assert not any(shedder.should_skip_analysis(2) for _ in range(20))
+
+    skipped = [shedder.should_skip_analysis(1) for _ in range(20)]
+    assert skipped.count(False) == 20 // main.SHED_SAMPLE_RATE
+    assert shedder.shed['sampled'] == skipped.count(True)
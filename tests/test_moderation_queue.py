@@ -0,0 +1,108 @@
+"""Cola de moderación: prioridades, duplicados y seguimiento de resultados."""
+import asyncio
+from types import SimpleNamespace
+
+import discord
+
+import main
+
+
+def run(scenario, workers=1, maxsize=100):
+
+    async def main_task():
+        queue = main.ModerationQueue(workers=workers, maxsize=maxsize)
+        try:
+            return await asyncio.wait_for(scenario(queue), 10)
+        finally:
+            for worker in queue.workers:
+                worker.cancel()
+
+    return asyncio.run(main_task())
+
+
+def recorder(log, name, result=None):
+
+    async def action():
+        log.append(name)
+        return result
+
+    return action
+
+
+def test_bans_jump_ahead_of_queued_alerts():
+
+    async def scenario(queue):
+        log = []
+        queue.submit('alert', (1, 'a'), recorder(log, 'alert'), None)
+        queue.submit('quarantine', (1, 2), recorder(log, 'quarantine'), None)
+        queue.submit('delete', (1, 3), recorder(log, 'delete'), None)
+        queue.submit('ban', (1, 4), recorder(log, 'ban'), None)
+        queue.start()
+        await queue.queue.join()
+        return log
+
+    assert run(scenario) == ['ban', 'delete', 'quarantine', 'alert']
+
+
+def test_same_priority_keeps_submission_order():
+
+    async def scenario(queue):
+        log = []
+        for user_id in range(5):
+            queue.submit('ban', (1, user_id), recorder(log, user_id), None)
+        queue.start()
+        await queue.queue.join()
+        return log
+
+    assert run(scenario) == [0, 1, 2, 3, 4]
+
+
+def test_pending_duplicates_are_dropped():
+
+    async def scenario(queue):
+        log = []
+        assert queue.submit('ban', (1, 2), recorder(log, 'first'), None)
+        assert not queue.submit('ban', (1, 2), recorder(log, 'second'), None)
+        queue.start()
+        await queue.queue.join()
+
+        # Una vez ejecutada, la misma acción se puede volver a encolar
+        assert queue.submit('ban', (1, 2), recorder(log, 'third'), None)
+        await queue.queue.join()
+        return log, queue.stats['duplicates']
+
+    assert run(scenario) == (['first', 'third'], 1)
+
+
+def test_success_and_forbidden_callbacks():
+
+    async def scenario(queue):
+        results = []
+
+        async def forbidden():
+            raise discord.Forbidden(SimpleNamespace(status=403, reason='x'),
+                                    'sin permisos')
+
+        queue.submit('delete', (1, 1), recorder([], 'ok', result='hecho'),
+                     None, on_success=results.append)
+        queue.submit('delete', (1, 2), forbidden, None,
+                     on_success=results.append,
+                     on_forbidden=lambda: results.append('forbidden'))
+        queue.start()
+        await queue.queue.join()
+        return results, queue.stats
+
+    results, stats = run(scenario)
+    assert results == ['hecho', 'forbidden']
+    assert stats['forbidden'] == 1
+    assert stats['processed'] == 2
+
+
+def test_full_queue_rejects_new_jobs():
+
+    async def scenario(queue):
+        assert queue.submit('alert', (1, 'a'), recorder([], 'a'), None)
+        assert not queue.submit('alert', (1, 'b'), recorder([], 'b'), None)
+        return queue.stats['rejected']
+
+    assert run(scenario, maxsize=1) == 1
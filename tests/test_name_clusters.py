@@ -0,0 +1,46 @@
+"""Oleadas de nombres parecidos con el índice MinHash."""
+import main
+
+NOW = 1_750_000_000.0
+
+
+def test_digit_and_homoglyph_variants_share_shingles():
+    assert main.name_shingles('raider123') == main.name_shingles('raider987')
+    assert main.name_shingles('RAIDER1') == main.name_shingles('rаider2')
+
+
+def test_similar_names_are_found():
+    index = main.NameClusterIndex()
+    assert index.record(1, ['cryptoking_01'], NOW) == []
+    assert index.record(2, ['cryptoking_02'], NOW + 1) == [1]
+    assert sorted(index.record(3, ['CryptoKing_77', 'otro'], NOW + 2)) == [1, 2]
+
+
+def test_unrelated_names_are_not_found():
+    index = main.NameClusterIndex()
+    for member_id, name in enumerate(['maria', 'juan_perez', 'helper',
+                                      'nightowl', 'zz_top']):
+        assert index.record(member_id, [name], NOW + member_id) == []
+
+
+def test_names_leave_the_window():
+    index = main.NameClusterIndex(window=60)
+    index.record(1, ['cryptoking_01'], NOW)
+    assert index.record(2, ['cryptoking_02'], NOW + 61) == []
+    assert list(index.members) == [2]
+    assert all(1 not in bucket for bucket in index.buckets.values())
+
+
+def test_rejoining_member_is_not_its_own_match():
+    index = main.NameClusterIndex()
+    index.record(1, ['cryptoking_01'], NOW)
+    assert index.record(1, ['cryptoking_01'], NOW + 1) == []
+
+
+def test_each_member_is_claimed_once():
+    index = main.NameClusterIndex()
+    for member_id in (1, 2, 3):
+        index.record(member_id, [f'cryptoking_{member_id}'], NOW)
+
+    assert index.claim_unflagged([1, 2]) == [1, 2]
+    assert index.claim_unflagged([1, 2, 3]) == [3]
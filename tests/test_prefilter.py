@@ -0,0 +1,51 @@
+"""El filtro barato solo debe aceptar mensajes que el análisis completo puntúa con 0."""
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+from conftest import make_message  # noqa: E402
+
+WORDS = [
+    'hola', 'que', 'tal', 'something', 'method', 'together', 'wallet', 'seed',
+    'btc', 'crypto', 'precio', 'give', 'away', 'free', 'nitro', 'generator',
+    'gift', 'jaja', 'ok', '!!!', '???', 'aaaaaaaa', 'aaaaaaaaa', 'LOL', 'gg',
+    'xd', 'giveaway', 'claim', 'tinyurl', 't.co', 'to', 'co', '.'
+]
+
+
+@pytest.mark.parametrize('content', ['something happened', 'my new wallet'])
+def test_crypto_words_take_the_full_path(guild, content):
+    message = make_message(guild, content)
+    assert main.analyze_message_content(message)['risk_level'] > 0
+    assert not main.is_low_risk_message(message)
+
+
+@pytest.mark.parametrize('content, expected', [('a' * 8, False),
+                                               ('a' * 9, True),
+                                               ('ab' * 9, False),
+                                               ('hola' + '!' * 9, True)])
+def test_repeated_run(content, expected):
+    assert main.has_repeated_run(content) is expected
+
+
+def test_low_risk_messages_score_zero(guild):
+    rng = random.Random(7)
+    accepted = 0
+    for _ in range(5000):
+        separator = ' ' if rng.random() < 0.7 else ''
+        content = separator.join(
+            rng.choice(WORDS) for _ in range(rng.randint(1, 12)))
+        if rng.random() < 0.2:
+            content = content.upper()
+        message = make_message(guild, content, reply=rng.random() < 0.5)
+        if main.is_low_risk_message(message):
+            accepted += 1
+            analysis = main.analyze_message_content(message)
+            assert analysis['risk_level'] == 0, content
+            assert not analysis['suspicious'], content
+    assert accepted
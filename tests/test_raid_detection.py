@@ -0,0 +1,51 @@
+"""Indicadores de raid calculados solo con la actividad del propio servidor."""
+from datetime import datetime, timedelta
+
+import main
+from conftest import GUILD_ID
+
+OTHER_GUILD_ID = GUILD_ID + 1
+
+
+def flood(guild_id, users, messages_per_user, content='hola'):
+    now = datetime.utcnow()
+    for user_id in users:
+        for i in range(messages_per_user):
+            main.record_message_activity(user_id, {
+                'content': f'{content} {i}',
+                'timestamp': now - timedelta(seconds=messages_per_user - i),
+                'channel': 1,
+                'guild': guild_id,
+                'suspicious': False
+            })
+
+
+def test_flood_is_reported_only_for_its_guild(guild, activity):
+    flood(OTHER_GUILD_ID, range(1, 11), 5)
+
+    assert main.detect_raid_pattern(OTHER_GUILD_ID)['message_flood_critical']
+    indicators = main.detect_raid_pattern(GUILD_ID)
+    assert not any(value for key, value in indicators.items()
+                   if key != 'confidence_score')
+
+
+def test_shared_users_count_only_messages_in_the_guild(guild, activity):
+    flood(OTHER_GUILD_ID, range(1, 11), 5)
+    flood(GUILD_ID, range(1, 3), 2)
+
+    assert not main.detect_raid_pattern(GUILD_ID)['message_flood_critical']
+
+
+def test_old_messages_do_not_count(guild, activity):
+    old = datetime.utcnow() - timedelta(minutes=30)
+    for user_id in range(1, 11):
+        for i in range(5):
+            main.record_message_activity(user_id, {
+                'content': f'hola {i}',
+                'timestamp': old,
+                'channel': 1,
+                'guild': GUILD_ID,
+                'suspicious': False
+            })
+
+    assert not main.detect_raid_pattern(GUILD_ID)['message_flood_moderate']
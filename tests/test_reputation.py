@@ -0,0 +1,75 @@
+"""Reputación entre servidores con decaimiento exponencial."""
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+
+NOW = 1_750_000_000.0
+DAY = 24 * 3600
+
+
+def test_counts_halve_every_half_life():
+    index = main.ReputationIndex(half_life=DAY)
+    index.record(1, 'bans', NOW)
+    index.record(1, 'flags', NOW)
+
+    reputation = index.get(1, NOW + DAY)
+    assert reputation['bans'] == pytest.approx(0.5)
+    assert reputation['flags'] == pytest.approx(0.5)
+    assert reputation['quarantines'] == 0
+    assert reputation['score'] == pytest.approx(
+        0.5 * (main.REPUTATION_WEIGHTS['bans'] + main.REPUTATION_WEIGHTS['flags']))
+    assert index.get(2, NOW) is None
+
+
+def test_new_events_add_to_the_decayed_count():
+    index = main.ReputationIndex(half_life=DAY)
+    index.record(1, 'quarantines', NOW)
+    index.record(1, 'quarantines', NOW + DAY)
+    assert index.get(1, NOW + DAY)['quarantines'] == pytest.approx(1.5)
+    assert index.get(1, NOW + 2 * DAY)['quarantines'] == pytest.approx(0.75)
+
+
+def test_prune_forgets_old_users():
+    index = main.ReputationIndex(half_life=DAY)
+    index.record(1, 'flags', NOW)
+    index.record(2, 'flags', NOW + 10 * DAY)
+    index.prune(NOW + 10 * DAY)
+    assert list(index.entries) == [2]
+
+
+def test_arrays_round_trip():
+    index = main.ReputationIndex()
+    index.record(1, 'bans', NOW)
+    index.record(2**40, 'flags', NOW + 5)
+
+    restored = main.ReputationIndex()
+    restored.load_arrays(index.to_arrays())
+    assert restored.entries == index.entries
+
+    empty = main.ReputationIndex()
+    empty.load_arrays(main.ReputationIndex().to_arrays())
+    assert empty.entries == {}
+
+
+def test_join_check_uses_recent_history(monkeypatch):
+    index = main.ReputationIndex()
+    monkeypatch.setattr(main, 'reputation_index', index)
+    member = SimpleNamespace(id=1)
+
+    index.record(1, 'flags')
+    assert main.check_reputation_on_join(member) == (None, 0)
+
+    index.record(1, 'quarantines')
+    reason, extra_risk = main.check_reputation_on_join(member)
+    assert 'cuarentenas' in reason
+    assert 0 < extra_risk <= main.REPUTATION_MAX_RISK
+
+    for _ in range(5):
+        index.record(1, 'bans')
+    assert main.check_reputation_on_join(member)[1] == main.REPUTATION_MAX_RISK
@@ -0,0 +1,143 @@
+"""Presupuesto REST frente a un servidor falso que responde con 429."""
+import asyncio
+import time
+from collections import defaultdict, deque
+
+import aiohttp
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+import main
+
+
+class FakeDiscord:
+    """Servidor que devuelve las respuestas programadas por ruta, y 200 después"""
+
+    def __init__(self):
+        self.responses = defaultdict(deque)  # path -> [(estado, cabeceras)]
+        self.default_headers = {}
+        app = web.Application()
+        app.router.add_route('*', '/{tail:.*}', self.handle)
+        self.server = TestServer(app)
+
+    async def handle(self, request):
+        scripted = self.responses[request.path]
+        status, headers = scripted.popleft() if scripted else (200, {})
+        return web.json_response({}, status=status,
+                                 headers={**self.default_headers.get(
+                                     request.path, {}), **headers})
+
+
+async def with_fake_discord(scenario):
+    fake = FakeDiscord()
+    await fake.server.start_server()
+    try:
+        async with aiohttp.ClientSession(
+                trace_configs=[main.rest_trace]) as session:
+
+            async def call(method, path, kind):
+                route = main.rest_route(method, path)
+                await main.rest_scheduler.acquire(route, kind)
+                async with session.request(method,
+                                           fake.server.make_url(path)) as response:
+                    return response.status
+
+            return await scenario(fake, call)
+    finally:
+        await fake.server.close()
+
+
+def run(monkeypatch, scenario):
+    monkeypatch.setattr(main, 'rest_scheduler', main.RestBudgetScheduler())
+    return asyncio.run(with_fake_discord(scenario))
+
+
+def test_retry_after_is_honoured(monkeypatch):
+    path = '/api/v10/channels/1/messages'
+
+    async def scenario(fake, call):
+        fake.responses[path].append((429, {'Retry-After': '0.3'}))
+        assert await call('POST', path, 'delete') == 429
+
+        start = time.monotonic()
+        assert await call('POST', path, 'delete') == 200
+        return time.monotonic() - start
+
+    assert run(monkeypatch, scenario) >= 0.25
+    assert main.rest_scheduler.stats['rate_limited'] == 1
+    assert main.rest_scheduler.stats['protective_waits'] >= 1
+
+
+def test_routes_have_separate_buckets(monkeypatch):
+    limited = '/api/v10/channels/1/messages/10'
+
+    async def scenario(fake, call):
+        fake.responses[limited].append((429, {'Retry-After': '5'}))
+        await call('DELETE', limited, 'delete')
+
+        # Otro canal no comparte el límite; otro mensaje del mismo canal sí
+        start = time.monotonic()
+        assert await call('DELETE', '/api/v10/channels/2/messages/10',
+                          'delete') == 200
+        elapsed = time.monotonic() - start
+        scheduler = main.rest_scheduler
+        same_bucket = main.rest_route('DELETE', '/channels/1/messages/11')
+        return elapsed, scheduler.delay_for(same_bucket, 'delete')
+
+    elapsed, delay = run(monkeypatch, scenario)
+    assert elapsed < 1
+    assert delay > 4
+
+
+def test_cosmetic_calls_do_not_starve_protective_ones(monkeypatch):
+    path = '/api/v10/guilds/1/members/5'
+
+    async def scenario(fake, call):
+        # Cada respuesta deja una sola petición en la ruta: la reserva protectora
+        fake.default_headers[path] = {
+            'X-RateLimit-Remaining': '1',
+            'X-RateLimit-Reset-After': '0.3'
+        }
+        await call('PUT', path, 'ban')
+
+        order = []
+
+        async def tracked(kind):
+            await call('PUT', path, kind)
+            order.append(kind)
+
+        cosmetic = asyncio.create_task(tracked('role'))
+        await asyncio.sleep(0)
+        start = time.monotonic()
+        await tracked('ban')
+        elapsed = time.monotonic() - start
+        await cosmetic
+        return order, elapsed
+
+    order, elapsed = run(monkeypatch, scenario)
+    assert order == ['ban', 'role']
+    assert elapsed < 0.2
+    assert main.rest_scheduler.stats['deferred'] >= 1
+    assert main.rest_scheduler.stats['protective_waits'] == 0
+
+
+def test_cosmetic_calls_yield_while_protective_ones_wait(monkeypatch):
+    path = '/api/v10/guilds/1/bans/5'
+
+    async def scenario(fake, call):
+        fake.responses[path].append((429, {'Retry-After': '0.3'}))
+        await call('PUT', path, 'ban')
+
+        order = []
+
+        async def tracked(kind):
+            await call('PUT', path, kind)
+            order.append(kind)
+
+        cosmetic = asyncio.create_task(tracked('role'))
+        await asyncio.sleep(0)
+        await tracked('ban')
+        await cosmetic
+        return order
+
+    assert run(monkeypatch, scenario) == ['ban', 'role']
@@ -0,0 +1,74 @@
+"""La caché de riesgo está acotada y ninguna entrada vive para siempre."""
+from datetime import datetime, timedelta
+
+import main
+from conftest import GUILD_ID
+
+
+def test_entries_without_time_windows_still_expire(activity):
+    cache = main.risk_score_cache
+    cache.get(1, GUILD_ID)  # Sin eventos: no hay límite de ventana
+
+    _, expires_at = cache.entries[1][GUILD_ID]
+    assert expires_at <= datetime.utcnow() + cache.ttl
+
+
+def test_expired_entry_is_recomputed(activity):
+    cache = main.risk_score_cache
+    cache.get(1, GUILD_ID)
+    score, _ = cache.entries[1][GUILD_ID]
+    cache.entries[1][GUILD_ID] = (score, datetime.utcnow() - timedelta(seconds=1))
+
+    cache.get(1, GUILD_ID)
+    assert cache.expirations == 1
+    assert cache.misses == 2
+
+
+def test_least_recently_used_user_is_evicted(activity):
+    cache = main.RiskScoreCache(max_users=3)
+    for user_id in (1, 2, 3):
+        cache.get(user_id, GUILD_ID)
+    cache.get(1, GUILD_ID)  # 2 pasa a ser el menos usado
+    cache.get(4, GUILD_ID)
+
+    assert list(cache.entries) == [3, 1, 4]
+    assert cache.evictions == 1
+
+
+def test_expiry_wheel_drops_cached_scores(activity):
+    old = datetime.utcnow() - main.ACTIVITY_RETENTION - timedelta(minutes=5)
+    main.record_message_activity(1, {
+        'content': 'hola',
+        'timestamp': old,
+        'channel': 1,
+        'guild': GUILD_ID,
+        'suspicious': False
+    })
+    main.calculate_risk_score(1, GUILD_ID)
+    assert 1 in main.risk_score_cache.entries
+
+    main.activity_expiry.advance()
+    assert 1 not in main.user_activity
+    assert 1 not in main.risk_score_cache.entries
+
+
+def test_scores_are_memoized_until_a_new_event(activity):
+    cache = main.risk_score_cache
+    first = main.calculate_risk_score(1, GUILD_ID)
+    assert main.calculate_risk_score(1, GUILD_ID) == first
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    now = datetime.utcnow()
+    main.user_activity[1]['suspicious_actions'].extend(
+        {'type': 'suspicious_message', 'timestamp': now, 'details': []}
+        for _ in range(3))
+    cache.invalidate_user(1)
+
+    assert main.calculate_risk_score(1, GUILD_ID) > first
+    assert cache.misses == 2
+
+
+def test_scores_are_cached_per_guild(activity):
+    main.calculate_risk_score(1, GUILD_ID)
+    main.calculate_risk_score(1, GUILD_ID + 1)
+    assert set(main.risk_score_cache.entries[1]) == {GUILD_ID, GUILD_ID + 1}
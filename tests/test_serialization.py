@@ -0,0 +1,83 @@
+"""Formato binario sin pickle y elección explícita del formato al cargar."""
+import io
+import json
+import zlib
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+import main
+
+
+@pytest.mark.parametrize('serializer', [main.BINARY_SERIALIZER,
+                                        main.STORED_BINARY_SERIALIZER])
+def test_nested_data_round_trips(serializer):
+    data = {
+        'saved_at': datetime(2026, 1, 2, 3, 4, 5, 6),
+        'times': np.arange(5).astype('datetime64[us]'),
+        'ids': np.array([1, 2, 3], dtype=np.int64),
+        'contents': ['hola', '', 'ñandú 🛡️', 'línea\nnueva'],
+        'with_nul': ['a\x00b', 'c'],
+        'details': [None, ['motivo', 'archivo.png'], 'texto'],
+        'patterns': {123: {'spam': 2}},
+        'bans': {1 << 60, 5},
+        'empty': []
+    }
+    loaded = serializer.loads(serializer.dumps(data))
+
+    assert loaded['saved_at'] == data['saved_at']
+    assert loaded['times'].dtype == data['times'].dtype
+    assert (loaded['times'] == data['times']).all()
+    assert loaded['ids'].tolist() == [1, 2, 3]
+    assert loaded['contents'] == data['contents']
+    assert loaded['with_nul'] == data['with_nul']
+    assert loaded['details'] == data['details']
+    assert loaded['patterns'] == {123: {'spam': 2}}
+    assert set(loaded['bans']) == data['bans']
+    assert loaded['empty'] == []
+
+
+def test_object_arrays_are_rejected_on_save():
+    with pytest.raises(TypeError):
+        main.BINARY_SERIALIZER.dumps({'x': np.array([{}], dtype=object)})
+
+
+def test_pickled_members_are_never_loaded():
+    buffer = io.BytesIO()
+    np.savez(buffer,
+             a0=np.array([{'evil': True}], dtype=object),
+             __layout__=np.frombuffer(json.dumps({'$array': 'a0'}).encode(),
+                                      dtype=np.uint8))
+    raw = main.BINARY_MAGIC + main.BINARY_COMPRESSED + zlib.compress(
+        buffer.getvalue())
+
+    with pytest.raises(ValueError):
+        main.BINARY_SERIALIZER.loads(raw)
+
+
+def test_legacy_formats():
+    legacy_bans = b'EXBIN1I' + np.array([7, 1 << 60], dtype='<i8').tobytes()
+    assert main.BINARY_SERIALIZER.loads(legacy_bans) == [7, 1 << 60]
+
+    with pytest.raises(ValueError):
+        main.BINARY_SERIALIZER.loads(b'EXBIN1P' + zlib.compress(b'pickle'))
+
+
+def test_files_are_read_only_in_their_declared_format(tmp_path):
+    path = tmp_path / 'security_config.json'
+    main.save_data(path, {'a': 1}, main.BINARY_SERIALIZER)
+
+    # Un archivo de configuración nunca se interpreta como binario
+    with pytest.raises(ValueError):
+        main.load_data(path)
+    assert main.load_data(path, main.BINARY_SERIALIZER) == {'a': 1}
+
+
+def test_global_bans_fall_back_to_legacy_json():
+    main.save_data(main.LEGACY_GLOBAL_BANS_FILE, [3, 4])
+    assert main.load_global_bans() == {3, 4}
+
+    main.save_data(main.GLOBAL_BANS_FILE, {5, 6},
+                   main.STORED_BINARY_SERIALIZER)
+    assert main.load_global_bans() == {5, 6}
@@ -0,0 +1,73 @@
+"""Series por minuto: memoria bajo demanda, ventanas y línea base."""
+import numpy as np
+
+import main
+
+START = 1_700_000_040  # Segundos desde 1970
+
+
+def minute(offset):
+    return START + offset * 60
+
+
+def test_rows_are_allocated_on_first_event():
+    series = main.GuildTimeSeries()
+    assert series.rows == {}
+    assert not series.window('bans', 60, now=minute(0)).any()
+
+    series.record('messages', now=minute(0))
+    assert list(series.rows) == ['messages']
+    assert series.rows['messages'].nbytes == main.TIMESERIES_MINUTES * 4
+
+
+def test_window_clears_skipped_minutes_after_wrapping():
+    series = main.GuildTimeSeries(minutes=10)
+    for offset in range(10):
+        series.record('messages', amount=offset + 1, now=minute(offset))
+
+    # Tres minutos sin eventos y uno nuevo: el buffer ha dado la vuelta
+    series.record('messages', amount=100, now=minute(13))
+    window = series.window('messages', 10, now=minute(13))
+    assert window.tolist() == [5, 6, 7, 8, 9, 10, 0, 0, 0, 100]
+
+
+def test_baseline_flags_a_burst():
+    series = main.GuildTimeSeries()
+    rng = np.random.default_rng(0)
+    for offset in range(main.BASELINE_MIN_HISTORY + 60):
+        series.record('joins', amount=int(rng.integers(0, 3)),
+                      now=minute(offset))
+    quiet = series.baseline('joins', now=minute(main.BASELINE_MIN_HISTORY + 59))
+    assert quiet and not quiet['anomalous']
+
+    now = minute(main.BASELINE_MIN_HISTORY + 60)
+    series.record('joins', amount=200, now=now)
+    burst = series.baseline('joins', now=now)
+    assert burst['anomalous']
+    assert burst['recent'] >= 200
+
+
+def test_baseline_needs_history():
+    series = main.GuildTimeSeries()
+    series.record('messages', now=minute(0))
+    assert series.baseline('messages', now=minute(10)) is None
+
+
+def test_arrays_round_trip_and_legacy_matrix():
+    series = main.GuildTimeSeries(minutes=10)
+    series.record('messages', amount=3, now=minute(0))
+    series.record('bans', amount=1, now=minute(1))
+
+    restored = main.GuildTimeSeries(minutes=10)
+    restored.load_arrays(series.to_arrays())
+    assert set(restored.rows) == {'messages', 'bans'}
+    assert restored.window('bans', 2, now=minute(1)).tolist() == [0, 1]
+
+    legacy = np.zeros((len(main.TIMESERIES_METRICS), 10), dtype=np.uint32)
+    legacy[main.TIMESERIES_METRICS.index('joins'), (START // 60 + 1) % 10] = 7
+    restored = main.GuildTimeSeries(minutes=10)
+    restored.load_arrays({'first_minute': START // 60,
+                          'last_minute': START // 60 + 1,
+                          'counts': legacy})
+    assert list(restored.rows) == ['joins']
+    assert restored.window('joins', 2, now=minute(1)).tolist() == [0, 7]
@@ -0,0 +1,63 @@
+"""Caché de veredictos por huella de contenido."""
+from types import SimpleNamespace
+
+import pytest
+
+import main
+from conftest import GUILD_ID, make_message
+
+SPAM = 'FREE NITRO discord.gg/abc giveaway https://bit.ly/x'
+
+
+@pytest.fixture(autouse=True)
+def pipeline(monkeypatch):
+    monkeypatch.setattr(main, 'verdict_cache', main.VerdictCache())
+    monkeypatch.setattr(main, 'message_pipeline_stats',
+                        main.MessagePipelineStats())
+    monkeypatch.setattr(main, 'load_shedder', main.LoadShedder())
+
+
+def spam_message(guild, content=SPAM):
+    message = make_message(guild, content)
+    message.author = SimpleNamespace(id=1)
+    return message
+
+
+def test_repeated_spam_is_served_from_the_cache(guild):
+    first = main.run_message_pipeline(spam_message(guild))
+    second = main.run_message_pipeline(spam_message(guild, SPAM.lower()))
+
+    assert first['suspicious']
+    assert second == first
+    assert main.message_pipeline_stats.counts['full'] == 1
+    assert main.message_pipeline_stats.counts['cached'] == 1
+
+
+def test_key_depends_on_mentions_and_rules(guild):
+    base = main.message_verdict_key(spam_message(guild))
+
+    mentioned = spam_message(guild)
+    mentioned.mentions = [object()] * 3
+    assert main.message_verdict_key(mentioned) != base
+
+    main.update_server_config(GUILD_ID, custom_phrases=['giveaway'],
+                              rules_version=1)
+    assert main.message_verdict_key(spam_message(guild)) != base
+
+
+def test_reduced_verdicts_are_not_cached(guild):
+    main.load_shedder.level = 2
+    main.run_message_pipeline(spam_message(guild))
+    assert not main.verdict_cache.entries
+
+
+def test_least_recently_used_verdict_is_evicted():
+    cache = main.VerdictCache(max_size=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1
+    cache.put('c', 3)
+
+    assert cache.get('b') is None
+    assert list(cache.entries) == ['a', 'c']
+    assert cache.stats()['evictions'] == 1